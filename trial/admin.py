@@ -0,0 +1,25 @@
+# admin.py
+#
+# Admin-only tools are switched on per browser session with ?admin=<ADMIN_TOKEN> in the
+# URL. Without ADMIN_TOKEN set they are off for everyone.
+
+import os
+import hmac
+import streamlit as st
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+
+def is_admin():
+    """Whether this session was opened with the admin token (remembered for the rest of the session)"""
+    if st.session_state.get('is_admin'):
+        return True
+    token = st.query_params.get("admin")
+    if ADMIN_TOKEN and token and hmac.compare_digest(token, ADMIN_TOKEN):
+        st.session_state['is_admin'] = True
+        return True
+    return False
@@ -0,0 +1,382 @@
+# answer_bank.py
+#
+# Pre-generated answers to the most frequent chat questions, per combination of the
+# standard conditions offered at registration. Answers are only served once approved.
+#
+#   python answer_bank.py --build               # mine chat_history and generate missing answers
+#   python answer_bank.py --list --status pending
+#   python answer_bank.py --approve 3 7 12      # or --reject
+#   python answer_bank.py --report              # hit rate and most used entries
+
+import os
+import io
+import json
+import time
+import logging
+import argparse
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from dotenv import load_dotenv
+from text_features import hashed_vector
+from answer_cache import normalize_question
+from llm_gateway import get_gateway, PRIORITY_BACKGROUND
+from model_router import MODEL_POOL
+from ollama_client import generate
+from metrics import increment, record_event, read_events
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# The standard conditions from the registration form, as stored in medical_info.condition_name
+STANDARD_CONDITIONS = ("diabetes", "hypertension", "asthma", "heart_disease")
+
+BANK_PATH = os.getenv("ANSWER_BANK_PATH", os.path.join(".cache", "answer_bank.npz"))
+BANK_DIM = 2 ** 12
+# Cosine similarity for a question to join a cluster, and for a live question to use a banked answer
+CLUSTER_THRESHOLD = float(os.getenv("ANSWER_BANK_CLUSTER_THRESHOLD", "0.75"))
+MATCH_THRESHOLD = float(os.getenv("ANSWER_BANK_MATCH_THRESHOLD", "0.85"))
+MIN_CLUSTER_SIZE = int(os.getenv("ANSWER_BANK_MIN_CLUSTER_SIZE", "5"))
+MAX_CLUSTERS = int(os.getenv("ANSWER_BANK_MAX_CLUSTERS", "50"))
+COMBOS_PER_CLUSTER = int(os.getenv("ANSWER_BANK_COMBOS_PER_CLUSTER", "4"))
+WINDOW_DAYS = int(os.getenv("ANSWER_BANK_WINDOW_DAYS", "90"))
+# Answers older than this are regenerated (and need approval again) on the next build
+MAX_AGE_DAYS = int(os.getenv("ANSWER_BANK_MAX_AGE_DAYS", "30"))
+REFRESH_HOURS = float(os.getenv("ANSWER_BANK_REFRESH_HOURS", "24"))
+AUTO_APPROVE = os.getenv("ANSWER_BANK_AUTO_APPROVE", "false").lower() == "true"
+
+REFUSAL_MARKERS = ("i'm sorry", "i am sorry", "as an ai", "i cannot", "i can't provide", "language model")
+
+BANK_SYSTEM_PROMPT = (
+    "Provide a detailed answer to the question, mention the steps in points. "
+    "The answer will be shown to every user with these medical conditions, so give general, "
+    "safe guidance, do not assume any personal history, and recommend consulting a doctor "
+    "for individual advice. Medical conditions: {conditions}."
+)
+
+
+def condition_combo(medical_conditions):
+    """Bank key for a user's conditions string, or None if it includes a custom condition"""
+    if not medical_conditions or medical_conditions == "None specified":
+        return ""
+    names = sorted({c.strip().lower() for c in medical_conditions.split(",") if c.strip()})
+    if not all(name in STANDARD_CONDITIONS for name in names):
+        return None
+    return "+".join(names)
+
+
+def question_vector(question):
+    return hashed_vector(normalize_question(question), dim=BANK_DIM)
+
+
+def vet_answer(answer):
+    """Automatic checks a generated answer must pass before it is offered for approval"""
+    text = (answer or "").strip()
+    if len(text.split()) < 40:
+        return False
+    if any(marker in text.lower() for marker in REFUSAL_MARKERS):
+        return False
+    # A cut-off answer usually ends mid-sentence
+    return text[-1] in ".!?)*"
+
+
+class AnswerBank:
+    """Approved answers indexed by condition combination and question vector.
+
+    The bank lives in one .npz file written atomically by the batch job; serving
+    processes reload it when the file changes.
+    """
+
+    def __init__(self, path=BANK_PATH):
+        self.path = path
+        self.entries = []
+        self.vectors = np.zeros((0, BANK_DIM), dtype=np.float32)
+        self._by_combo = {}
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            self.entries, self.vectors = [], np.zeros((0, BANK_DIM), dtype=np.float32)
+        else:
+            with np.load(self.path) as data:
+                self.entries = json.loads(bytes(data["entries"]).decode("utf-8"))
+                self.vectors = data["vectors"].astype(np.float32)
+            self._mtime = os.path.getmtime(self.path)
+        self._by_combo = {}
+        for row, entry in enumerate(self.entries):
+            if entry["status"] == "approved":
+                self._by_combo.setdefault(entry["combo"], []).append(row)
+        self._by_combo = {combo: np.array(rows) for combo, rows in self._by_combo.items()}
+        return self
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        buffer = io.BytesIO()
+        np.savez(buffer, vectors=self.vectors,
+                 entries=np.frombuffer(json.dumps(self.entries).encode("utf-8"), dtype=np.uint8))
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(buffer.getvalue())
+        os.replace(tmp_path, self.path)
+
+    def _reload_if_changed(self):
+        now = time.monotonic()
+        if now - self._checked_at < 30:
+            return
+        self._checked_at = now
+        mtime = os.path.getmtime(self.path) if os.path.exists(self.path) else None
+        if mtime != self._mtime:
+            self.load()
+
+    def match(self, question, combo):
+        """Best approved entry for the question and condition combination, with its similarity"""
+        rows = self._by_combo.get(combo)
+        if rows is None or not len(rows):
+            return None, 0.0
+        scores = self.vectors[rows] @ question_vector(question)
+        best = int(np.argmax(scores))
+        return self.entries[rows[best]], float(scores[best])
+
+    def lookup(self, question, medical_conditions):
+        """Approved answer for a frequent question, or None; every call is counted for the hit rate"""
+        combo = condition_combo(medical_conditions)
+        if combo is None:
+            return None
+        with self._lock:
+            self._reload_if_changed()
+            entry, score = self.match(question, combo)
+        hit = entry is not None and score >= MATCH_THRESHOLD
+        increment("answer_bank.hit" if hit else "answer_bank.miss")
+        record_event("answer_bank", hit=hit, combo=combo, score=round(score, 3),
+                     entry_id=entry["id"] if hit else None)
+        return entry["answer"] if hit else None
+
+
+answer_bank = AnswerBank()
+
+
+def _iter_chat_rows(db, since, batch_size=500):
+    after = None
+    while True:
+        rows = db.get_chat_history_batch(after=after, limit=batch_size, since=since)
+        if not rows:
+            return
+        yield from rows
+        if len(rows) < batch_size:
+            return
+        after = (rows[-1]["created_at"], rows[-1]["id"])
+
+
+def _user_combos(db, user_ids):
+    conditions = {user_id: [] for user_id in user_ids}
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), 100):
+        for info in db.get_medical_info_for_users(user_ids[start:start + 100]):
+            conditions.setdefault(info["user_id"], []).append(info["condition_name"])
+    return {user_id: condition_combo(", ".join(names) or "None specified") for user_id, names in conditions.items()}
+
+
+def mine_question_clusters(db, window_days=WINDOW_DAYS, threshold=CLUSTER_THRESHOLD, min_size=MIN_CLUSTER_SIZE):
+    """Greedy single-pass clustering of recent chat questions by hashed n-gram similarity.
+
+    Returns clusters of at least min_size questions, largest first, each with its most
+    common phrasing and how often each condition combination asked it.
+    """
+    since = (datetime.now(timezone.utc) - timedelta(days=window_days)).isoformat()
+    rows = list(_iter_chat_rows(db, since))
+    combos = _user_combos(db, {row["user_id"] for row in rows})
+
+    sums = np.zeros((64, BANK_DIM), dtype=np.float32)
+    norms = np.zeros(64, dtype=np.float32)
+    clusters = []
+    for row in rows:
+        vector = question_vector(row["question"])
+        if not vector.any():
+            continue
+        best = -1
+        if clusters:
+            scores = sums[:len(clusters)] @ vector / norms[:len(clusters)]
+            best = int(np.argmax(scores))
+            if scores[best] < threshold:
+                best = -1
+        if best < 0:
+            if len(clusters) == len(sums):
+                sums = np.vstack([sums, np.zeros_like(sums)])
+                norms = np.concatenate([norms, np.zeros_like(norms)])
+            best = len(clusters)
+            clusters.append({"phrasings": Counter(), "combos": Counter(), "size": 0})
+        sums[best] += vector
+        norms[best] = np.linalg.norm(sums[best])
+        cluster = clusters[best]
+        cluster["size"] += 1
+        cluster["phrasings"][row["question"].strip()] += 1
+        if combos.get(row["user_id"]) is not None:
+            cluster["combos"][combos[row["user_id"]]] += 1
+
+    frequent = []
+    for cluster in clusters:
+        if cluster["size"] >= min_size:
+            frequent.append({
+                "question": cluster["phrasings"].most_common(1)[0][0],
+                "size": cluster["size"],
+                "combos": dict(cluster["combos"]),
+            })
+    frequent.sort(key=lambda c: c["size"], reverse=True)
+    return frequent
+
+
+def generate_bank_answer(question, combo):
+    """Generate a general answer for everyone with this condition combination"""
+    conditions = combo.replace("+", ", ").replace("_", " ") if combo else "none"
+    result = get_gateway().run(
+        lambda: generate(MODEL_POOL["large"], f"Question: {question}",
+                         system=BANK_SYSTEM_PROMPT.format(conditions=conditions), temperature=0.2),
+        "system", PRIORITY_BACKGROUND
+    )
+    return result.text.strip()
+
+
+def build_answer_bank(db, bank=None, max_clusters=MAX_CLUSTERS):
+    """Mine frequent questions and generate answers for (cluster, combination) pairs not yet banked.
+
+    Existing entries are kept, along with their approval, until they are older than MAX_AGE_DAYS.
+    """
+    bank = bank or AnswerBank().load()
+    stale_before = time.time() - MAX_AGE_DAYS * 86400
+    keep = [row for row, entry in enumerate(bank.entries) if entry["created_at"] >= stale_before]
+    entries = [bank.entries[row] for row in keep]
+    vectors = [bank.vectors[row] for row in keep]
+    next_id = max((entry["id"] for entry in bank.entries), default=0) + 1
+    generated = rejected = 0
+
+    for cluster in mine_question_clusters(db)[:max_clusters]:
+        vector = question_vector(cluster["question"])
+        top_combos = sorted(cluster["combos"].items(), key=lambda c: c[1], reverse=True)[:COMBOS_PER_CLUSTER]
+        for combo, asked in top_combos:
+            covered = any(entry["combo"] == combo and float(vectors[i] @ vector) >= MATCH_THRESHOLD
+                          for i, entry in enumerate(entries))
+            if covered:
+                continue
+            try:
+                answer = generate_bank_answer(cluster["question"], combo)
+            except Exception as e:
+                logger.error(f"Error generating bank answer for '{cluster['question']}': {e}")
+                continue
+            if not vet_answer(answer):
+                rejected += 1
+                continue
+            entries.append({
+                "id": next_id,
+                "question": cluster["question"],
+                "combo": combo,
+                "answer": answer,
+                "status": "approved" if AUTO_APPROVE else "pending",
+                "model": MODEL_POOL["large"],
+                "cluster_size": cluster["size"],
+                "asked": asked,
+                "created_at": time.time(),
+            })
+            vectors.append(vector)
+            next_id += 1
+            generated += 1
+
+    bank.entries = entries
+    bank.vectors = np.array(vectors, dtype=np.float32).reshape(len(vectors), BANK_DIM)
+    bank.save()
+    bank.load()
+    logger.info(f"Answer bank built: {len(entries)} entries, {generated} new, {rejected} failed vetting")
+    return {"entries": len(entries), "generated": generated, "rejected": rejected}
+
+
+def set_status(ids, status, bank=None):
+    """Approve or reject entries by id"""
+    bank = bank or AnswerBank().load()
+    ids = set(ids)
+    for entry in bank.entries:
+        if entry["id"] in ids:
+            entry["status"] = status
+    bank.save()
+    return bank.load()
+
+
+def answer_bank_report():
+    """Hit rate from the lookup log, overall and for the most used entries"""
+    events = list(read_events("answer_bank"))
+    hits = Counter(event["entry_id"] for event in events if event.get("hit"))
+    total = len(events)
+    return {
+        "lookups": total,
+        "hits": sum(hits.values()),
+        "hit_rate": round(sum(hits.values()) / total, 3) if total else 0.0,
+        "top_entries": hits.most_common(10),
+    }
+
+
+class AnswerBankRefresher:
+    """Background thread that rebuilds the bank when it is older than the refresh interval"""
+
+    def __init__(self, db_factory, refresh_hours=REFRESH_HOURS):
+        self.db_factory = db_factory
+        self.interval = refresh_hours * 3600
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="answer-bank-refresh", daemon=True)
+
+    def start(self):
+        if self.interval > 0:
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(600):
+            age = time.time() - os.path.getmtime(BANK_PATH) if os.path.exists(BANK_PATH) else None
+            if age is not None and age < self.interval:
+                continue
+            try:
+                build_answer_bank(self.db_factory())
+            except Exception as e:
+                logger.error(f"Answer bank refresh failed: {e}")
+
+
+def start_answer_bank_refresh():
+    """Rebuild the bank on the ANSWER_BANK_REFRESH_HOURS schedule (0 leaves it to cron)"""
+    from database import SupabaseClient
+    return AnswerBankRefresher(SupabaseClient).start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and review the pre-generated answer bank")
+    parser.add_argument("--build", action="store_true", help="mine chat_history and generate missing answers")
+    parser.add_argument("--list", action="store_true", help="list bank entries")
+    parser.add_argument("--status", choices=["pending", "approved", "rejected"], help="filter --list by status")
+    parser.add_argument("--approve", type=int, nargs="+", metavar="ID", help="approve entries")
+    parser.add_argument("--reject", type=int, nargs="+", metavar="ID", help="reject entries")
+    parser.add_argument("--report", action="store_true", help="print the hit rate")
+    args = parser.parse_args()
+
+    if args.build:
+        from database import SupabaseClient
+        print(build_answer_bank(SupabaseClient()))
+    if args.approve:
+        set_status(args.approve, "approved")
+    if args.reject:
+        set_status(args.reject, "rejected")
+    if args.list:
+        for entry in AnswerBank().load().entries:
+            if args.status and entry["status"] != args.status:
+                continue
+            print(f"[{entry['id']}] {entry['status']:<8} {entry['combo'] or '(none)':<30} {entry['question']}")
+            print(f"    {entry['answer'][:300]}\n")
+    if args.report:
+        print(json.dumps(answer_bank_report(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
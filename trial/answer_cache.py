@@ -0,0 +1,47 @@
+# answer_cache.py
+
+import os
+import re
+import hashlib
+from dotenv import load_dotenv
+from shared_cache import shared_cache
+
+# Load environment variables
+load_dotenv()
+
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", str(24 * 3600)))
+ANSWER_CACHE_NAMESPACE = "answers"
+
+
+def normalize_question(question):
+    """Lowercase and collapse punctuation/whitespace so trivially different phrasings share a key"""
+    return " ".join(re.findall(r"[a-z0-9]+", (question or "").lower()))
+
+
+def answer_cache_key(user_id, question, medical_conditions):
+    """Cache key for an answer: the user, the normalized question and the conditions it was tailored to.
+
+    Answers are built from the user's own documents and history, so they are never shared between users.
+    """
+    conditions = ",".join(sorted(c.strip().lower() for c in (medical_conditions or "").split(",")))
+    raw = f"{user_id}|{normalize_question(question)}|{conditions}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """TTL cache of each user's recent answers, held in the shared cache so every app process reuses them"""
+
+    def __init__(self, ttl=ANSWER_CACHE_TTL_SECONDS, cache=shared_cache):
+        self.ttl = ttl
+        self.cache = cache
+
+    def get(self, key):
+        return self.cache.get(ANSWER_CACHE_NAMESPACE, key)
+
+    def put(self, key, answer):
+        if not answer:
+            return
+        self.cache.put(ANSWER_CACHE_NAMESPACE, key, answer, ttl=self.ttl)
+
+
+answer_cache = AnswerCache()
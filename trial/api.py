@@ -0,0 +1,197 @@
+# api.py
+#
+# HTTP API over the same chat, diary and document services the Streamlit pages use,
+# for mobile clients and load generators. Chat and diary answers stream as
+# server-sent events; the API scales separately from the UI:
+#
+#   uvicorn api:app --host 0.0.0.0 --port 8000 --workers 4
+#
+#   POST /api/login        {"email", "password"}             -> {"token", "user_id", "user_name"}
+#   POST /api/chat         {"question", "idempotency_key"?}  -> SSE: wait*, token*, done | error
+#   POST /api/diary        {"entry"}                         -> SSE: wait*, token*, done, mood | error
+#   POST /api/documents?file_name=<name>   raw file body     -> {"document_id", "summary", "medicines"}
+#   GET  /api/health
+#
+# Authenticated endpoints take "Authorization: Bearer <token>". Tokens are signed with
+# API_SECRET; without it set, login is disabled.
+
+import os
+import json
+import time
+import hmac
+import base64
+import hashlib
+import logging
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+from cancellation import GenerationCancelled
+from hedged_generation import DeadlineExceeded
+from single_flight import submission_key
+from passwords import verify_password
+from database import SupabaseClient
+from chat_service import stream_chat
+from diary_service import stream_diary_entry
+from document_service import process_document
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+API_SECRET = os.getenv("API_SECRET")
+API_TOKEN_TTL_SECONDS = int(os.getenv("API_TOKEN_TTL_SECONDS", str(7 * 24 * 3600)))
+API_MAX_UPLOAD_BYTES = int(os.getenv("API_MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+API_MAX_TEXT_CHARS = 4000
+
+
+def _sign(payload):
+    return hmac.new(API_SECRET.encode("utf-8"), payload.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def issue_token(user_id, ttl=API_TOKEN_TTL_SECONDS):
+    """Bearer token for a user, valid for ttl seconds"""
+    payload = base64.urlsafe_b64encode(f"{user_id}:{int(time.time() + ttl)}".encode("utf-8")).decode("ascii")
+    return f"{payload}.{_sign(payload)}"
+
+
+def verify_token(token):
+    """The user id a token was issued for, or None if it is invalid or expired"""
+    if not API_SECRET or not token or "." not in token:
+        return None
+    payload, signature = token.rsplit(".", 1)
+    if not hmac.compare_digest(signature, _sign(payload)):
+        return None
+    try:
+        user_id, expires_at = base64.urlsafe_b64decode(payload.encode("ascii")).decode("utf-8").rsplit(":", 1)
+        if int(expires_at) < time.time():
+            return None
+    except ValueError:
+        return None
+    return user_id
+
+
+def authenticated_user(request):
+    """User id from the request's bearer token; raises 401 otherwise"""
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    user_id = verify_token(token) if scheme.lower() == "bearer" else None
+    if user_id is None:
+        raise HTTPException(401, "Missing or invalid token")
+    return user_id
+
+
+async def json_field(request, name, max_chars=API_MAX_TEXT_CHARS):
+    """A required, non-empty string field of the JSON body"""
+    try:
+        body = await request.json()
+    except ValueError:
+        raise HTTPException(400, "Body must be JSON")
+    value = body.get(name) if isinstance(body, dict) else None
+    if not isinstance(value, str) or not value.strip():
+        raise HTTPException(400, f"'{name}' is required")
+    if len(value) > max_chars:
+        raise HTTPException(413, f"'{name}' is longer than {max_chars} characters")
+    return value.strip(), body
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def event_stream(events):
+    """Format (event, data) pairs as server-sent events, ending with an error event on failure.
+
+    A client disconnecting closes the service's stream, which cancels the generation.
+    """
+    try:
+        async for event, data in events:
+            yield sse_event(event, data)
+    except GenerationCancelled:
+        yield sse_event("error", {"message": "Response cancelled."})
+    except DeadlineExceeded:
+        yield sse_event("error", {"message": "The assistant is taking too long to respond. Please try again shortly."})
+    except Exception as e:
+        logger.error(f"Error streaming response: {e}")
+        yield sse_event("error", {"message": "Something went wrong. Please try again."})
+
+
+def sse_response(events):
+    return StreamingResponse(event_stream(events), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+async def health(request):
+    return JSONResponse({"status": "ok"})
+
+
+async def login(request):
+    if not API_SECRET:
+        raise HTTPException(503, "API login is disabled")
+    email, body = await json_field(request, "email")
+    password = body.get("password")
+    if not isinstance(password, str) or not password:
+        raise HTTPException(400, "'password' is required")
+    user = await run_in_threadpool(SupabaseClient().get_user_by_email, email)
+    if not user or not await run_in_threadpool(verify_password, user['password_hash'], password):
+        raise HTTPException(401, "Invalid email or password")
+    return JSONResponse({"token": issue_token(user['id']), "user_id": user['id'], "user_name": user['full_name']})
+
+
+async def chat(request):
+    user_id = authenticated_user(request)
+    question, body = await json_field(request, "question")
+    key = body.get("idempotency_key")
+    # Client keys are scoped to the user, like the ones the chat service derives itself
+    key = submission_key(user_id, "chat", str(key)) if key else None
+    return sse_response(stream_chat(question, user_id, idempotency_key=key))
+
+
+async def diary(request):
+    user_id = authenticated_user(request)
+    entry, _ = await json_field(request, "entry")
+    return sse_response(stream_diary_entry(entry, user_id))
+
+
+async def documents(request):
+    user_id = authenticated_user(request)
+    file_name = os.path.basename(request.query_params.get("file_name", ""))
+    if not file_name:
+        raise HTTPException(400, "'file_name' is required")
+    content = bytearray()
+    async for chunk in request.stream():
+        content.extend(chunk)
+        if len(content) > API_MAX_UPLOAD_BYTES:
+            raise HTTPException(413, f"Documents are limited to {API_MAX_UPLOAD_BYTES // (1024 * 1024)} MB")
+    if not content:
+        raise HTTPException(400, "The request body is empty")
+    try:
+        result, summary, medicines = await process_document(file_name, bytes(content), user_id)
+    except Exception as e:
+        logger.error(f"Error processing document for user {user_id}: {e}")
+        return JSONResponse({"detail": "Failed to process document. Please try again."}, status_code=500)
+    return JSONResponse({"document_id": result.get('id') if isinstance(result, dict) else None,
+                         "summary": summary, "medicines": medicines})
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Imported here like in the Streamlit app: warms the models and keeps them resident
+    from model_warmup import start_model_manager
+    start_model_manager()
+    yield
+
+
+app = Starlette(
+    routes=[
+        Route("/api/health", health),
+        Route("/api/login", login, methods=["POST"]),
+        Route("/api/chat", chat, methods=["POST"]),
+        Route("/api/diary", diary, methods=["POST"]),
+        Route("/api/documents", documents, methods=["POST"]),
+    ],
+    lifespan=lifespan,
+)
@@ -3,11 +3,10 @@ import streamlit as st
 import os
 from dotenv import load_dotenv
 from auth import initialize_session_state, login_page, register_page, show_user_info, logout
-from chat import display_chat_interface, load_chat_history, display_chat_history
-from dashboard import display_dashboard
-from my_profile import display_profile_update
-from emotional_diary_page import display_emotional_diary
-from document_upload import display_document_upload
+from router import add_page, render_current_page, nav_button
+from rerun_profiler import profiling_requested, RunProfiler, display_profile
+from session_memory import session_memory, start_session_sweeper, display_session_memory
+from admin import is_admin
 
 # Load environment variables
 load_dotenv()
@@ -17,9 +16,47 @@ os.environ["LANGCHAIN_TRACING_V2"] = "true"
 os.environ["LANGCHAIN_API_KEY"] = os.getenv("LANGCHAIN_API_KEY")
 os.environ["LANGCHAIN_PROJECT"] = os.getenv("LANGCHAIN_PROJECT")
 
+@st.cache_resource(show_spinner=False)
+def start_background_services():
+    """Warm up Ollama models and start the keep-alive, answer bank and session sweep schedules once per server process"""
+    # Imported here: the model router pulls in langchain, which the login page doesn't need
+    from model_warmup import start_model_manager
+    from answer_bank import start_answer_bank_refresh
+    return start_model_manager(), start_answer_bank_refresh(), start_session_sweeper()
+
+
+# Page registry: name -> renderer, the session data loaded before it renders and its
+# background prefetch. Page modules are imported when the page is first shown (or first
+# prefetched), see router.py
+add_page('dashboard', 'dashboard:display_dashboard', prefetch='mood_visualizations:prefetch_dashboard')
+add_page('profile', 'my_profile:display_profile_update', prefetch='my_profile:prefetch_profile')
+add_page('chatbot', 'chatbot_page:display_chatbot', loaders=['chat:load_chat_history'],
+         prefetch='chat:prefetch_chat_page')
+add_page('emotional_diary', 'emotional_diary_page:display_emotional_diary',
+         loaders=['emotional_diary:load_diary_history'], prefetch='emotional_diary:prefetch_diary_page')
+add_page('document_upload', 'document_upload:display_document_page', prefetch='document_upload:prefetch_documents')
+
+
+def current_page_name():
+    """Name of the page this run showed, for the profiler"""
+    return st.session_state.get('current_page') if st.session_state.get('logged_in') else 'login'
+
+
 def main():
+    # Admin sessions can profile each run with ?admin=<token>&profile=1, see rerun_profiler.py
+    if profiling_requested():
+        with RunProfiler(current_page_name, root_name="render_app") as profiler:
+            render_app()
+        if profiler.result:
+            display_profile(profiler.result)
+    else:
+        render_app()
+
+
+def render_app():
     # Initialize session state
     initialize_session_state()
+    session_memory.touch()
     
     # Set up the page
     st.set_page_config(
@@ -40,77 +77,26 @@ def main():
         with tab2:
             register_page()
     else:
-        # Determine which page to show based on session state
-        if 'current_page' not in st.session_state:
-            st.session_state['current_page'] = 'dashboard'
-        
-        # Add navigation to sidebar for logged-in users
+        # Add navigation to sidebar for logged-in users; the buttons switch pages in
+        # their callbacks, so a click costs a single rerun
         with st.sidebar:
             st.markdown("---")
             st.subheader("Navigation")
-                    
-            if st.button("Dashboard", use_container_width=True):
-                st.session_state['current_page'] = 'dashboard'
-                st.rerun()
-                        
-            if st.button("Update Profile", use_container_width=True):
-                st.session_state['current_page'] = 'profile'
-                st.rerun()
-                        
-            if st.button("Logout", use_container_width=True):
-                logout()
-                st.rerun()
+            nav_button("Dashboard", 'dashboard')
+            nav_button("Update Profile", 'profile')
+            st.button("Logout", use_container_width=True, on_click=logout)
         
-        # Display the appropriate page based on session state
-        if st.session_state['current_page'] == 'dashboard':
-            display_dashboard()
-        elif st.session_state['current_page'] == 'profile':
-            display_profile_update()
-        elif st.session_state['current_page'] == 'chatbot':
-            st.title('Swasthya AI Chatbot')
-                    
-            # Button to navigate back to dashboard
-            col1, col2 = st.columns([5, 1])
-            with col2:
-                if st.button("Back to Dashboard", use_container_width=True):
-                    st.session_state['current_page'] = 'dashboard'
-                    st.rerun()
-                    
-            # Add chatbot sidebar options
-            with st.sidebar:
-                st.markdown("---")
-                st.subheader("Chatbot Options")
-                view_mode = st.radio(
-                    "View Mode:",
-                    ["Chat Interface", "Chat History"],
-                    key="view_mode"
-                )
-                if st.button("Clear Current Chat", use_container_width=True):
-                    st.session_state.chat_messages = []
-                    st.rerun()
-            
-            # Load chat history if not already loaded
-            load_chat_history(st.session_state['user_id'])
-            
-            # Display either chat interface or chat history based on selection
-            if view_mode == "Chat Interface":
-                display_chat_interface()
-            else:
-                display_chat_history(st.session_state['user_id'])
-        elif st.session_state['current_page'] == 'emotional_diary':
-            # Display the emotional diary page
-            display_emotional_diary()
-        elif st.session_state['current_page'] == 'document_upload':
-            # NEW: Display document upload page
-            # Button to navigate back to dashboard
-            col1, col2 = st.columns([5, 1])
-            with col2:
-                if st.button("Back to Dashboard", use_container_width=True):
-                    st.session_state['current_page'] = 'dashboard'
-                    st.rerun()
-                    
-            # Display document upload interface
-            display_document_upload()
+        # Display the page selected in session state
+        render_current_page(st.session_state['user_id'])
+
+    # Account for the buffers the page loaded; if this session was evicted while idle,
+    # the first call has already dropped them so the page reloaded them from the database
+    session_memory.touch()
+    if is_admin():
+        display_session_memory()
+
+    # Started after the page is drawn so the first paint doesn't wait for the model imports
+    start_background_services()
 
 if __name__ == "__main__":
     main()
@@ -168,9 +154,32 @@ if __name__ == "__main__":
 #   created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 # );
 #
+# -- Rolling conversation summaries, one row per user and thread ('chat' or 'diary')
+# CREATE TABLE conversation_memory (
+#   id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+#   user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+#   thread VARCHAR NOT NULL,
+#   summary TEXT NOT NULL,
+#   turns_covered INT NOT NULL DEFAULT 0,
+#   last_turn_at TIMESTAMP WITH TIME ZONE,
+#   updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+#   UNIQUE (user_id, thread)
+# );
+#
+# -- Per-user snapshot read by the chat and diary prompts, refreshed by the app on every write
+# CREATE TABLE user_snapshot (
+#   user_id UUID PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+#   profile JSONB NOT NULL DEFAULT '{}',
+#   conditions JSONB NOT NULL DEFAULT '[]',
+#   medicines JSONB NOT NULL DEFAULT '[]',
+#   mood_trend JSONB NOT NULL DEFAULT '{}',
+#   updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+# );
+#
 # -- Create indices for faster queries
 # CREATE INDEX idx_medical_info_user_id ON medical_info(user_id);
 # CREATE INDEX idx_chat_history_user_id ON chat_history(user_id);
+# CREATE INDEX idx_chat_history_user_created ON chat_history(user_id, created_at DESC, id DESC);
 # CREATE INDEX idx_emotional_diary_user_id ON emotional_diary(user_id);
 # CREATE INDEX idx_user_documents_user_id ON user_documents(user_id);
 # CREATE INDEX idx_user_documents_created_at ON user_documents(created_at);
@@ -180,4 +189,6 @@ if __name__ == "__main__":
 # ALTER TABLE medical_info DISABLE ROW LEVEL SECURITY;
 # ALTER TABLE chat_history DISABLE ROW LEVEL SECURITY;
 # ALTER TABLE emotional_diary DISABLE ROW LEVEL SECURITY;
-# ALTER TABLE user_documents DISABLE ROW LEVEL SECURITY;
\ No newline at end of file
+# ALTER TABLE user_documents DISABLE ROW LEVEL SECURITY;
+# ALTER TABLE conversation_memory DISABLE ROW LEVEL SECURITY;
+# ALTER TABLE user_snapshot DISABLE ROW LEVEL SECURITY;
\ No newline at end of file
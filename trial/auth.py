@@ -1,20 +1,18 @@
 #auth.py
 
 import streamlit as st
-import bcrypt
-from database import SupabaseClient
+from passwords import hash_password, verify_password
+from conversation_state import conversation_states
+from followup_suggestions import followup_suggestions
+from generation_session import cancel_active_generation
+from session_memory import session_memory, drop_buffers
+from prefetch import page_prefetcher
 
 
-def hash_password(password):
-    """Hash a password for storing."""
-    salt = bcrypt.gensalt()
-    hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
-    return hashed.decode('utf-8')
-
-
-def verify_password(stored_password, provided_password):
-    """Verify a stored password against one provided by user"""
-    return bcrypt.checkpw(provided_password.encode('utf-8'), stored_password.encode('utf-8'))
+def _db():
+    """Data layer client; supabase is imported on first use so the login page renders without it"""
+    from database import SupabaseClient
+    return SupabaseClient()
 
 
 def initialize_session_state():
@@ -44,7 +42,7 @@ def login_page():
             return
 
         # Attempt to log in the user
-        db = SupabaseClient()
+        db = _db()
         user = db.get_user_by_email(email)
 
         if user and verify_password(user['password_hash'], password):
@@ -131,7 +129,7 @@ def register_page():
             }
 
             # Create user in database
-            db = SupabaseClient()
+            db = _db()
             existing_user = db.get_user_by_email(email)
 
             if existing_user:
@@ -155,13 +153,20 @@ def register_page():
 
 def logout():
     """Log out the current user"""
+    cancel_active_generation()
+    if st.session_state['user_id']:
+        conversation_states.reset(st.session_state['user_id'])
+        followup_suggestions.discard(st.session_state['user_id'])
     st.session_state['logged_in'] = False
     st.session_state['user_id'] = None
     st.session_state['user_email'] = None
     st.session_state['user_name'] = None
     st.session_state['current_page'] = 'login'
-    if 'chat_messages' in st.session_state:
-        del st.session_state['chat_messages']
+    st.session_state['rendered_page'] = None
+    page_prefetcher.discard()
+    # The next user of this browser session starts with empty buffers
+    drop_buffers()
+    session_memory.forget()
 
 
 def show_user_info():
@@ -177,7 +182,7 @@ def show_user_info():
             st.sidebar.markdown(f"*{st.session_state['user_email']}*")
 
         # Get user medical info
-        db = SupabaseClient()
+        db = _db()
         medical_info = db.get_user_medical_info(st.session_state['user_id'])
 
         if medical_info:
@@ -0,0 +1,136 @@
+# cancellation.py
+
+import queue
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Generations run here while the calling (Streamlit script) thread stays responsive
+_generation_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="generation")
+# API streams run here. A stream's function may itself call run_interruptible, so it must never hold a
+# generation worker while waiting for another one
+_stream_executor = ThreadPoolExecutor(max_workers=64, thread_name_prefix="stream")
+
+
+class GenerationCancelled(Exception):
+    """Raised inside a generation whose handle was cancelled"""
+
+
+class GenerationHandle:
+    """Cancellable handle for one in-flight generation.
+
+    Cancelling closes the attached HTTP stream, which makes Ollama stop generating
+    and frees the gateway slot for the next request.
+    """
+
+    def __init__(self, key=None):
+        self.key = key
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._response = None
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def attach(self, response):
+        """Register the open HTTP response so cancel() can close it"""
+        with self._lock:
+            self._response = response
+        if self.cancelled:
+            self._close()
+
+    def detach(self):
+        with self._lock:
+            self._response = None
+
+    def check(self):
+        """Raise GenerationCancelled if the handle has been cancelled"""
+        if self.cancelled:
+            raise GenerationCancelled()
+
+    def cancel(self):
+        self._cancelled.set()
+        self._close()
+
+    def _close(self):
+        with self._lock:
+            response, self._response = self._response, None
+        if response is not None:
+            try:
+                response.close()
+            except Exception:
+                pass
+
+
+def run_interruptible(fn, handle, on_token=None, on_wait=None, on_idle=None, poll_interval=0.5):
+    """Run fn(on_token, on_wait) on a worker thread and replay its callbacks on this thread.
+
+    The calling thread wakes at least every poll_interval seconds and calls on_idle,
+    so a Streamlit script can be stopped between updates (navigation, a new submission)
+    even while the model is still evaluating the prompt. Any exception raised on this
+    thread, including Streamlit's own stop/rerun signals, cancels the generation.
+    """
+    events = queue.Queue()
+    future = _generation_executor.submit(
+        fn,
+        lambda token: events.put(("token", token)),
+        lambda ahead, eta: events.put(("wait", (ahead, eta))),
+    )
+    future.add_done_callback(lambda _: events.put(("done", None)))
+
+    try:
+        while True:
+            try:
+                kind, value = events.get(timeout=poll_interval)
+            except queue.Empty:
+                if on_idle:
+                    on_idle()
+                continue
+            if kind == "done":
+                return future.result()
+            if kind == "token" and on_token:
+                on_token(value)
+            elif kind == "wait" and on_wait:
+                on_wait(*value)
+    except BaseException:
+        handle.cancel()
+        raise
+
+
+async def stream_interruptible(fn, handle):
+    """Run fn(on_token, on_wait) on a stream worker thread and yield its callbacks as events.
+
+    The async counterpart of run_interruptible for the API: yields ("token", text) and
+    ("wait", (ahead, eta)) as they happen, then ("result", value). Closing the
+    generator early (a client disconnecting) or cancelling the task cancels the generation.
+    """
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+
+    def put(kind, value):
+        try:
+            loop.call_soon_threadsafe(events.put_nowait, (kind, value))
+        except RuntimeError:
+            pass  # the event loop has shut down
+
+    future = _stream_executor.submit(
+        fn,
+        lambda token: put("token", token),
+        lambda ahead, eta: put("wait", (ahead, eta)),
+    )
+    future.add_done_callback(lambda _: put("done", None))
+
+    finished = False
+    try:
+        while True:
+            kind, value = await events.get()
+            if kind == "done":
+                finished = True
+                result = future.result()
+                break
+            yield kind, value
+    finally:
+        if not finished:
+            handle.cancel()
+    yield "result", result
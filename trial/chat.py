@@ -1,157 +1,227 @@
 #chat.py
 
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from langchain_community.llms import Ollama
 import streamlit as st
 from database import SupabaseClient
-import time
+from llm_gateway import queue_status_reporter
+from cancellation import GenerationCancelled
+from generation_session import start_generation, finish_generation, StreamingPlaceholder
+from hedged_generation import DeadlineExceeded
+from single_flight import new_submission_key
+from followup_suggestions import followup_suggestions, FOLLOWUP_SUGGESTIONS_ENABLED
+from chat_service import answer_chat, save_followup_suggestion
+from session_memory import session_memory, cap_buffer, SESSION_BUFFER_MAX_MESSAGES
+from voice_input import voice_prompt
 
+# How often the suggestion panel checks for follow-ups that are still being prepared
+FOLLOWUP_POLL_SECONDS = 5
 
-def initialize_llm():
-    """Initialize the language model"""
-    return Ollama(model="tinyllama" , temperature=0.5)
+# Messages rendered by default, turns fetched per "load older" page, and the session buffer cap
+CHAT_WINDOW_MESSAGES = 20
+CHAT_PAGE_TURNS = 10
+CHAT_BUFFER_MAX_MESSAGES = SESSION_BUFFER_MAX_MESSAGES
+CHAT_HISTORY_MAX_ROWS = 200
 
 
-def get_prompt_template():
-    """Get the chat prompt template"""
-    return ChatPromptTemplate.from_messages(
-        [
-            ("system", "Provide a detailed answer to the question, mention the steps in points. "
-                       "Consider the user's medical conditions when relevant."),
-            ("user", "User has the following medical conditions: {medical_conditions}. "
-                     "Previous conversation context: {conversation_context}. Question: {question}")
-        ]
-    )
+def use_followup_suggestion(suggestion, user_id):
+    """Answer a clicked suggestion from its pre-generated text"""
+    saved_chat = save_followup_suggestion(suggestion, user_id)
+    append_chat_turn(suggestion.question, suggestion.answer, saved_chat)
 
 
-def format_medical_conditions(user_id):
-    """Get user's medical conditions as a formatted string"""
-    db = SupabaseClient()
-    medical_info = db.get_user_medical_info(user_id)
-
-    if not medical_info:
-        return "None specified"
-
-    conditions = [info['condition_name'] for info in medical_info]
-    return ", ".join(conditions)
-
-
-def get_conversation_context(conversation_history, max_context=5):
-    """Format the recent conversation history as context"""
-    if not conversation_history:
-        return "No previous context"
-
-    # Get last few interactions to use as context
-    recent_history = conversation_history[-max_context:]
-    context_text = ""
-
-    for entry in recent_history:
-        context_text += f"User: {entry['question']}\nAssistant: {entry['answer']}\n\n"
-
-    return context_text
+def process_query(question, user_id, on_wait=None, on_token=None, on_idle=None, handle=None, idempotency_key=None):
+    """Answer the question through the chat service and add the turn to the session's messages"""
+    response, saved_chat = answer_chat(question, user_id, on_wait, on_token, on_idle, handle, idempotency_key)
 
+    # Add to session state for immediate display
+    append_chat_turn(question, response, saved_chat)
 
-def process_query(question, user_id):
-    """Process the user query and get a response from the language model"""
-    # Initialize chat history in session state if not present
-    if "chat_messages" not in st.session_state:
-        st.session_state.chat_messages = []
+    return response
 
-    # Get user's medical conditions
-    medical_conditions = format_medical_conditions(user_id)
 
-    # Get conversation context from session state
-    db = SupabaseClient()
-    conversation_history = db.get_chat_history(user_id)
-    conversation_context = get_conversation_context(conversation_history)
+def display_followup_suggestions(user_id):
+    """Show pre-generated follow-ups as buttons, polling while they are still being prepared"""
+    run_every = FOLLOWUP_POLL_SECONDS if followup_suggestions.pending(user_id) else None
 
-    # Setup the language model chain
-    llm = initialize_llm()
-    prompt = get_prompt_template()
-    output_parser = StrOutputParser()
-    chain = prompt | llm | output_parser
+    @st.fragment(run_every=run_every)
+    def suggestions_panel():
+        suggestions = followup_suggestions.get(user_id)
+        if not suggestions:
+            return
+        st.caption("You might also want to ask:")
+        for i, suggestion in enumerate(suggestions):
+            if st.button(suggestion.question, key=f"followup_{i}"):
+                st.session_state['selected_followup'] = suggestion
+                # The selection is picked up by the enclosing chat pane, which a fragment rerun wouldn't reach
+                st.rerun()
 
-    # Get response
-    response = chain.invoke({
-        "question": question,
-        "medical_conditions": medical_conditions,
-        "conversation_context": conversation_context
-    })
+    suggestions_panel()
 
-    # Save the chat to the database
-    db.save_chat(user_id, question, response)
 
-    # Add to session state for immediate display
-    st.session_state.chat_messages.append({"role": "user", "content": question})
-    st.session_state.chat_messages.append({"role": "assistant", "content": response})
+@st.fragment
+def display_chat_interface():
+    """Display an interactive chat interface showing the latest window of messages.
 
-    return response
+    Runs as a fragment, so a submitted question or "Load older messages" reruns only the chat pane.
+    """
+    user_id = st.session_state['user_id']
+    session_memory.touch()
+    load_chat_history(user_id)
 
+    selected = st.session_state.pop('selected_followup', None)
+    if selected is not None:
+        use_followup_suggestion(selected, user_id)
 
-def display_chat_interface():
-    """Display an interactive chat interface"""
-    # Initialize chat history in session state if not present
-    if "chat_messages" not in st.session_state:
-        st.session_state.chat_messages = []
+    messages = st.session_state.chat_messages
+    window = st.session_state.get('chat_window', CHAT_WINDOW_MESSAGES)
+    if window < len(messages) or (st.session_state.get('chat_has_older') and len(messages) < CHAT_BUFFER_MAX_MESSAGES):
+        st.button("Load older messages", on_click=load_older_chat_messages, args=(user_id,))
+    elif st.session_state.get('chat_has_older'):
+        st.caption("Older messages are available under Chat History.")
 
     # Display chat messages
-    for message in st.session_state.chat_messages:
+    for message in messages[-window:]:
         if message["role"] == "user":
             st.chat_message("user", avatar="👤").write(message["content"])
         else:
             st.chat_message("assistant", avatar="🤖").write(message["content"])
 
-    # Chat input
-    if prompt := st.chat_input("Type your health-related question here"):
+    # Chat input, typed or spoken; a spoken question is submitted as soon as it is transcribed
+    spoken = voice_prompt("chat_voice", "🎤 Ask by voice")
+    if prompt := st.chat_input("Type your health-related question here") or spoken:
         # Add user message to chat
         st.chat_message("user", avatar="👤").write(prompt)
 
-        # Show thinking animation
+        # Stream the response into the message as it is generated
         with st.chat_message("assistant", avatar="🤖"):
             thinking_placeholder = st.empty()
-            for i in range(3):
-                thinking_placeholder.write("Thinking" + "." * (i + 1))
-                time.sleep(0.3)
+            thinking_placeholder.write("Thinking...")
+            stream = StreamingPlaceholder(thinking_placeholder)
+
+            # Process the query; navigation or another submission cancels it. Each submission gets its own
+            # key, so asking the same question again generates a new answer
+            key = new_submission_key(st.session_state['user_id'], "chat")
+            handle = start_generation(key)
+            try:
+                with st.spinner(""):
+                    response = process_query(prompt, st.session_state['user_id'],
+                                             on_wait=queue_status_reporter(thinking_placeholder),
+                                             on_token=stream.on_token, on_idle=stream.on_idle, handle=handle,
+                                             idempotency_key=key)
+            except GenerationCancelled:
+                thinking_placeholder.info("Response cancelled.")
+                return
+            except DeadlineExceeded:
+                thinking_placeholder.warning("The assistant is taking too long to respond. Please try again shortly.")
+                return
+            finally:
+                finish_generation(handle)
+
+            # Replace the streamed text with the final response
+            thinking_placeholder.write(response)
 
-            # Process the query
-            with st.spinner(""):
-                response = process_query(prompt, st.session_state['user_id'])
+    if FOLLOWUP_SUGGESTIONS_ENABLED:
+        display_followup_suggestions(st.session_state['user_id'])
+
+
+def _turn_messages(row):
+    """Session messages for one chat_history row; the user message keeps the row's pagination key"""
+    return [{"role": "user", "content": row['question'], "key": (row['created_at'], row['id'])},
+            {"role": "assistant", "content": row['answer']}]
 
-            # Replace thinking animation with response
-            thinking_placeholder.write(response)
+
+def fetch_chat_history(user_id):
+    """Session state values for the latest page of chat history; doesn't touch session state"""
+    rows = SupabaseClient().get_chat_history_page(user_id, limit=CHAT_PAGE_TURNS)
+    return {
+        "chat_messages": [m for row in reversed(rows) for m in _turn_messages(row)],
+        "chat_has_older": len(rows) == CHAT_PAGE_TURNS,
+        "chat_window": CHAT_WINDOW_MESSAGES,
+    }
 
 
 def load_chat_history(user_id):
-    """Load chat history from database into session state"""
+    """Load the latest page of chat history from the database into session state"""
+    if "chat_messages" not in st.session_state:
+        st.session_state.update(fetch_chat_history(user_id))
+
+
+def prefetch_chat_page(user_id):
+    """Background prefetch for the chatbot page: the chat buffer, and the snapshot and memory a question reads"""
+    db = SupabaseClient()
+    db.get_user_snapshot(user_id)
+    db.get_conversation_memory(user_id, "chat")
+    return fetch_chat_history(user_id)
+
+
+def load_older_chat_messages(user_id):
+    """Show more of the buffer, fetching the next older page by keyset when it is all shown"""
+    messages = st.session_state.chat_messages
+    if st.session_state.chat_window < len(messages):
+        st.session_state.chat_window += CHAT_PAGE_TURNS * 2
+        return
+
+    before = messages[0].get("key") if messages else None
+    room = (CHAT_BUFFER_MAX_MESSAGES - len(messages)) // 2
+    if (messages and before is None) or room <= 0:
+        return
+    limit = min(CHAT_PAGE_TURNS, room)
+    rows = SupabaseClient().get_chat_history_page(user_id, before=before, limit=limit)
+    messages[:0] = [m for row in reversed(rows) for m in _turn_messages(row)]
+    st.session_state.chat_has_older = len(rows) == limit
+    st.session_state.chat_window = len(messages)
+
+
+def append_chat_turn(question, answer, saved_chat=None):
+    """Add a new turn to the session buffer, dropping the oldest turns past the cap"""
     if "chat_messages" not in st.session_state:
         st.session_state.chat_messages = []
+    messages = st.session_state.chat_messages
+    if isinstance(saved_chat, dict):
+        messages.extend(_turn_messages(saved_chat))
+    else:
+        messages.extend([{"role": "user", "content": question}, {"role": "assistant", "content": answer}])
 
-        # Get chat history from database
-        db = SupabaseClient()
-        chat_history = db.get_chat_history(user_id)
+    if cap_buffer(messages, CHAT_BUFFER_MAX_MESSAGES):
+        st.session_state.chat_has_older = True
+    # The paged history view is rebuilt on its next render
+    st.session_state.pop('chat_history_view', None)
 
-        if chat_history:
-            for chat in chat_history:
-                st.session_state.chat_messages.append({"role": "user", "content": chat['question']})
-                st.session_state.chat_messages.append({"role": "assistant", "content": chat['answer']})
+
+def clear_chat_messages():
+    """Empty the current chat view without touching the saved history"""
+    st.session_state.chat_messages = []
+    st.session_state.chat_has_older = False
+    st.session_state.chat_window = CHAT_WINDOW_MESSAGES
+
+
+def _load_older_chat_history(user_id):
+    view = st.session_state['chat_history_view']
+    rows = SupabaseClient().get_chat_history_page(user_id, before=view["cursor"], limit=CHAT_PAGE_TURNS * 2)
+    view["rows"].extend(rows)
+    view["has_older"] = len(rows) == CHAT_PAGE_TURNS * 2 and len(view["rows"]) < CHAT_HISTORY_MAX_ROWS
+    if rows:
+        view["cursor"] = (rows[-1]['created_at'], rows[-1]['id'])
 
 
 def display_chat_history(user_id):
-    """Display the user's chat history as expandable sections"""
-    db = SupabaseClient()
-    chat_history = db.get_chat_history(user_id)
+    """Display the user's chat history as expandable sections, newest first, one page at a time"""
+    if 'chat_history_view' not in st.session_state:
+        st.session_state['chat_history_view'] = {"rows": [], "cursor": None, "has_older": True}
+        _load_older_chat_history(user_id)
+    view = st.session_state['chat_history_view']
 
-    if not chat_history:
+    if not view["rows"]:
         st.info("No previous chats found.")
         return
 
     st.subheader("Chat History")
 
-    for chat in chat_history:
+    for chat in view["rows"]:
         with st.expander(f"Q: {chat['question'][:50]}...", expanded=False):
             st.write("*Question:*")
             st.write(chat['question'])
             st.write("*Answer:*")
-            st.write(chat['answer'])
\ No newline at end of file
+            st.write(chat['answer'])
+
+    if view["has_older"]:
+        st.button("Show older chats", on_click=_load_older_chat_history, args=(user_id,))
@@ -0,0 +1,278 @@
+# chat_service.py
+#
+# The chat pipeline without any UI: retrieval, routing, generation, saving and the
+# follow-up suggestions. The Streamlit chat pane (chat.py) and the HTTP API (api.py)
+# both answer questions through answer_chat / stream_chat.
+
+from langchain_core.prompts import ChatPromptTemplate
+from database import SupabaseClient
+from vector_index import retrieve_context, index_chat_turn
+from llm_gateway import get_gateway, PRIORITY_INTERACTIVE, PRIORITY_SPECULATIVE
+from model_router import classify_request
+from ollama_client import generate
+from conversation_state import conversation_states
+from cancellation import GenerationHandle, stream_interruptible
+from hedged_generation import run_hedged
+from answer_cache import answer_cache, answer_cache_key
+from single_flight import SingleFlight, new_submission_key, IDEMPOTENCY_WINDOW_SECONDS
+from followup_suggestions import followup_suggestions, parse_questions, FOLLOWUP_COUNT
+from metrics import increment
+from answer_bank import answer_bank
+from knowledge_base import knowledge_base
+from conversation_memory import conversation_memory
+from health_snapshot import format_snapshot
+
+
+def get_prompt_template():
+    """Get the chat prompt template.
+
+    The system message holds only what stays the same between turns (the instructions
+    and the user's medical conditions), since it is the prefix Ollama's cached context
+    is reused for. The snapshot fields that change with every diary entry or document
+    (medicines, profile, mood) go in the user message with the per-turn content.
+    """
+    return ChatPromptTemplate.from_messages(
+        [
+            ("system", "Provide a detailed answer to the question, mention the steps in points. "
+                       "Consider the user's medical conditions when relevant. "
+                       "Use the relevant notes from the user's history and documents only if they apply. "
+                       "Base the answer on the guideline passages when they cover the question, and keep it focused. "
+                       "User has the following medical conditions: {medical_conditions}."),
+            ("user", "Medicines found in their documents: {medicines}. "
+                     "Profile: {profile}. Recent mood from their diary: {mood_trend}. "
+                     "Previous conversation context: {conversation_context}. "
+                     "Relevant notes from the user's history and documents: {retrieved_context}. "
+                     "Guideline passages: {guidelines}. "
+                     "Question: {question}")
+        ]
+    )
+
+
+def get_followup_prompt_template():
+    """Get the prompt for a turn that continues from the model's cached conversation state"""
+    return ChatPromptTemplate.from_messages(
+        [
+            ("user", "Medicines found in their documents: {medicines}. "
+                     "Profile: {profile}. Recent mood from their diary: {mood_trend}. "
+                     "Relevant notes from the user's history and documents: {retrieved_context}. "
+                     "Guideline passages: {guidelines}. "
+                     "Question: {question}")
+        ]
+    )
+
+
+def get_followup_questions_prompt_template():
+    """Get the prompt that predicts what the user will ask after an answer"""
+    return ChatPromptTemplate.from_messages(
+        [
+            ("system", "You predict the questions a patient is most likely to ask next. "
+                       "Reply with {count} short questions, one per line, and nothing else."),
+            ("user", "User's medical conditions: {medical_conditions}. "
+                     "Question: {question}\nAnswer: {answer}")
+        ]
+    )
+
+
+def get_user_context(db, user_id):
+    """Prompt fields from the user's snapshot row: conditions, medicines, profile and mood trend"""
+    return format_snapshot(db.get_user_snapshot(user_id))
+
+
+def get_conversation_context(conversation_history, max_context=5):
+    """Format the recent conversation history as context"""
+    if not conversation_history:
+        return "No previous context"
+
+    # Get last few interactions to use as context
+    recent_history = conversation_history[-max_context:]
+    context_text = ""
+
+    for entry in recent_history:
+        context_text += f"User: {entry['question']}\nAssistant: {entry['answer']}\n\n"
+
+    return context_text
+
+
+# Identical submissions by one user share a single answer and insert; identical concurrent generations
+# are shared between that user's own requests
+chat_submissions = SingleFlight("chat_submission", remember_seconds=IDEMPOTENCY_WINDOW_SECONDS)
+chat_generations = SingleFlight("chat_generation")
+
+
+def answer_question(question, user_id, handle, emit_token=None, emit_wait=None):
+    """Answer, save and index one question; returns the response text"""
+    db = SupabaseClient()
+
+    # Everything the prompt needs to know about the user, in one query
+    user_context = get_user_context(db, user_id)
+    medical_conditions = user_context["medical_conditions"]
+
+    # Frequent questions have a vetted answer for the user's combination of standard conditions
+    response = answer_bank.lookup(question, medical_conditions)
+    if response:
+        if emit_token:
+            emit_token(response)
+        # The model's cached state doesn't include this turn, so the next question sends history as text
+        conversation_states.reset(user_id, "chat")
+    else:
+        response = generate_answer(question, user_id, user_context, db, handle, emit_token, emit_wait)
+
+    # Save the chat to the database and add it to the user's vector index
+    saved_chat = db.save_chat(user_id, question, response)
+    index_chat_turn(user_id, saved_chat)
+    conversation_memory.note_turn(user_id, "chat", db)
+
+    schedule_followup_suggestions(question, response, user_id, user_context)
+    return response, saved_chat
+
+
+def generate_answer(question, user_id, user_context, db, handle, emit_token=None, emit_wait=None):
+    """Generate the answer to a question with the routed model"""
+    medical_conditions = user_context["medical_conditions"]
+    retrieved_context = retrieve_context(user_id, question, db)
+
+    # Pick the model for this question
+    decision = classify_request("chat", question, medical_conditions)
+    inputs = {
+        "question": question,
+        "retrieved_context": retrieved_context,
+        "guidelines": knowledge_base.context_for(question),
+        **user_context,
+    }
+    system_prompt = get_prompt_template().messages[0].format(**user_context).content
+
+    # Continue from the model's cached state when we have it, otherwise send the history as text
+    def full_prompt():
+        # Older turns are summarized in the user's memory (and retrieved by relevance), so only unsummarized ones are sent raw
+        full_inputs = dict(inputs, conversation_context=conversation_memory.context_for(user_id, "chat", db))
+        return get_prompt_template().format_messages(**full_inputs)[1].content
+
+    cached_context = conversation_states.get(user_id, "chat", decision.model, system_prompt)
+    if cached_context:
+        user_prompt = get_followup_prompt_template().format_messages(**inputs)[0].content
+        system = None
+    else:
+        user_prompt = full_prompt()
+        system = system_prompt
+
+    # If the routed model is slow to start, race the small model (or a recent answer) against it
+    fallback = decision.fallback()
+    cache_key = answer_cache_key(user_id, question, medical_conditions)
+
+    # Get response, queued behind other users' requests if Ollama is busy
+    def run_generation(emit_token, emit_wait):
+        def attempt(route, prompt, system, context):
+            def run(emit, attempt_handle):
+                return get_gateway().run(
+                    lambda: route.run(lambda: generate(route.model, prompt(), system=system, context=context,
+                                                       on_token=emit, handle=attempt_handle)),
+                    user_id, PRIORITY_INTERACTIVE, emit_wait, handle=attempt_handle
+                )
+            return run
+
+        hedge = attempt(fallback, full_prompt, system_prompt, None) if fallback else None
+        return run_hedged(attempt(decision, lambda: user_prompt, system, cached_context), hedge, handle,
+                          emit_token, cached_answer=answer_cache.get(cache_key))
+
+    # The prompt carries the user's own records, so only that user's concurrent requests share a generation
+    generation_key = f"chat:{user_id}:{cache_key}"
+    (result, winner), shared = chat_generations.run(generation_key, run_generation, handle, emit_token, emit_wait)
+    # A shared generation or a cached answer carries no model state for this user's thread
+    winning_model = fallback.model if winner == "hedge" else decision.model
+    conversation_states.put(user_id, "chat", winning_model, system_prompt, None if shared else result.context)
+    response = result.text
+    answer_cache.put(cache_key, response)
+    return response
+
+
+def schedule_followup_suggestions(question, response, user_id, user_context):
+    """Speculatively answer the likely next questions while Ollama is idle"""
+    medical_conditions = user_context["medical_conditions"]
+
+    def predict(handle):
+        messages = get_followup_questions_prompt_template().format_messages(
+            count=FOLLOWUP_COUNT, medical_conditions=medical_conditions, question=question, answer=response)
+        decision = classify_request("followups", question)
+        result = get_gateway().run(
+            lambda: decision.run(lambda: generate(decision.model, messages[1].content, system=messages[0].content,
+                                                  handle=handle)),
+            user_id, PRIORITY_SPECULATIVE, handle=handle
+        )
+        return parse_questions(result.text)
+
+    def answer(followup, handle):
+        db = SupabaseClient()
+        decision = classify_request("chat", followup, medical_conditions)
+        messages = get_prompt_template().format_messages(
+            question=followup,
+            retrieved_context=retrieve_context(user_id, followup, db),
+            guidelines=knowledge_base.context_for(followup),
+            **user_context,
+            conversation_context=get_conversation_context([{"question": question, "answer": response}]),
+        )
+        result = get_gateway().run(
+            lambda: decision.run(lambda: generate(decision.model, messages[1].content, system=messages[0].content,
+                                                  handle=handle)),
+            user_id, PRIORITY_SPECULATIVE, handle=handle
+        )
+        return result.text
+
+    followup_suggestions.schedule(user_id, predict, answer)
+
+
+def save_followup_suggestion(suggestion, user_id):
+    """Save a clicked suggestion's pre-generated answer as the next turn; returns the saved row"""
+    db = SupabaseClient()
+    saved_chat = db.save_chat(user_id, suggestion.question, suggestion.answer)
+    index_chat_turn(user_id, saved_chat)
+    conversation_memory.note_turn(user_id, "chat", db)
+    increment("followups.used")
+    # The model's cached state doesn't include this turn, so the next question sends history as text
+    conversation_states.reset(user_id, "chat")
+    followup_suggestions.discard(user_id)
+    return saved_chat
+
+
+def answer_chat(question, user_id, on_wait=None, on_token=None, on_idle=None, handle=None, idempotency_key=None):
+    """Answer a question, returning (response, saved row).
+
+    The answer is generated and saved on a worker thread and can be aborted through
+    handle; the callbacks are called on this thread as tokens arrive. Concurrent or
+    repeated submissions with the same idempotency key (minted by the caller when the
+    user submits) share one generation and one saved row; without a key, every call
+    is a new submission. Nothing is saved if the generation is cancelled.
+    """
+    handle = handle or GenerationHandle()
+
+    # Suggestions belong to the previous answer
+    followup_suggestions.discard(user_id)
+
+    key = idempotency_key or new_submission_key(user_id, "chat")
+    (response, saved_chat), _ = chat_submissions.run(
+        key, lambda emit_token, emit_wait: answer_question(question, user_id, handle, emit_token, emit_wait),
+        handle, on_token, on_wait, on_idle, background=True
+    )
+    return response, saved_chat
+
+
+async def stream_chat(question, user_id, handle=None, idempotency_key=None):
+    """Answer a question as an async stream of (event, data) pairs.
+
+    Yields ("wait", {"ahead", "eta"}) while queued, ("token", {"text"}) as the answer is
+    generated and finally ("done", {"response", "chat"}). Closing the stream early
+    cancels the generation.
+    """
+    handle = handle or GenerationHandle()
+
+    def run(emit_token, emit_wait):
+        return answer_chat(question, user_id, on_wait=emit_wait, on_token=emit_token, handle=handle,
+                           idempotency_key=idempotency_key)
+
+    async for kind, value in stream_interruptible(run, handle):
+        if kind == "token":
+            yield "token", {"text": value}
+        elif kind == "wait":
+            yield "wait", {"ahead": value[0], "eta": value[1]}
+        else:
+            response, saved_chat = value
+            yield "done", {"response": response, "chat": saved_chat if isinstance(saved_chat, dict) else None}
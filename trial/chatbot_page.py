@@ -0,0 +1,41 @@
+# chatbot_page.py
+
+import streamlit as st
+from chat import display_chat_interface, display_chat_history, clear_chat_messages
+from conversation_state import conversation_states
+from followup_suggestions import followup_suggestions
+from generation_session import cancel_active_generation
+from router import back_to_dashboard_button
+
+
+def clear_current_chat():
+    """Clear Current Chat callback: empty the chat view and drop the model's cached conversation"""
+    cancel_active_generation()
+    clear_chat_messages()
+    conversation_states.reset(st.session_state['user_id'], "chat")
+    followup_suggestions.discard(st.session_state['user_id'])
+
+
+def display_chatbot():
+    """Display the chatbot page with the chat interface or the chat history"""
+    st.title('Swasthya AI Chatbot')
+
+    # Button to navigate back to dashboard
+    back_to_dashboard_button()
+
+    # Add chatbot sidebar options
+    with st.sidebar:
+        st.markdown("---")
+        st.subheader("Chatbot Options")
+        view_mode = st.radio(
+            "View Mode:",
+            ["Chat Interface", "Chat History"],
+            key="view_mode"
+        )
+        st.button("Clear Current Chat", use_container_width=True, on_click=clear_current_chat)
+
+    # Display either chat interface or chat history based on selection
+    if view_mode == "Chat Interface":
+        display_chat_interface()
+    else:
+        display_chat_history(st.session_state['user_id'])
@@ -0,0 +1,158 @@
+# conversation_memory.py
+
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.prompts import ChatPromptTemplate
+from dotenv import load_dotenv
+from llm_gateway import get_gateway, PRIORITY_BACKGROUND
+from model_router import classify_request
+from ollama_client import generate
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Fold new turns into the summary once this many have accumulated
+MEMORY_FOLD_EVERY = int(os.getenv("MEMORY_FOLD_EVERY", "4"))
+MEMORY_MAX_WORDS = int(os.getenv("MEMORY_MAX_WORDS", "150"))
+
+# Summaries are rewritten off the interactive path, one at a time
+_memory_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="memory")
+
+
+def _format_chat_turn(row):
+    return f"User: {row['question']}\nAssistant: {row['answer']}"
+
+
+def _format_diary_turn(row):
+    return f"User entry: {row['entry']}\nAssistant response: {row['response']}"
+
+
+# thread -> (method fetching turns after a timestamp, turn formatter)
+THREADS = {
+    "chat": ("get_chat_history_since", _format_chat_turn),
+    "diary": ("get_emotional_diary_since", _format_diary_turn),
+}
+
+
+def get_fold_prompt_template():
+    """Get the prompt that folds new turns into the existing summary"""
+    return ChatPromptTemplate.from_messages([
+        ("system", "You maintain a compact memory of a user's conversations with a health assistant. "
+                   "Rewrite the memory to include what matters from the new turns: health conditions, "
+                   "medicines, symptoms, goals, preferences, recurring feelings and important events. "
+                   "Drop greetings and details that won't matter later. "
+                   "Write at most {max_words} words of plain notes about the user."),
+        ("user", "Current memory: {summary}\n\nNew turns:\n{turns}")
+    ])
+
+
+class ConversationMemory:
+    """Rolling per-user summaries of the chat and diary threads.
+
+    Prompts get the summary plus the turns that haven't been folded into it yet, so
+    their size stays bounded however long the history grows. Every MEMORY_FOLD_EVERY
+    turns the pending ones are folded into the summary by the small model in the
+    background and the row in conversation_memory is replaced. Rows are read through
+    the data layer's shared cache, so a fold in one app process is seen by all of them.
+    """
+
+    def __init__(self, fold_every=MEMORY_FOLD_EVERY):
+        self.fold_every = fold_every
+        self._pending = {}
+        self._folding = set()
+        self._lock = threading.Lock()
+
+    def _row(self, user_id, thread, db):
+        return db.get_conversation_memory(user_id, thread) or {"summary": "", "turns_covered": 0,
+                                                               "last_turn_at": None}
+
+    def _unfolded_turns(self, user_id, thread, db, row, newest=False):
+        """Turns after the summary, oldest first: the earliest ones to fold next, or with newest the latest ones"""
+        fetch, _ = THREADS[thread]
+        # Bounded even if folding has fallen behind (or, for a new memory row, the whole history is unfolded)
+        turns = getattr(db, fetch)(user_id, row["last_turn_at"], limit=self.fold_every * 3, newest=newest)
+        with self._lock:
+            self._pending[(str(user_id), thread)] = len(turns)
+        return turns
+
+    def context_for(self, user_id, thread, db, max_recent=None):
+        """Summary plus the not yet summarized turns, formatted for the prompt"""
+        row = self._row(user_id, thread, db)
+        # The prompt gets the latest turns; folding works through the backlog from its oldest end
+        turns = self._unfolded_turns(user_id, thread, db, row, newest=True)
+        _, format_turn = THREADS[thread]
+        recent = turns[-(max_recent or self.fold_every):]
+        parts = []
+        if row["summary"]:
+            parts.append(f"What you know about the user: {row['summary']}")
+        if recent:
+            parts.append("Latest turns:\n" + "\n\n".join(format_turn(t) for t in recent))
+        if len(turns) >= self.fold_every:
+            self._schedule_fold(user_id, thread, db)
+        return "\n\n".join(parts) or "No previous context"
+
+    def note_turn(self, user_id, thread, db):
+        """Count a saved turn and fold the pending ones once there are enough"""
+        key = (str(user_id), thread)
+        with self._lock:
+            self._pending[key] = self._pending.get(key, 0) + 1
+            due = self._pending[key] >= self.fold_every
+        if due:
+            self._schedule_fold(user_id, thread, db)
+
+    def _schedule_fold(self, user_id, thread, db):
+        key = (str(user_id), thread)
+        with self._lock:
+            if key in self._folding:
+                return
+            self._folding.add(key)
+        _memory_executor.submit(self._fold, user_id, thread, db)
+
+    def _fold(self, user_id, thread, db):
+        key = (str(user_id), thread)
+        backlog = False
+        try:
+            row = self._row(user_id, thread, db)
+            turns = self._unfolded_turns(user_id, thread, db, row)
+            if not turns:
+                return
+            _, format_turn = THREADS[thread]
+            messages = get_fold_prompt_template().format_messages(
+                max_words=MEMORY_MAX_WORDS,
+                summary=row["summary"] or "Nothing yet.",
+                turns="\n\n".join(format_turn(t) for t in turns),
+            )
+            decision = classify_request("summary", messages[1].content)
+            result = get_gateway().run(
+                lambda: decision.run(lambda: generate(decision.model, messages[1].content,
+                                                      system=messages[0].content, temperature=0.2)),
+                user_id, PRIORITY_BACKGROUND
+            )
+            summary = result.text.strip()
+            if not summary:
+                return
+            new_row = {
+                "summary": summary,
+                "turns_covered": row["turns_covered"] + len(turns),
+                "last_turn_at": turns[-1]["created_at"],
+            }
+            db.save_conversation_memory(user_id, thread, **new_row)
+            # A full batch means older turns are still unfolded, e.g. the first memory row of an
+            # existing user; the next batch queues behind other users' folds
+            backlog = len(turns) >= self.fold_every * 3
+            with self._lock:
+                self._pending[key] = 0
+        except Exception as e:
+            logger.error(f"Error updating {thread} memory for user {user_id}: {e}")
+        finally:
+            with self._lock:
+                self._folding.discard(key)
+        if backlog:
+            self._schedule_fold(user_id, thread, db)
+
+
+conversation_memory = ConversationMemory()
@@ -0,0 +1,61 @@
+# conversation_state.py
+
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+MAX_THREADS = int(os.getenv("CONTEXT_CACHE_MAX_THREADS", "500"))
+# Drop the cached state before it reaches the model's context window, Ollama silently truncates past it
+MAX_CONTEXT_TOKENS = int(os.getenv("CONTEXT_CACHE_MAX_TOKENS", "3000"))
+
+
+def _fingerprint(prefix):
+    return hashlib.sha256(prefix.encode("utf-8")).hexdigest()
+
+
+class ConversationStateStore:
+    """Per user-thread cache of the context tokens Ollama returns after each turn.
+
+    A cached state is only reused when the model and the stable prompt prefix
+    (system prompt plus medical conditions) are unchanged; otherwise callers get
+    None and fall back to sending the conversation as text.
+    """
+
+    def __init__(self, max_threads=MAX_THREADS):
+        self.max_threads = max_threads
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id, thread, model, prefix):
+        key = (str(user_id), thread)
+        with self._lock:
+            state = self._states.get(key)
+            if not state or state["model"] != model or state["prefix"] != _fingerprint(prefix):
+                return None
+            self._states.move_to_end(key)
+            return state["context"]
+
+    def put(self, user_id, thread, model, prefix, context):
+        key = (str(user_id), thread)
+        with self._lock:
+            if not context or len(context) > MAX_CONTEXT_TOKENS:
+                self._states.pop(key, None)
+                return
+            self._states[key] = {"model": model, "prefix": _fingerprint(prefix), "context": context}
+            self._states.move_to_end(key)
+            while len(self._states) > self.max_threads:
+                self._states.popitem(last=False)
+
+    def reset(self, user_id, thread=None):
+        """Forget cached state for one thread, or every thread of the user"""
+        with self._lock:
+            for key in [k for k in self._states if k[0] == str(user_id) and (thread is None or k[1] == thread)]:
+                del self._states[key]
+
+
+conversation_states = ConversationStateStore()
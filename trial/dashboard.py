@@ -2,6 +2,7 @@
 
 import streamlit as st
 from mood_visualizations import create_dashboard_mood_summary
+from router import nav_button
 
 # Inject CSS for hover effect
 def add_hover_styles():
@@ -50,9 +51,7 @@ def display_dashboard():
             </div>
             """, unsafe_allow_html=True)
 
-            if st.button("Open Chatbot", key="open_chatbot", use_container_width=True):
-                st.session_state['current_page'] = 'chatbot'
-                st.rerun()
+            nav_button("Open Chatbot", 'chatbot', key="open_chatbot")
 
         # Emotional Diary tile
         with col2:
@@ -63,9 +62,7 @@ def display_dashboard():
             </div>
             """, unsafe_allow_html=True)
 
-            if st.button("Open Diary", key="open_diary", use_container_width=True):
-                st.session_state['current_page'] = 'emotional_diary'
-                st.rerun()
+            nav_button("Open Diary", 'emotional_diary', key="open_diary")
 
         # Second row of tiles
         col3, col4 = st.columns(2)
@@ -79,9 +76,7 @@ def display_dashboard():
             </div>
             """, unsafe_allow_html=True)
 
-            if st.button("View Profile", key="view_profile", use_container_width=True):
-                st.session_state['current_page'] = 'profile'
-                st.rerun()
+            nav_button("View Profile", 'profile', key="view_profile")
 
         # NEW Document Upload tile (replacing Health Resources)
         with col4:
@@ -92,9 +87,7 @@ def display_dashboard():
             </div>
             """, unsafe_allow_html=True)
 
-            if st.button("Upload Documents", key="upload_documents", use_container_width=True):
-                st.session_state['current_page'] = 'document_upload'
-                st.rerun()
+            nav_button("Upload Documents", 'document_upload', key="upload_documents")
 
     with right_col:
         # Mood tracking summary
@@ -106,10 +99,8 @@ def display_dashboard():
 
         create_dashboard_mood_summary(st.session_state['user_id'])
 
-        if st.button("View Detailed Analytics", key="view_analytics", use_container_width=True):
-            st.session_state['current_page'] = 'emotional_diary'
-            st.session_state['diary_view_mode'] = 'Mood Analytics'
-            st.rerun()
+        nav_button("View Detailed Analytics", 'emotional_diary', key="view_analytics",
+                   diary_view_mode='Mood Analytics')
 
     # Footer
     st.markdown("---")
@@ -1,14 +1,20 @@
 # database.py
 
 import os
+from datetime import datetime, timezone
 from supabase import create_client, Client
 from dotenv import load_dotenv
+from health_snapshot import SNAPSHOT_SECTIONS, MOOD_TREND_ENTRIES, profile_basics, current_medicines, mood_trend
+from shared_cache import shared_cache, user_namespace
 
 # Load environment variables
 load_dotenv()
 
 
 class SupabaseClient:
+    """Data layer. Per-user reads go through the shared cache; every write for a user
+    invalidates that user's namespace for all app processes before anything re-reads it."""
+
     def __init__(self):
         url = os.getenv("SUPABASE_URL")
         key = os.getenv("SUPABASE_KEY")
@@ -16,6 +22,12 @@ class SupabaseClient:
             raise ValueError("Missing Supabase URL or key. Add them to your .env file.")
         self.client = create_client(url, key)
 
+    def _cached(self, user_id, key, loader, **kwargs):
+        return shared_cache.get_or_load(user_namespace(user_id), key, loader, **kwargs)
+
+    def _changed(self, user_id):
+        shared_cache.invalidate(user_namespace(user_id))
+
     def create_user(self, user_data):
         """Insert user personal info into the users table"""
         try:
@@ -28,6 +40,8 @@ class SupabaseClient:
                 'contact_no': user_data['contact_no']
             }).execute()
 
+            if response.data:
+                self.refresh_user_snapshot(response.data[0]['id'], ("profile",))
             return response.data[0] if response.data else None
         except Exception as e:
             print(f"Error creating user: {e}")
@@ -54,6 +68,8 @@ class SupabaseClient:
                         'condition_type': 'custom'
                     }).execute()
 
+            self._changed(user_id)
+            self.refresh_user_snapshot(user_id, ("conditions",))
             return True
         except Exception as e:
             print(f"Error creating medical info: {e}")
@@ -71,8 +87,9 @@ class SupabaseClient:
     def get_user_by_id(self, user_id):
         """Retrieve user by ID for profile display/update"""
         try:
-            response = self.client.table('users').select('*').eq('id', user_id).execute()
-            return response.data[0] if response.data else None
+            rows = self._cached(user_id, "user",
+                                lambda: self.client.table('users').select('*').eq('id', user_id).execute().data)
+            return rows[0] if rows else None
         except Exception as e:
             print(f"Error getting user by ID: {e}")
             return None
@@ -81,6 +98,9 @@ class SupabaseClient:
         """Update user information"""
         try:
             response = self.client.table('users').update(update_data).eq('id', user_id).execute()
+            if response.data:
+                self._changed(user_id)
+                self.refresh_user_snapshot(user_id, ("profile",))
             return True if response.data else False
         except Exception as e:
             print(f"Error updating user: {e}")
@@ -91,6 +111,7 @@ class SupabaseClient:
         try:
             # First delete all existing conditions
             self.client.table('medical_info').delete().eq('user_id', user_id).execute()
+            self._changed(user_id)
             
             # Then create new ones
             self.create_medical_info(user_id, conditions)
@@ -102,8 +123,9 @@ class SupabaseClient:
     def get_user_medical_info(self, user_id):
         """Retrieve user medical conditions"""
         try:
-            response = self.client.table('medical_info').select('*').eq('user_id', user_id).execute()
-            return response.data
+            return self._cached(user_id, "medical_info",
+                                lambda: self.client.table('medical_info').select('*').eq('user_id', user_id)
+                                .execute().data)
         except Exception as e:
             print(f"Error getting medical info: {e}")
             return []
@@ -116,7 +138,9 @@ class SupabaseClient:
                 'question': question,
                 'answer': answer,
             }).execute()
-            return True
+            self._changed(user_id)
+            # Return the saved row so callers can index it; fall back to True for truthiness checks
+            return response.data[0] if response.data else True
         except Exception as e:
             print(f"Error saving chat: {e}")
             return False
@@ -131,6 +155,136 @@ class SupabaseClient:
             print(f"Error getting chat history: {e}")
             return []
             
+    def get_chat_history_batch(self, after=None, limit=500, since=None):
+        """Retrieve chat rows of all users in (created_at, id) order, starting after the given key"""
+        try:
+            query = self.client.table('chat_history').select('*')
+            if since:
+                query = query.gte('created_at', since)
+            if after:
+                created_at, chat_id = after
+                query = query.or_(f'created_at.gt."{created_at}",'
+                                  f'and(created_at.eq."{created_at}",id.gt.{chat_id})')
+            response = query.order('created_at').order('id').limit(limit).execute()
+            return response.data
+        except Exception as e:
+            print(f"Error getting chat batch: {e}")
+            return []
+
+    def get_medical_info_for_users(self, user_ids):
+        """Retrieve medical conditions for several users at once"""
+        try:
+            if not user_ids:
+                return []
+            response = self.client.table('medical_info').select('*').in_('user_id', list(user_ids)).execute()
+            return response.data
+        except Exception as e:
+            print(f"Error getting medical info: {e}")
+            return []
+
+    def get_chat_history_page(self, user_id, before=None, limit=20):
+        """Retrieve one page of a user's chats, newest first, older than the given (created_at, id) key"""
+        def load():
+            query = self.client.table('chat_history').select('*').eq('user_id', user_id)
+            if before:
+                created_at, chat_id = before
+                query = query.or_(f'created_at.lt."{created_at}",'
+                                  f'and(created_at.eq."{created_at}",id.lt.{chat_id})')
+            return query.order('created_at', desc=True).order('id', desc=True).limit(limit).execute().data
+
+        try:
+            # The latest page is what every new session loads; older pages are read once
+            return self._cached(user_id, f"chat_page:{limit}", load) if before is None else load()
+        except Exception as e:
+            print(f"Error getting chat page: {e}")
+            return []
+
+    def get_chat_history_since(self, user_id, since=None, limit=50, newest=False):
+        """Retrieve a user's chat rows created after the given timestamp, oldest first.
+
+        With newest, the latest limit of them instead of the earliest.
+        """
+        def load():
+            query = self.client.table('chat_history').select('*').eq('user_id', user_id)
+            if since:
+                query = query.gt('created_at', since)
+            rows = query.order('created_at', desc=newest).limit(limit).execute().data
+            return list(reversed(rows)) if newest else rows
+
+        try:
+            return self._cached(user_id, f"chat_since:{since}:{limit}:{'newest' if newest else 'oldest'}", load)
+        except Exception as e:
+            print(f"Error getting recent chats: {e}")
+            return []
+
+    # FUNCTIONS FOR THE USER SNAPSHOT
+
+    def get_user_snapshot(self, user_id):
+        """Retrieve the user's snapshot row (profile, conditions, medicines, mood trend), building it if missing"""
+        try:
+            rows = self._cached(user_id, "snapshot",
+                                lambda: self.client.table('user_snapshot').select('*').eq('user_id', user_id)
+                                .execute().data,
+                                cache_if=bool)
+            if rows:
+                return rows[0]
+        except Exception as e:
+            print(f"Error getting user snapshot: {e}")
+        return self.refresh_user_snapshot(user_id)
+
+    def refresh_user_snapshot(self, user_id, sections=SNAPSHOT_SECTIONS):
+        """Recompute the given sections of the user's snapshot from their source tables"""
+        row = {'user_id': user_id, 'updated_at': datetime.now(timezone.utc).isoformat()}
+        try:
+            if "profile" in sections:
+                row['profile'] = profile_basics(self.get_user_by_id(user_id))
+            if "conditions" in sections:
+                row['conditions'] = [info['condition_name'] for info in self.get_user_medical_info(user_id)]
+            if "medicines" in sections:
+                documents = self.client.table('user_documents').select('medicines,created_at') \
+                    .eq('user_id', user_id).order('created_at', desc=True).limit(20).execute().data
+                row['medicines'] = current_medicines(documents)
+            if "mood_trend" in sections:
+                entries = self.client.table('emotional_diary').select('mood,json_data,created_at') \
+                    .eq('user_id', user_id).order('created_at', desc=True).limit(MOOD_TREND_ENTRIES).execute().data
+                row['mood_trend'] = mood_trend(entries)
+            response = self.client.table('user_snapshot').upsert(row, on_conflict='user_id').execute()
+            self._changed(user_id)
+            return response.data[0] if response.data else row
+        except Exception as e:
+            print(f"Error refreshing user snapshot: {e}")
+            return row
+
+    # FUNCTIONS FOR CONVERSATION MEMORY
+
+    def get_conversation_memory(self, user_id, thread):
+        """Retrieve the rolling summary for one of a user's conversation threads"""
+        try:
+            rows = self._cached(user_id, f"memory:{thread}",
+                                lambda: self.client.table('conversation_memory').select('*')
+                                .eq('user_id', user_id).eq('thread', thread).execute().data)
+            return rows[0] if rows else None
+        except Exception as e:
+            print(f"Error getting conversation memory: {e}")
+            return None
+
+    def save_conversation_memory(self, user_id, thread, summary, turns_covered, last_turn_at):
+        """Insert or replace the rolling summary for a conversation thread"""
+        try:
+            response = self.client.table('conversation_memory').upsert({
+                'user_id': user_id,
+                'thread': thread,
+                'summary': summary,
+                'turns_covered': turns_covered,
+                'last_turn_at': last_turn_at,
+                'updated_at': datetime.now(timezone.utc).isoformat(),
+            }, on_conflict='user_id,thread').execute()
+            self._changed(user_id)
+            return response.data[0] if response.data else True
+        except Exception as e:
+            print(f"Error saving conversation memory: {e}")
+            return False
+
     # FUNCTIONS FOR EMOTIONAL DIARY
     
     def save_emotional_diary_entry(self, user_id, entry, response, mood, json_data):
@@ -143,6 +297,8 @@ class SupabaseClient:
                 'mood': mood,
                 'json_data': json_data
             }).execute()
+            self._changed(user_id)
+            self.refresh_user_snapshot(user_id, ("mood_trend",))
             return True
         except Exception as e:
             print(f"Error saving diary entry: {e}")
@@ -158,10 +314,71 @@ class SupabaseClient:
             print(f"Error getting diary history: {e}")
             return []
             
+    def get_recent_emotional_diary(self, user_id, limit=100):
+        """Retrieve a user's latest diary entries, oldest first"""
+        try:
+            rows = self._cached(user_id, f"diary_recent:{limit}",
+                                lambda: self.client.table('emotional_diary').select('*').eq('user_id', user_id)
+                                .order('created_at', desc=True).limit(limit).execute().data)
+            return list(reversed(rows))
+        except Exception as e:
+            print(f"Error getting recent diary entries: {e}")
+            return []
+
+    def get_emotional_diary_since(self, user_id, since=None, limit=50, newest=False):
+        """Retrieve a user's diary entries created after the given timestamp, oldest first.
+
+        With newest, the latest limit of them instead of the earliest.
+        """
+        def load():
+            query = self.client.table('emotional_diary').select('*').eq('user_id', user_id)
+            if since:
+                query = query.gt('created_at', since)
+            rows = query.order('created_at', desc=newest).limit(limit).execute().data
+            return list(reversed(rows)) if newest else rows
+
+        try:
+            return self._cached(user_id, f"diary_since:{since}:{limit}:{'newest' if newest else 'oldest'}", load)
+        except Exception as e:
+            print(f"Error getting recent diary entries: {e}")
+            return []
+
+    def get_emotional_diary_batch(self, after=None, limit=500, user_id=None):
+        """Retrieve diary entries in (created_at, id) order, starting after the given key"""
+        try:
+            query = self.client.table('emotional_diary').select('*')
+            if user_id:
+                query = query.eq('user_id', user_id)
+            if after:
+                created_at, entry_id = after
+                query = query.or_(f'created_at.gt."{created_at}",'
+                                  f'and(created_at.eq."{created_at}",id.gt.{entry_id})')
+            response = query.order('created_at').order('id').limit(limit).execute()
+            return response.data
+        except Exception as e:
+            print(f"Error getting diary batch: {e}")
+            return []
+
+    def upsert_emotional_diary_entries(self, entries):
+        """Write back a batch of full diary rows (used to re-score moods)"""
+        try:
+            if entries:
+                self.client.table('emotional_diary').upsert(entries).execute()
+                for user_id in {entry['user_id'] for entry in entries}:
+                    self._changed(user_id)
+                    self.refresh_user_snapshot(user_id, ("mood_trend",))
+            return True
+        except Exception as e:
+            print(f"Error updating diary entries: {e}")
+            return False
+
     def delete_emotional_diary_entry(self, entry_id):
         """Delete a specific emotional diary entry"""
         try:
-            self.client.table('emotional_diary').delete().eq('id', entry_id).execute()
+            response = self.client.table('emotional_diary').delete().eq('id', entry_id).execute()
+            for user_id in {row['user_id'] for row in response.data or []}:
+                self._changed(user_id)
+                self.refresh_user_snapshot(user_id, ("mood_trend",))
             return True
         except Exception as e:
             print(f"Error deleting diary entry: {e}")
@@ -179,7 +396,9 @@ class SupabaseClient:
                 'summary': summary,
                 'medicines': medicines
             }).execute()
-            return True
+            self._changed(user_id)
+            self.refresh_user_snapshot(user_id, ("medicines",))
+            return response.data[0] if response.data else True
         except Exception as e:
             print(f"Error saving document: {e}")
             return False
@@ -187,9 +406,9 @@ class SupabaseClient:
     def get_user_documents(self, user_id):
         """Retrieve documents for a user"""
         try:
-            response = self.client.table('user_documents').select('*').eq('user_id', user_id).order('created_at', 
-                                                                                              desc=True).execute()
-            return response.data
+            return self._cached(user_id, "documents",
+                                lambda: self.client.table('user_documents').select('*').eq('user_id', user_id)
+                                .order('created_at', desc=True).execute().data)
         except Exception as e:
             print(f"Error getting user documents: {e}")
             return []
@@ -206,7 +425,10 @@ class SupabaseClient:
     def delete_document(self, document_id):
         """Delete a document from the database"""
         try:
-            self.client.table('user_documents').delete().eq('id', document_id).execute()
+            response = self.client.table('user_documents').delete().eq('id', document_id).execute()
+            for user_id in {row['user_id'] for row in response.data or []}:
+                self._changed(user_id)
+                self.refresh_user_snapshot(user_id, ("medicines",))
             return True
         except Exception as e:
             print(f"Error deleting document: {e}")
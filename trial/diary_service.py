@@ -0,0 +1,184 @@
+# diary_service.py
+#
+# The emotional diary pipeline without any UI: the supportive response, mood analysis
+# and saving. The Streamlit diary pane (emotional_diary.py) and the HTTP API (api.py)
+# both go through answer_diary_entry / stream_diary_entry.
+
+import os
+import time
+import json
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+from database import SupabaseClient
+from llm_gateway import get_gateway, PRIORITY_DIARY
+from model_router import classify_request, get_llm
+from ollama_client import generate
+from conversation_state import conversation_states
+from conversation_memory import conversation_memory
+from health_snapshot import format_snapshot
+from emotion_classifier import get_classifier, mood_valence, CONFIDENCE_THRESHOLD
+from cancellation import GenerationHandle, run_interruptible, stream_interruptible
+
+logger = logging.getLogger(__name__)
+
+EMOTION_LLM_FALLBACK = os.getenv("EMOTION_LLM_FALLBACK", "true").lower() == "true"
+
+# Runs mood analysis alongside the response, and saves entries off the interactive path
+_diary_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="diary")
+
+
+def initialize_llm(model_name):
+    """Initialize the shared language model chosen by the router"""
+    return get_llm(model_name, temperature=0.5)
+
+
+def get_prompt_template():
+    """Get the chat prompt template for emotional diary.
+
+    The system message is the prefix Ollama's cached context is reused for, so it only
+    holds what stays put between entries; the mood trend changes with every entry.
+    """
+    return ChatPromptTemplate.from_messages([
+        ("system", "You are an empathetic listener and emotional support AI. "
+                   "Your goal is to help the user process their emotions by providing supportive, "
+                   "non-judgmental responses. Acknowledge their feelings, offer gentle insights, "
+                   "and suggest healthy coping mechanisms when appropriate. "
+                   "Keep your responses warm and conversational. "
+                   "Try to identify the user's emotional state from their entry. "
+                   "Medical conditions: {medical_conditions}."),
+        ("user", "About the user: {profile}. Current medicines: {medicines}. Recent mood trend: {mood_trend}. "
+                 "Previous conversation context: {conversation_context}. Diary entry: {entry}")
+    ])
+
+
+def get_followup_prompt_template():
+    """Get the prompt for an entry that continues from the model's cached conversation state"""
+    return ChatPromptTemplate.from_messages([
+        ("user", "About the user: {profile}. Current medicines: {medicines}. Recent mood trend: {mood_trend}. "
+                 "Diary entry: {entry}")
+    ])
+
+
+def llm_emotion_label(entry, user_id=None):
+    """Ask the LLM for a one-word emotion label; a label never needs the large model"""
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", "Analyze the following diary entry and identify the primary emotion expressed. "
+                   "Respond with just one word that best describes the emotion (e.g., happy, sad, angry, "
+                   "anxious, confused, hopeful, grateful, excited, worried, tired, frustrated, overwhelmed, "
+                   "calm, peaceful, content, neutral, etc.). Be precise and avoid general terms."),
+        ("user", "{entry}")
+    ])
+    decision = classify_request("emotion_label", entry)
+    chain = prompt | initialize_llm(decision.model) | StrOutputParser()
+    try:
+        emotion = get_gateway().run(lambda: decision.invoke(chain, {"entry": entry}),
+                                    user_id, PRIORITY_DIARY).strip().lower()
+        return emotion.split()[0] if emotion else "neutral"
+    except Exception:
+        return "neutral"
+
+
+def analyze_emotion(entry, user_id=None):
+    """Analyze the emotion in the diary entry, returning (mood, valence).
+
+    The local classifier answers in well under a millisecond; the LLM is only asked
+    for low-confidence entries when EMOTION_LLM_FALLBACK is enabled.
+    """
+    prediction = get_classifier().predict(entry)
+    if EMOTION_LLM_FALLBACK and prediction.confidence < CONFIDENCE_THRESHOLD:
+        mood = llm_emotion_label(entry, user_id)
+        return mood, mood_valence(mood)
+    return prediction.mood, prediction.valence
+
+
+def save_diary_entry(db, user_id, entry, response, mood_future):
+    """Save the entry once its mood is known; runs on a background thread"""
+    try:
+        mood, valence = mood_future.result()
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+        json_data = {
+            "entry": entry,
+            "response": response,
+            "mood": mood,
+            "valence": round(valence, 3),
+            "timestamp": timestamp
+        }
+        db.save_emotional_diary_entry(user_id, entry, response, mood, json.dumps(json_data))
+        conversation_memory.note_turn(user_id, "diary", db)
+    except Exception as e:
+        logger.error(f"Error saving diary entry for user {user_id}: {e}")
+
+
+def answer_diary_entry(entry, user_id, on_wait=None, on_token=None, on_idle=None, handle=None):
+    """Respond to a diary entry, returning the response and a future for its mood.
+
+    The mood is analyzed concurrently with the response, and the entry is saved in the
+    background once both are ready. A cancelled handle aborts the generation and
+    nothing is saved.
+    """
+    handle = handle or GenerationHandle()
+    db = SupabaseClient()
+
+    # Analyze emotional tone concurrently with the response
+    mood_future = _diary_executor.submit(analyze_emotion, entry, user_id)
+
+    # Pick the model for this entry
+    decision = classify_request("diary", entry)
+    # Profile, conditions, medicines and mood trend come from the user's snapshot row in one query
+    user_context = format_snapshot(db.get_user_snapshot(user_id))
+    system_prompt = get_prompt_template().messages[0].format(**user_context).content
+
+    # Continue from the model's cached state when we have it, otherwise send the diary memory as text
+    cached_context = conversation_states.get(user_id, "diary", decision.model, system_prompt)
+    if cached_context:
+        user_prompt = get_followup_prompt_template().format_messages(entry=entry, **user_context)[0].content
+        system = None
+    else:
+        conversation_context = conversation_memory.context_for(user_id, "diary", db)
+        user_prompt = get_prompt_template().format_messages(
+            entry=entry, conversation_context=conversation_context, **user_context)[1].content
+        system = system_prompt
+
+    # Generate the assistant response
+    def run_generation(emit_token, emit_wait):
+        return get_gateway().run(
+            lambda: decision.run(lambda: generate(decision.model, user_prompt, system=system,
+                                                  context=cached_context, on_token=emit_token, handle=handle)),
+            user_id, PRIORITY_DIARY, emit_wait, handle=handle
+        )
+
+    result = run_interruptible(run_generation, handle, on_token, on_wait, on_idle)
+    conversation_states.put(user_id, "diary", decision.model, system_prompt, result.context)
+    response = result.text
+
+    # Save off the interactive path once the mood is known
+    _diary_executor.submit(save_diary_entry, db, user_id, entry, response, mood_future)
+
+    return response, mood_future
+
+
+async def stream_diary_entry(entry, user_id, handle=None):
+    """Respond to a diary entry as an async stream of (event, data) pairs.
+
+    Yields ("wait", {"ahead", "eta"}) while queued, ("token", {"text"}) as the response is
+    generated, ("done", {"response"}) and then ("mood", {"mood", "valence"}) once the
+    analysis finishes. Closing the stream early cancels the generation.
+    """
+    handle = handle or GenerationHandle()
+
+    def run(emit_token, emit_wait):
+        return answer_diary_entry(entry, user_id, on_wait=emit_wait, on_token=emit_token, handle=handle)
+
+    async for kind, value in stream_interruptible(run, handle):
+        if kind == "token":
+            yield "token", {"text": value}
+        elif kind == "wait":
+            yield "wait", {"ahead": value[0], "eta": value[1]}
+        else:
+            response, mood_future = value
+            yield "done", {"response": response}
+            mood, valence = await asyncio.wrap_future(mood_future)
+            yield "mood", {"mood": mood, "valence": round(valence, 3)}
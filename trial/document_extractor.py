@@ -1,6 +1,4 @@
 import os
-import fitz  # PyMuPDF
-import docx
 import logging
 import openai
 from dotenv import load_dotenv
@@ -38,6 +36,7 @@ class DocumentTextExtractor:
         
         try:
             # First try direct text extraction as backup
+            import fitz  # PyMuPDF
             pdf_document = fitz.open(file_path)
             direct_text = ""
             for page_num in range(pdf_document.page_count):
@@ -96,6 +95,7 @@ class DocumentTextExtractor:
         
         try:
             # First try direct extraction as backup
+            import docx
             doc = docx.Document(file_path)
             paragraphs = []
             for paragraph in doc.paragraphs:
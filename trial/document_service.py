@@ -0,0 +1,195 @@
+# document_service.py
+#
+# Document processing without any UI: text extraction, medicine names, summary and
+# saving. Used by the upload page (document_upload.py) and the HTTP API (api.py).
+
+import os
+import re
+import json
+import asyncio
+import logging
+import tempfile
+import openai
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from document_extractor import DocumentTextExtractor
+from database import SupabaseClient
+from vector_index import index_document
+from llm_gateway import get_gateway, PRIORITY_BACKGROUND
+from single_flight import SingleFlight, submission_key, IDEMPOTENCY_WINDOW_SECONDS
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Double-clicks and reruns of the same upload share one extraction and one saved row
+document_submissions = SingleFlight("document_submission", remember_seconds=IDEMPOTENCY_WINDOW_SECONDS)
+# API uploads are extracted here. Extraction can take minutes, and on the event loop's default
+# executor it would hold the threads Starlette also uses for sync endpoints such as login
+_document_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="document")
+
+
+class DocumentProcessor:
+    def __init__(self):
+        """Initialize the document processor with necessary components"""
+        self.extractor = DocumentTextExtractor()
+        self.db_client = SupabaseClient()
+        
+        # Initialize OpenAI client for summary generation
+        self.api_key = os.getenv("OPENAI_API_KEY")
+        if not self.api_key:
+            raise ValueError("OPENAI_API_KEY environment variable is required")
+        openai.api_key = self.api_key
+
+    def extract_medicine_names(self, text, user_id=None):
+        """Extract medicine names from text using OpenAI"""
+        try:
+            response = get_gateway("openai").run(lambda: openai.chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=[
+                    {
+                        "role": "system",
+                        "content": "You are a medical expert assistant. Your task is to extract medicine names from the provided text. Return only a JSON array of medicine names without any additional text or explanation."
+                    },
+                    {
+                        "role": "user",
+                        "content": f"Extract all medicine names from the following text (return JSON array only):\n\n{text[:15000]}"
+                    }
+                ],
+                response_format={"type": "json_object"},
+                max_tokens=1000
+            ), user_id, PRIORITY_BACKGROUND)
+            
+            # Parse the JSON response
+            medicines_json = response.choices[0].message.content
+            
+            # Convert to Python structure - assuming it's a JSON object with a "medicines" array
+            try:
+                medicines_data = json.loads(medicines_json)
+                
+                # Handle different possible formats of the response
+                if isinstance(medicines_data, list):
+                    medicines = medicines_data
+                elif isinstance(medicines_data, dict) and "medicines" in medicines_data:
+                    medicines = medicines_data["medicines"]
+                elif isinstance(medicines_data, dict) and any(k for k in medicines_data.keys()):
+                    # Take the first array found in the response
+                    for k, v in medicines_data.items():
+                        if isinstance(v, list):
+                            medicines = v
+                            break
+                    else:
+                        medicines = []
+                else:
+                    medicines = []
+                
+                return list(set(medicines))  # Return unique medicines
+            except json.JSONDecodeError:
+                # Fallback to regex if JSON parsing fails
+                return self._extract_medicine_names_regex(text)
+                
+        except Exception as e:
+            logger.warning(f"Error extracting medicines with OpenAI, using patterns instead: {e}")
+            # Fallback to regex extraction
+            return self._extract_medicine_names_regex(text)
+
+    def _extract_medicine_names_regex(self, text):
+        """Fallback method to extract medicine names using regex patterns"""
+        # Common medicine name patterns
+        patterns = [
+            r'\b[A-Z][a-z]*(?:mab|nib|zumab|ximab|lizumab|olimab|zomib|tinib|ciclib|rafenib|parin)\b',  # Biological and targeted therapies
+            r'\b[A-Z][a-z]*(?:statin|sartan|pril|oxacin|mycin|cycline|cillin|dronate|dipine|febrine|conazole|zosin|vudine|lamide|thiazide|prazole|gliptin)\b',  # Common drug suffixes
+            r'\b[A-Z][a-z]*(?:xetine|triptyline|xapine|done|xone|codone|morphone|tadine|navir|vir|vastatin|prazole|pam|lam|tam|zolam|zepam|olol|alol|ipril|pril|one|ine)\b',  # More common drug patterns
+            r'\b(?:Aspirin|Tylenol|Advil|Motrin|Aleve|Paracetamol|Ibuprofen|Acetaminophen|Naproxen)\b',  # Common OTC medications
+            r'\b\d+\s?(?:mg|mcg|mL|g)\s+[A-Z][a-z]+\b'  # Dosage patterns
+        ]
+        
+        medicines = set()
+        for pattern in patterns:
+            matches = re.finditer(pattern, text)
+            for match in matches:
+                medicines.add(match.group(0))
+        
+        return list(medicines)
+
+    def generate_summary(self, text, user_id=None):
+        """Generate a summary of the document using OpenAI"""
+        if len(text) > 15000:  # If text is too long, truncate
+            text = text[:15000] + "..."
+        
+        try:
+            response = get_gateway("openai").run(lambda: openai.chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=[
+                    {
+                        "role": "system",
+                        "content": "You are a medical document summarizer. Create a concise but informative summary of the provided medical document."
+                    },
+                    {
+                        "role": "user",
+                        "content": f"Summarize the following document in a clear and structured way:\n\n{text}"
+                    }
+                ],
+                max_tokens=1000
+            ), user_id, PRIORITY_BACKGROUND)
+            
+            summary = response.choices[0].message.content
+            return summary
+        except Exception as e:
+            logger.error(f"Error generating summary with OpenAI: {e}")
+            return "Failed to generate summary. Please try again."
+
+    def process_document(self, file_name, content, user_id):
+        """Extract, summarize and save an uploaded document; returns (saved row, summary, medicines).
+
+        Submitting the same file again while it is being processed, or shortly after,
+        returns the first submission's result instead of extracting and saving it twice.
+        Raises if the document could not be processed.
+        """
+        key = submission_key(user_id, "document", file_name.encode("utf-8") + b"\0" + content)
+        (result, summary, medicines), _ = document_submissions.run(
+            key, lambda emit_token, emit_wait: self._process_content(file_name, content, user_id)
+        )
+        return result, summary, medicines
+
+    def _process_content(self, file_name, content, user_id):
+        # Save the uploaded file to a temp location
+        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file_name)[1]) as tmp_file:
+            tmp_file.write(content)
+            file_path = tmp_file.name
+
+        try:
+            # Extract text from the document
+            extracted_text = self.extractor.extract_text(file_path)
+        finally:
+            # Clean up temp file
+            os.unlink(file_path)
+
+        # Extract medicine names
+        medicines = self.extract_medicine_names(extracted_text, user_id)
+
+        # Generate summary
+        summary = self.generate_summary(extracted_text, user_id)
+
+        # Save to database
+        result = self.db_client.save_document(
+            user_id=user_id,
+            file_name=file_name,
+            extracted_text=extracted_text[:100000],  # Limit text length for DB
+            summary=summary,
+            medicines=medicines
+        )
+        if not result:
+            # Raising keeps a failed save out of the idempotency window so it can be retried
+            raise RuntimeError("the document could not be saved")
+        index_document(user_id, result)
+
+        return result, summary, medicines
+
+
+async def process_document(file_name, content, user_id):
+    """Process an uploaded document on a worker thread; see DocumentProcessor.process_document"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _document_executor, lambda: DocumentProcessor().process_document(file_name, content, user_id))
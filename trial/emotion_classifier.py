@@ -0,0 +1,273 @@
+# emotion_classifier.py
+#
+# Local mood classifier for diary entries: an emotion lexicon seeds a linear model over
+# hashed word n-grams, scored with NumPy. Optionally refined on already-labelled entries.
+#
+#   python emotion_classifier.py --train              # fit on existing diary moods and save the model
+#   python emotion_classifier.py --backfill           # re-score every diary entry in chunks
+#   python emotion_classifier.py --backfill --user <id> --chunk-size 200 --dry-run
+
+import os
+import json
+import logging
+import argparse
+import threading
+from collections import namedtuple
+import numpy as np
+from dotenv import load_dotenv
+from text_features import hashed_features, hashed_feature_batch, hash_token
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+MODEL_PATH = os.getenv("EMOTION_MODEL_PATH", os.path.join(".cache", "emotion_model.npz"))
+# Below this confidence the LLM may be asked instead, if the fallback is enabled
+CONFIDENCE_THRESHOLD = float(os.getenv("EMOTION_CONFIDENCE_THRESHOLD", "0.4"))
+FEATURE_DIM = 2 ** 16
+
+# Mood scale used by the charts: 1 (negative) to 5 (positive)
+MOOD_VALUES = {
+    "happy": 5, "excited": 5, "joyful": 5, "proud": 5,
+    "content": 4, "peaceful": 4, "grateful": 4, "hopeful": 4,
+    "calm": 3, "neutral": 3, "reflective": 3,
+    "confused": 2, "worried": 2, "anxious": 2, "tired": 2,
+    "sad": 1, "angry": 1, "frustrated": 1, "lonely": 1, "overwhelmed": 1, "stressed": 1, "disappointed": 1,
+}
+
+MOOD_LABELS = list(MOOD_VALUES)
+
+LEXICON = {
+    "happy": ["happy", "glad", "great", "good day", "wonderful", "joy", "smile", "smiling", "fun",
+              "awesome", "delighted", "cheerful", "pleased", "amazing"],
+    "excited": ["excited", "thrilled", "can't wait", "eager", "pumped"],
+    "joyful": ["joyful", "overjoyed", "ecstatic", "elated"],
+    "proud": ["proud", "accomplished", "achieved", "nailed"],
+    "content": ["content", "satisfied", "okay", "fine", "comfortable"],
+    "peaceful": ["peaceful", "serene", "relaxed", "relaxing"],
+    "grateful": ["grateful", "thankful", "appreciate", "blessed"],
+    "hopeful": ["hopeful", "hope", "optimistic", "looking forward"],
+    "calm": ["calm", "quiet", "steady", "settled"],
+    "neutral": ["normal", "usual", "ordinary", "nothing much"],
+    "reflective": ["reflect", "reflecting", "wondering", "realized", "pondering", "thinking about"],
+    "confused": ["confused", "unsure", "uncertain", "don't understand", "lost"],
+    "worried": ["worried", "worry", "concerned", "afraid", "scared", "fear"],
+    "anxious": ["anxious", "anxiety", "nervous", "panic", "uneasy", "restless", "tense"],
+    "tired": ["tired", "exhausted", "sleepy", "drained", "fatigue", "worn out"],
+    "sad": ["sad", "unhappy", "cry", "crying", "cried", "miserable", "depressed", "heartbroken", "upset"],
+    "angry": ["angry", "mad", "furious", "rage", "hate"],
+    "frustrated": ["frustrated", "annoyed", "irritated", "fed up", "stuck"],
+    "lonely": ["lonely", "alone", "isolated", "left out", "nobody"],
+    "overwhelmed": ["overwhelmed", "too much", "swamped", "drowning", "can't cope"],
+    "stressed": ["stressed", "stress", "pressure", "deadline", "burnout", "burned out"],
+    "disappointed": ["disappointed", "let down", "regret", "failed"],
+}
+
+NEGATIONS = ["not", "never", "no", "isn't", "wasn't", "don't", "didn't"]
+LEXICON_WEIGHT = 4.0
+
+EmotionPrediction = namedtuple("EmotionPrediction", ["mood", "valence", "confidence"])
+
+
+def mood_valence(mood):
+    """Valence in [-1, 1] for a mood label, 0 for unknown labels"""
+    return (MOOD_VALUES.get((mood or "").lower(), 3) - 3) / 2.0
+
+
+class EmotionClassifier:
+    """Softmax-linear classifier over hashed unigrams and bigrams"""
+
+    def __init__(self, weights=None, bias=None, dim=FEATURE_DIM):
+        self.dim = dim
+        self.labels = MOOD_LABELS
+        self.valences = np.array([mood_valence(m) for m in self.labels], dtype=np.float32)
+        if weights is None:
+            weights, bias = self.lexicon_weights()
+        self.weights = weights
+        self.bias = bias
+
+    def lexicon_weights(self):
+        """Initial weights: each lexicon phrase votes for its mood, a negated word votes against it"""
+        weights = np.zeros((self.dim, len(self.labels)), dtype=np.float32)
+        bias = np.zeros(len(self.labels), dtype=np.float32)
+        bias[self.labels.index("neutral")] = 0.5
+        for mood, phrases in LEXICON.items():
+            label = self.labels.index(mood)
+            for phrase in phrases:
+                weights[hash_token(phrase, self.dim), label] += LEXICON_WEIGHT
+                if " " not in phrase:
+                    for negation in NEGATIONS:
+                        weights[hash_token(f"{negation} {phrase}", self.dim), label] -= LEXICON_WEIGHT
+        return weights, bias
+
+    def _softmax(self, scores):
+        scores = scores - scores.max(axis=-1, keepdims=True)
+        exp = np.exp(scores)
+        return exp / exp.sum(axis=-1, keepdims=True)
+
+    def _prediction(self, probs, evidence=True):
+        best = int(np.argmax(probs))
+        # Without a single feature the model knows, the bias alone would give the entry a slight mood
+        valence = float(probs @ self.valences) if evidence else 0.0
+        return EmotionPrediction(self.labels[best], valence, float(probs[best]))
+
+    def predict(self, text):
+        """Mood label, valence in [-1, 1] and confidence for one entry"""
+        indices, counts = hashed_features(text, self.dim)
+        evidence = counts @ self.weights[indices]
+        return self._prediction(self._softmax(evidence + self.bias), bool(np.any(evidence)))
+
+    def _scores_batch(self, texts):
+        """Feature scores without the bias, one row per text"""
+        rows, indices, counts = hashed_feature_batch(texts, self.dim)
+        scores = np.zeros((len(texts), len(self.labels)), dtype=np.float32)
+        np.add.at(scores, rows, self.weights[indices] * counts[:, None])
+        return scores
+
+    def predict_proba_batch(self, texts):
+        return self._softmax(self._scores_batch(texts) + self.bias)
+
+    def predict_batch(self, texts):
+        """Vectorized predictions for many entries"""
+        evidence = self._scores_batch(texts)
+        probs = self._softmax(evidence + self.bias)
+        return [self._prediction(p, bool(np.any(e))) for p, e in zip(probs, evidence)]
+
+    def fit(self, texts, moods, epochs=5, learning_rate=0.2, batch_size=256):
+        """Refine the weights on labelled entries with mini-batch softmax regression"""
+        pairs = [(t, self.labels.index(m)) for t, m in zip(texts, moods) if m in self.labels and t]
+        if not pairs:
+            return 0
+        rng = np.random.default_rng(0)
+        for _ in range(epochs):
+            order = rng.permutation(len(pairs))
+            for start in range(0, len(order), batch_size):
+                batch = [pairs[i] for i in order[start:start + batch_size]]
+                probs = self.predict_proba_batch([t for t, _ in batch])
+                targets = np.array([y for _, y in batch])
+                probs[np.arange(len(batch)), targets] -= 1.0
+                probs /= len(batch)
+                rows, indices, counts = hashed_feature_batch([t for t, _ in batch], self.dim)
+                np.add.at(self.weights, indices, -learning_rate * counts[:, None] * probs[rows])
+                self.bias -= learning_rate * probs.sum(axis=0)
+        return len(pairs)
+
+    def save(self, path=MODEL_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez_compressed(path, weights=self.weights, bias=self.bias, labels=np.array(self.labels))
+
+    @classmethod
+    def load(cls, path=MODEL_PATH):
+        """Load a trained model, or build the lexicon-only model if none has been saved"""
+        if os.path.exists(path):
+            data = np.load(path)
+            if list(data["labels"]) == MOOD_LABELS:
+                return cls(data["weights"], data["bias"])
+            logger.warning("Saved emotion model has different labels, using the lexicon model")
+        return cls()
+
+
+_classifier = None
+_classifier_lock = threading.Lock()
+
+
+def get_classifier():
+    """Process-wide classifier, loaded on first use"""
+    global _classifier
+    with _classifier_lock:
+        if _classifier is None:
+            _classifier = EmotionClassifier.load()
+        return _classifier
+
+
+def parse_json_data(value):
+    """json_data has been stored both as a JSON object and as a JSON-encoded string"""
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return {}
+    return value if isinstance(value, dict) else {}
+
+
+def backfill_moods(db, user_id=None, chunk_size=500, fallback=None, dry_run=False):
+    """Re-score historical diary entries in chunks.
+
+    fallback, if given, is called with the entry text for low-confidence predictions
+    and should return a mood label (e.g. the LLM labeller). Without it, entries the
+    classifier isn't confident about keep their stored mood and valence.
+    """
+    classifier = get_classifier()
+    after = None
+    scanned = changed = 0
+    while True:
+        rows = db.get_emotional_diary_batch(after=after, limit=chunk_size, user_id=user_id)
+        if not rows:
+            break
+        updates = []
+        for row, prediction in zip(rows, classifier.predict_batch([r['entry'] for r in rows])):
+            mood, valence = prediction.mood, prediction.valence
+            if prediction.confidence < CONFIDENCE_THRESHOLD:
+                if not fallback:
+                    continue
+                mood = fallback(row['entry'])
+                valence = mood_valence(mood)
+            json_data = parse_json_data(row.get('json_data'))
+            json_data.update({"mood": mood, "valence": round(valence, 3),
+                              "confidence": round(prediction.confidence, 3)})
+            if mood != row.get('mood'):
+                changed += 1
+            updates.append(dict(row, mood=mood, json_data=json_data))
+        if updates and not dry_run:
+            db.upsert_emotional_diary_entries(updates)
+        scanned += len(rows)
+        after = (rows[-1]['created_at'], rows[-1]['id'])
+        logger.info(f"Backfill: scanned {scanned} entries, {changed} moods changed")
+    return scanned, changed
+
+
+def train_from_history(db, chunk_size=1000):
+    """Fit the classifier on existing LLM-labelled diary entries and save it"""
+    texts, moods = [], []
+    after = None
+    while True:
+        rows = db.get_emotional_diary_batch(after=after, limit=chunk_size)
+        if not rows:
+            break
+        texts.extend(r['entry'] for r in rows)
+        moods.extend((r.get('mood') or '').lower() for r in rows)
+        after = (rows[-1]['created_at'], rows[-1]['id'])
+    classifier = get_classifier()
+    count = classifier.fit(texts, moods)
+    classifier.save()
+    return count
+
+
+def main():
+    from database import SupabaseClient
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Train the local emotion classifier or re-score diary entries")
+    parser.add_argument("--train", action="store_true", help="fit on existing diary moods and save the model")
+    parser.add_argument("--backfill", action="store_true", help="re-score diary entries with the classifier")
+    parser.add_argument("--user", help="only re-score this user's entries")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--llm-fallback", action="store_true", help="ask the LLM for low-confidence entries")
+    parser.add_argument("--dry-run", action="store_true", help="score without writing")
+    args = parser.parse_args()
+
+    db = SupabaseClient()
+    if args.train:
+        print(f"Trained on {train_from_history(db)} labelled entries, saved to {MODEL_PATH}")
+    if args.backfill:
+        fallback = None
+        if args.llm_fallback:
+            from diary_service import llm_emotion_label
+            fallback = llm_emotion_label
+        scanned, changed = backfill_moods(db, args.user, args.chunk_size, fallback, args.dry_run)
+        print(f"Scanned {scanned} entries, {changed} moods {'would change' if args.dry_run else 'changed'}")
+
+
+if __name__ == "__main__":
+    main()
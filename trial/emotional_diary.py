@@ -1,135 +1,93 @@
-from langchain_community.llms import Ollama
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
 import streamlit as st
 from database import SupabaseClient
-import time
-import json
-
-
-@st.cache_resource(show_spinner="Loading AI model...")
-def initialize_llm():
-    """Initialize and cache the language model"""
-    return Ollama(model="tinyllama", temperature=0.5)
-
-
-def get_prompt_template():
-    """Get the chat prompt template for emotional diary"""
-    return ChatPromptTemplate.from_messages([
-        ("system", "You are an empathetic listener and emotional support AI. "
-                   "Your goal is to help the user process their emotions by providing supportive, "
-                   "non-judgmental responses. Acknowledge their feelings, offer gentle insights, "
-                   "and suggest healthy coping mechanisms when appropriate. "
-                   "Keep your responses warm and conversational. "
-                   "Try to identify the user's emotional state from their entry."),
-        ("user", "Previous conversation context: {conversation_context}. Diary entry: {entry}")
-    ])
-
-
-def analyze_emotion(llm, entry):
-    """Analyze the emotion in the diary entry"""
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", "Analyze the following diary entry and identify the primary emotion expressed. "
-                   "Respond with just one word that best describes the emotion (e.g., happy, sad, angry, "
-                   "anxious, confused, hopeful, grateful, excited, worried, tired, frustrated, overwhelmed, "
-                   "calm, peaceful, content, neutral, etc.). Be precise and avoid general terms."),
-        ("user", "{entry}")
-    ])
-    chain = prompt | llm | StrOutputParser()
-    try:
-        emotion = chain.invoke({"entry": entry}).strip().lower()
-        return emotion.split()[0] if emotion else "neutral"
-    except Exception:
-        return "neutral"
-
-
-def get_conversation_context(conversation_history, max_context=3):
-    """Format the recent conversation history as context"""
-    if not conversation_history:
-        return "No previous context"
-    recent_history = conversation_history[-max_context:]
-    return "\n".join([
-        f"User entry: {e['entry']}\nAssistant response: {e['response']}\n"
-        for e in recent_history
-    ])
-
-
-def process_diary_entry(entry, user_id):
-    """Process the diary entry and get a response from the language model"""
-    llm = initialize_llm()
-    db = SupabaseClient()
+from llm_gateway import queue_status_reporter
+from cancellation import GenerationCancelled
+from generation_session import start_generation, finish_generation, StreamingPlaceholder
+from session_memory import session_memory, cap_buffer, SESSION_BUFFER_MAX_MESSAGES
+from diary_service import answer_diary_entry
+from voice_input import voice_prompt
 
-    # Get past conversation context
-    conversation_history = db.get_emotional_diary_history(user_id)
-    conversation_context = get_conversation_context(conversation_history)
-
-    # Set up the main response chain
-    prompt = get_prompt_template()
-    output_parser = StrOutputParser()
-    chain = prompt | llm | output_parser
-
-    # Generate the assistant response
-    response = chain.invoke({
-        "entry": entry,
-        "conversation_context": conversation_context
-    })
-
-    # Analyze emotional tone
-    mood = analyze_emotion(llm, entry)
-
-    # Prepare and save the response
-    timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-    json_data = {
-        "entry": entry,
-        "response": response,
-        "mood": mood,
-        "timestamp": timestamp
-    }
 
-    db.save_emotional_diary_entry(user_id, entry, response, mood, json.dumps(json_data))
+def process_diary_entry(entry, user_id, on_wait=None, on_token=None, on_idle=None, handle=None):
+    """Respond to the entry through the diary service and add it to the session's messages.
+
+    Returns the response, a future for the mood and the session message the mood belongs to.
+    """
+    response, mood_future = answer_diary_entry(entry, user_id, on_wait, on_token, on_idle, handle)
 
     # Update session state
-    st.session_state.diary_messages.append({"role": "user", "content": entry})
-    st.session_state.diary_messages.append({"role": "assistant", "content": response})
+    assistant_message = {"role": "assistant", "content": response, "mood": None}
+    messages = st.session_state.setdefault('diary_messages', [])
+    messages.extend([{"role": "user", "content": entry}, assistant_message])
+    cap_buffer(messages)
 
-    return response, mood
+    return response, mood_future, assistant_message
 
 
+@st.fragment
 def display_diary_interface():
-    """Display the interactive diary interface"""
-    if "diary_messages" not in st.session_state:
-        st.session_state.diary_messages = []
+    """Display the interactive diary interface; submitting an entry reruns only this pane"""
+    session_memory.touch()
+    load_diary_history(st.session_state['user_id'])
 
     # Show chat history
     for msg in st.session_state.diary_messages:
         avatar = "📝" if msg["role"] == "user" else "🧠"
-        st.chat_message(msg["role"], avatar=avatar).write(msg["content"])
-
-    # User input
-    if entry := st.chat_input("Write your thoughts and feelings here..."):
+        with st.chat_message(msg["role"], avatar=avatar):
+            st.write(msg["content"])
+            if msg.get("mood"):
+                st.caption(mood_badge(msg["mood"]))
+
+    # User input, typed or spoken; a spoken entry is submitted as soon as it is transcribed
+    spoken = voice_prompt("diary_voice", "🎤 Speak your entry")
+    if entry := st.chat_input("Write your thoughts and feelings here...") or spoken:
         st.chat_message("user", avatar="📝").write(entry)
         with st.chat_message("assistant", avatar="🧠"):
             thinking = st.empty()
-            for i in range(3):
-                thinking.write("Thinking" + "." * (i + 1))
-                time.sleep(0.3)
-
-            with st.spinner("Processing..."):
-                response, mood = process_diary_entry(entry, st.session_state['user_id'])
+            thinking.write("Thinking...")
+            stream = StreamingPlaceholder(thinking)
+
+            handle = start_generation()
+            try:
+                with st.spinner("Processing..."):
+                    response, mood_future, message = process_diary_entry(
+                        entry, st.session_state['user_id'], on_wait=queue_status_reporter(thinking),
+                        on_token=stream.on_token, on_idle=stream.on_idle, handle=handle)
+            except GenerationCancelled:
+                thinking.info("Response cancelled.")
+                return
+            finally:
+                finish_generation(handle)
+            # Show the response right away; the mood badge fills in when the analysis finishes
             thinking.write(response)
+            badge = st.empty()
+            badge.caption("Analyzing mood...")
+            message["mood"], _ = mood_future.result()
+            badge.caption(mood_badge(message["mood"]))
+
+
+def fetch_diary_history(user_id):
+    """Session state values for the latest diary entries; doesn't touch session state"""
+    messages = []
+    history = SupabaseClient().get_recent_emotional_diary(user_id, limit=SESSION_BUFFER_MAX_MESSAGES // 2)
+    for e in history or []:
+        messages.append({"role": "user", "content": e['entry']})
+        messages.append({"role": "assistant", "content": e['response'], "mood": e.get('mood')})
+    return {"diary_messages": messages}
 
 
 def load_diary_history(user_id):
-    """Load diary history from database into session state"""
+    """Load the latest diary entries from the database into session state"""
     if "diary_messages" not in st.session_state:
-        st.session_state.diary_messages = []
+        st.session_state.update(fetch_diary_history(user_id))
+
 
-        db = SupabaseClient()
-        history = db.get_emotional_diary_history(user_id)
-        if history:
-            for e in history:
-                st.session_state.diary_messages.append({"role": "user", "content": e['entry']})
-                st.session_state.diary_messages.append({"role": "assistant", "content": e['response']})
+def prefetch_diary_page(user_id):
+    """Background prefetch for the diary page: the diary buffer, and the snapshot and memory an entry reads"""
+    db = SupabaseClient()
+    db.get_user_snapshot(user_id)
+    db.get_conversation_memory(user_id, "diary")
+    return fetch_diary_history(user_id)
 
 
 def display_diary_history(user_id):
@@ -161,6 +119,11 @@ def display_diary_history(user_id):
                 st.markdown("---")
 
 
+def mood_badge(mood):
+    """Short label shown under a diary response"""
+    return f"{get_mood_emoji(mood)} Mood: {mood}"
+
+
 def get_mood_emoji(mood):
     """Convert mood to emoji"""
     mood_map = {
@@ -1,8 +1,18 @@
 # emotional_diary_page.py
 
 import streamlit as st
-from emotional_diary import display_diary_interface, load_diary_history, display_diary_history
+from emotional_diary import display_diary_interface, display_diary_history
 from mood_visualizations import display_mood_visualizations
+from conversation_state import conversation_states
+from generation_session import cancel_active_generation
+from router import back_to_dashboard_button
+
+
+def clear_diary_session():
+    """Clear Current Session callback: empty the diary view and drop the model's cached conversation"""
+    cancel_active_generation()
+    st.session_state.diary_messages = []
+    conversation_states.reset(st.session_state['user_id'], "diary")
 
 
 def display_emotional_diary():
@@ -14,11 +24,7 @@ def display_emotional_diary():
     """)
     
     # Button to navigate back to dashboard
-    col1, col2 = st.columns([5, 1])
-    with col2:
-        if st.button("Back to Dashboard", use_container_width=True):
-            st.session_state['current_page'] = 'dashboard'
-            st.rerun()
+    back_to_dashboard_button()
     
     # Add diary sidebar options
     with st.sidebar:
@@ -30,12 +36,8 @@ def display_emotional_diary():
             key="diary_view_mode"
         )
 
-        if view_mode == "Diary Interface" and st.button("Clear Current Session", use_container_width=True):
-            st.session_state.diary_messages = []
-            st.rerun()
-    
-    # Load diary history if not already loaded
-    load_diary_history(st.session_state['user_id'])
+        if view_mode == "Diary Interface":
+            st.button("Clear Current Session", use_container_width=True, on_click=clear_diary_session)
     
     # Display based on selected view mode
     if view_mode == "Diary Interface":
@@ -0,0 +1,151 @@
+# followup_suggestions.py
+
+import os
+import re
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from llm_gateway import get_gateway
+from cancellation import GenerationHandle, GenerationCancelled
+from metrics import increment
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+FOLLOWUP_SUGGESTIONS_ENABLED = os.getenv("FOLLOWUP_SUGGESTIONS", "false").lower() == "true"
+FOLLOWUP_COUNT = int(os.getenv("FOLLOWUP_COUNT", "3"))
+FOLLOWUP_TTL_SECONDS = int(os.getenv("FOLLOWUP_TTL_SECONDS", "600"))
+# Give up waiting for Ollama to go idle after this long
+FOLLOWUP_IDLE_WAIT_SECONDS = int(os.getenv("FOLLOWUP_IDLE_WAIT_SECONDS", "120"))
+
+# One speculative job at a time, so it never competes with itself for Ollama
+_followup_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="followups")
+
+
+class Suggestion:
+    """A predicted follow-up question with its pre-generated answer"""
+
+    def __init__(self, question, answer):
+        self.question = question
+        self.answer = answer
+
+
+def parse_questions(text, limit=FOLLOWUP_COUNT):
+    """Pull questions out of a model's list output, dropping numbering and bullets"""
+    questions = []
+    for line in (text or "").splitlines():
+        line = re.sub(r"^\s*(?:\d+[.)]|[-*•])\s*", "", line).strip().strip('"')
+        if len(line.split()) >= 3 and line.endswith("?") and line not in questions:
+            questions.append(line)
+    return questions[:limit]
+
+
+class FollowupSuggestions:
+    """Per-user store of speculative follow-ups, produced only while Ollama has nothing else to do.
+
+    Every model call runs at speculative priority, the gateway's lowest, and is
+    cancelled as soon as any other request (interactive, diary or background work
+    such as document summaries and embeddings) is running or queued, so speculation
+    never delays real work by more than one poll.
+    """
+
+    def __init__(self, ttl=FOLLOWUP_TTL_SECONDS, poll_interval=0.25):
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self._entries = {}
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        """Suggestions for the user's latest answer that haven't expired"""
+        with self._lock:
+            entry = self._entries.get(str(user_id))
+            if not entry or time.time() - entry[0] > self.ttl:
+                self._entries.pop(str(user_id), None)
+                return []
+            return list(entry[1])
+
+    def pending(self, user_id):
+        with self._lock:
+            return str(user_id) in self._jobs
+
+    def discard(self, user_id):
+        """Drop the user's suggestions and stop any speculation still running for them"""
+        with self._lock:
+            self._entries.pop(str(user_id), None)
+            handle = self._jobs.pop(str(user_id), None)
+        if handle:
+            handle.cancel()
+
+    def schedule(self, user_id, predict, answer):
+        """Queue speculation for a user.
+
+        predict(handle) returns the likely follow-up questions and answer(question, handle)
+        returns the answer text; both must pass the handle on to their model calls and
+        run them at PRIORITY_SPECULATIVE.
+        """
+        if not FOLLOWUP_SUGGESTIONS_ENABLED:
+            return
+        self.discard(user_id)
+        handle = GenerationHandle()
+        with self._lock:
+            self._jobs[str(user_id)] = handle
+        _followup_executor.submit(self._run, str(user_id), handle, predict, answer)
+
+    def _wait_for_idle(self, handle):
+        gateway = get_gateway()
+        deadline = time.monotonic() + FOLLOWUP_IDLE_WAIT_SECONDS
+        while gateway.has_non_speculative_load():
+            handle.check()
+            if time.monotonic() > deadline:
+                raise GenerationCancelled()
+            time.sleep(self.poll_interval)
+
+    def _yielding(self, fn, handle):
+        """Run fn() while a watcher cancels the handle as soon as other work appears"""
+        gateway = get_gateway()
+        done = threading.Event()
+
+        def watch():
+            while not done.wait(self.poll_interval):
+                if gateway.has_non_speculative_load():
+                    increment("followups.preempted")
+                    handle.cancel()
+                    return
+
+        watcher = threading.Thread(target=watch, name="followups-watch", daemon=True)
+        watcher.start()
+        try:
+            return fn()
+        finally:
+            done.set()
+
+    def _run(self, user_id, handle, predict, answer):
+        suggestions = []
+        try:
+            self._wait_for_idle(handle)
+            questions = self._yielding(lambda: predict(handle), handle)
+            for question in questions:
+                self._wait_for_idle(handle)
+                text = self._yielding(lambda: answer(question, handle), handle)
+                if text:
+                    suggestions.append(Suggestion(question, text))
+            increment("followups.completed")
+        except GenerationCancelled:
+            # Keep whatever was finished before other work appeared
+            pass
+        except Exception as e:
+            logger.warning(f"Follow-up speculation failed for user {user_id}: {e}")
+        finally:
+            with self._lock:
+                if self._jobs.get(user_id) is handle:
+                    del self._jobs[user_id]
+                    if suggestions:
+                        self._entries[user_id] = (time.time(), suggestions)
+
+
+followup_suggestions = FollowupSuggestions()
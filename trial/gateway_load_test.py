@@ -0,0 +1,178 @@
+# gateway_load_test.py
+#
+# Load test for the LLM gateway against a stub Ollama server.
+#
+#   python gateway_load_test.py --users 12 --requests 4 --concurrency 2
+#   python gateway_load_test.py --direct        # same load without the gateway, for comparison
+
+import argparse
+import json
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from langchain_community.llms import Ollama
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+from llm_gateway import LLMGateway, PRIORITY_INTERACTIVE, PRIORITY_DIARY, PRIORITY_BACKGROUND, PRIORITY_NAMES
+
+
+class StubOllamaState:
+    """Shared counters for the stub server"""
+
+    def __init__(self, tokens=20, token_time=0.02):
+        self.tokens = tokens
+        self.token_time = token_time
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+        self.served = 0
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    """Minimal /api/generate endpoint that streams NDJSON like Ollama.
+
+    Each token takes token_time multiplied by the number of concurrent generations,
+    which mimics a single CPU/GPU being shared between parallel requests.
+    """
+
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json({"models": [{"name": "stub"}]})
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        if self.path != "/api/generate":
+            self.send_error(404)
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        state = self.state
+
+        with state.lock:
+            state.active += 1
+            state.peak = max(state.peak, state.active)
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.end_headers()
+            for i in range(state.tokens):
+                with state.lock:
+                    active = state.active
+                time.sleep(state.token_time * active)
+                chunk = {"model": request.get("model"), "response": f"tok{i} ", "done": False}
+                self.wfile.write((json.dumps(chunk) + "\n").encode("utf-8"))
+                self.wfile.flush()
+            final = {"model": request.get("model"), "response": "", "done": True,
+                     "context": list(range(state.tokens))}
+            self.wfile.write((json.dumps(final) + "\n").encode("utf-8"))
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with state.lock:
+                state.active -= 1
+                state.served += 1
+
+
+def start_stub_server(tokens=20, token_time=0.02):
+    """Start the stub Ollama server on a free port, returning (server, state, base_url)"""
+    state = StubOllamaState(tokens, token_time)
+    handler = type("BoundStubOllamaHandler", (StubOllamaHandler,), {"state": state})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_load(args):
+    server, state, base_url = start_stub_server(args.tokens, args.token_time)
+    chain = (ChatPromptTemplate.from_messages([("user", "{question}")])
+             | Ollama(model="stub", base_url=base_url)
+             | StrOutputParser())
+    gateway = LLMGateway("load-test", args.concurrency)
+
+    # Each user sends a burst; the first user is a heavy user that sends three times as much
+    jobs = []
+    priorities = [PRIORITY_INTERACTIVE, PRIORITY_DIARY, PRIORITY_BACKGROUND]
+    rng = random.Random(args.seed)
+    for user in range(args.users):
+        count = args.requests * (3 if user == 0 else 1)
+        for _ in range(count):
+            jobs.append((f"user-{user}", rng.choices(priorities, weights=[6, 3, 1])[0]))
+    rng.shuffle(jobs)
+
+    results = []
+    results_lock = threading.Lock()
+
+    def worker(job):
+        user_id, priority = job
+        started = time.monotonic()
+        if args.direct:
+            chain.invoke({"question": "hello"})
+        else:
+            gateway.invoke(chain, {"question": "hello"}, user_id, priority)
+        with results_lock:
+            results.append((user_id, priority, time.monotonic() - started))
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+        list(pool.map(worker, jobs))
+    elapsed = time.monotonic() - started
+    server.shutdown()
+
+    print(f"Mode: {'direct' if args.direct else f'gateway (concurrency {args.concurrency})'}")
+    print(f"Requests: {len(results)} in {elapsed:.2f}s, stub peak concurrency {state.peak}")
+    for priority, name in PRIORITY_NAMES.items():
+        latencies = [r[2] for r in results if r[1] == priority]
+        if latencies:
+            print(f"  {name:<12} n={len(latencies):<4} p50={percentile(latencies, 50):6.2f}s "
+                  f"p95={percentile(latencies, 95):6.2f}s")
+    interactive = [r for r in results if r[1] == PRIORITY_INTERACTIVE]
+    heavy = [r[2] for r in interactive if r[0] == "user-0"]
+    light = [r[2] for r in interactive if r[0] != "user-0"]
+    if heavy and light:
+        print(f"  fairness: heavy user interactive mean {statistics.mean(heavy):.2f}s, "
+              f"other users {statistics.mean(light):.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the LLM gateway against a stub Ollama server")
+    parser.add_argument("--users", type=int, default=12)
+    parser.add_argument("--requests", type=int, default=4, help="requests per user")
+    parser.add_argument("--concurrency", type=int, default=2, help="gateway slots")
+    parser.add_argument("--tokens", type=int, default=20, help="tokens per stub response")
+    parser.add_argument("--token-time", type=float, default=0.02, help="seconds per token with no contention")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--direct", action="store_true", help="bypass the gateway")
+    run_load(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# generation_session.py
+
+import time
+import streamlit as st
+from cancellation import GenerationHandle
+
+
+def start_generation(key=None):
+    """Cancel whatever this session was still generating and register a new handle.
+
+    A resubmission with the same key keeps the in-flight generation and joins it instead.
+    """
+    active = st.session_state.get('active_generation')
+    if key is not None and active is not None and not active.cancelled and active.key == key:
+        return active
+    cancel_active_generation()
+    handle = GenerationHandle(key)
+    st.session_state['active_generation'] = handle
+    return handle
+
+
+def cancel_active_generation():
+    """Abort the session's in-flight generation, if any (navigation, clear, new submission)"""
+    handle = st.session_state.get('active_generation')
+    if handle is not None:
+        handle.cancel()
+        st.session_state['active_generation'] = None
+
+
+def finish_generation(handle):
+    """Forget the handle once its generation has completed"""
+    if st.session_state.get('active_generation') is handle:
+        st.session_state['active_generation'] = None
+
+
+class StreamingPlaceholder:
+    """Renders streamed tokens into a placeholder, throttled to keep websocket traffic low"""
+
+    def __init__(self, placeholder, idle_text="Thinking...", min_interval=0.1):
+        self.placeholder = placeholder
+        self.idle_text = idle_text
+        self.min_interval = min_interval
+        self.text = ""
+        self._last_render = 0.0
+
+    def on_token(self, token):
+        self.text += token
+        now = time.monotonic()
+        if now - self._last_render >= self.min_interval:
+            self._last_render = now
+            self.placeholder.markdown(self.text + " ▌")
+
+    def on_idle(self):
+        """Heartbeat while nothing new has arrived; also lets Streamlit stop the script here"""
+        self.placeholder.markdown(self.text + " ▌" if self.text else self.idle_text)
@@ -0,0 +1,84 @@
+# health_snapshot.py
+#
+# Builds the sections of the per-user snapshot row (user_snapshot) that chat and diary
+# prompts read in a single query. SupabaseClient refreshes the affected section on
+# every write to the underlying tables.
+
+from emotion_classifier import parse_json_data, mood_valence
+
+SNAPSHOT_SECTIONS = ("profile", "conditions", "medicines", "mood_trend")
+MAX_MEDICINES = 20
+MOOD_TREND_ENTRIES = 14
+
+
+def profile_basics(user):
+    """The profile fields worth putting in a prompt"""
+    if not user:
+        return {}
+    return {key: user.get(key) for key in ("full_name", "age", "gender") if user.get(key) is not None}
+
+
+def current_medicines(documents, limit=MAX_MEDICINES):
+    """Medicines found in the user's documents, most recently uploaded first, without duplicates"""
+    medicines = {}
+    for document in documents:
+        for name in document.get("medicines") or []:
+            if isinstance(name, str) and name.strip():
+                medicines.setdefault(name.strip().lower(), name.strip())
+    return list(medicines.values())[:limit]
+
+
+def mood_trend(entries):
+    """Summary of the latest diary moods; entries are newest first"""
+    if not entries:
+        return {}
+    valences = []
+    moods = {}
+    for entry in entries:
+        data = parse_json_data(entry.get("json_data"))
+        valence = data.get("valence")
+        valences.append(float(valence) if isinstance(valence, (int, float)) else mood_valence(entry.get("mood")))
+        if entry.get("mood"):
+            moods[entry["mood"]] = moods.get(entry["mood"], 0) + 1
+
+    half = len(valences) // 2
+    direction = "steady"
+    if half:
+        change = sum(valences[:half]) / half - sum(valences[-half:]) / half
+        if change > 0.2:
+            direction = "improving"
+        elif change < -0.2:
+            direction = "declining"
+    return {
+        "latest": entries[0].get("mood"),
+        "most_common": max(moods, key=moods.get) if moods else None,
+        "average_valence": round(sum(valences) / len(valences), 3),
+        "direction": direction,
+        "entries": len(entries),
+        "since": (entries[-1].get("created_at") or "").split("T")[0],
+    }
+
+
+def format_conditions(snapshot):
+    conditions = (snapshot or {}).get("conditions") or []
+    return ", ".join(conditions) if conditions else "None specified"
+
+
+def format_snapshot(snapshot):
+    """Prompt-ready strings for every snapshot section"""
+    snapshot = snapshot or {}
+    profile = snapshot.get("profile") or {}
+    profile_text = ", ".join(f"{key.replace('_', ' ')}: {value}" for key, value in profile.items())
+    medicines = snapshot.get("medicines") or []
+    trend = snapshot.get("mood_trend") or {}
+    if trend:
+        mood_text = (f"mostly {trend.get('most_common') or 'unknown'}, latest {trend.get('latest') or 'unknown'}, "
+                     f"{trend.get('direction')} over the last {trend.get('entries')} diary entries")
+    else:
+        mood_text = "No diary entries yet"
+    return {
+        "profile": profile_text or "Not provided",
+        "medical_conditions": format_conditions(snapshot),
+        "medicines": ", ".join(medicines) if medicines else "None found in documents",
+        "mood_trend": mood_text,
+    }
@@ -0,0 +1,163 @@
+# hedged_generation.py
+
+import os
+import time
+import queue
+import logging
+import threading
+from dotenv import load_dotenv
+from cancellation import GenerationHandle, GenerationCancelled
+from metrics import increment, get_counters, record_event, read_events
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# If the primary model has not produced a token by then, hedge with the fallback
+HEDGE_AFTER_SECONDS = float(os.getenv("HEDGE_AFTER_SECONDS", "8"))
+# Give up if no path has produced a token by then
+FIRST_TOKEN_DEADLINE_SECONDS = float(os.getenv("FIRST_TOKEN_DEADLINE_SECONDS", "45"))
+
+
+class DeadlineExceeded(Exception):
+    """No generation path produced a token before the request deadline"""
+
+
+class _CachedResult:
+    def __init__(self, text):
+        self.text = text
+        self.context = None
+        self.stats = {}
+
+
+def run_hedged(primary, hedge, handle, on_token=None, cached_answer=None, task="chat",
+               hedge_after=HEDGE_AFTER_SECONDS, deadline=FIRST_TOKEN_DEADLINE_SECONDS):
+    """Run primary(emit_token, handle), hedging with a cached answer or hedge(emit_token, handle).
+
+    When the primary has produced no token after hedge_after seconds, a cached answer is
+    returned immediately if there is one; otherwise the hedge generation is started. The
+    first path to produce a token wins and the other is cancelled. Returns (result, winner)
+    where winner is "primary", "hedge" or "cache".
+    """
+    started = time.monotonic()
+    events = queue.Queue()
+    attempts = {}
+    finished = set()
+    winner = None
+
+    def launch(name, fn):
+        child = GenerationHandle()
+        attempts[name] = child
+
+        def target():
+            try:
+                events.put((name, "done", fn(lambda token: events.put((name, "token", token)), child)))
+            except BaseException as e:
+                events.put((name, "error", e))
+
+        threading.Thread(target=target, name=f"hedge-{name}", daemon=True).start()
+
+    def cancel_others(keep=None):
+        for name, child in attempts.items():
+            if name != keep:
+                child.cancel()
+
+    def finish(result, name):
+        hedged = "hedge" in attempts or name == "cache"
+        increment(f"hedge.{name}_wins")
+        record_event("hedged_generation", task=task, winner=name, hedged=hedged,
+                     first_token_latency=round(first_token_at - started, 3) if first_token_at else None,
+                     total_latency=round(time.monotonic() - started, 3))
+        return result, name
+
+    first_token_at = None
+    launch("primary", primary)
+    try:
+        while True:
+            handle.check()
+            elapsed = time.monotonic() - started
+
+            if winner is None:
+                if elapsed >= deadline:
+                    increment("hedge.deadline_exceeded")
+                    record_event("hedged_generation", task=task, winner=None, hedged="hedge" in attempts,
+                                 total_latency=round(elapsed, 3))
+                    raise DeadlineExceeded(f"No response within {deadline:.0f}s")
+                if elapsed >= hedge_after and "hedge" not in attempts:
+                    if cached_answer:
+                        cancel_others()
+                        first_token_at = time.monotonic()
+                        if on_token:
+                            on_token(cached_answer)
+                        return finish(_CachedResult(cached_answer), "cache")
+                    if hedge is not None:
+                        logger.info(f"No first token after {elapsed:.1f}s, hedging {task} request")
+                        launch("hedge", hedge)
+
+            wake = 0.25
+            if winner is None:
+                wake = min(wake, max(0.01, deadline - elapsed))
+                if "hedge" not in attempts:
+                    wake = min(wake, max(0.01, hedge_after - elapsed))
+            try:
+                name, kind, value = events.get(timeout=wake)
+            except queue.Empty:
+                continue
+
+            if winner is not None and name != winner:
+                continue  # leftovers from the cancelled path
+
+            if kind == "token":
+                if winner is None:
+                    winner = name
+                    first_token_at = time.monotonic()
+                    cancel_others(keep=name)
+                if on_token:
+                    on_token(value)
+            elif kind == "done":
+                if winner is None:
+                    winner = name
+                    first_token_at = time.monotonic()
+                    cancel_others(keep=name)
+                return finish(value, winner)
+            else:
+                finished.add(name)
+                if winner == name or isinstance(value, GenerationCancelled) and handle.cancelled:
+                    raise value
+                # One path failed before producing anything: start the hedge now, or fail if none is left
+                if name == "primary" and "hedge" not in attempts and hedge is not None:
+                    launch("hedge", hedge)
+                elif all(n in finished for n in attempts):
+                    raise value
+    finally:
+        if handle.cancelled or winner is None:
+            cancel_others(keep=winner)
+
+
+def hedge_win_rates():
+    """Share of requests won by each path since the process started"""
+    counters = get_counters("hedge.")
+    wins = {k[len("hedge."):-len("_wins")]: v for k, v in counters.items() if k.endswith("_wins")}
+    total = sum(wins.values()) + counters.get("hedge.deadline_exceeded", 0)
+    if not total:
+        return {}
+    rates = {name: count / total for name, count in wins.items()}
+    rates["deadline_exceeded"] = counters.get("hedge.deadline_exceeded", 0) / total
+    return rates
+
+
+def summarize_hedge_log():
+    """Per-task win counts and share from the logged hedged generations"""
+    wins = {}
+    for event in read_events("hedged_generation"):
+        task_wins = wins.setdefault(event.get("task", "chat"), {})
+        winner = event.get("winner") or "deadline_exceeded"
+        task_wins[winner] = task_wins.get(winner, 0) + 1
+    return {task: {name: {"count": n, "share": round(n / sum(counts.values()), 3)} for name, n in counts.items()}
+            for task, counts in wins.items()}
+
+
+if __name__ == "__main__":
+    import json
+    print(json.dumps(summarize_hedge_log(), indent=2))
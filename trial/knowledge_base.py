@@ -0,0 +1,281 @@
+# knowledge_base.py
+#
+# Local BM25 index over a folder of guideline documents, used to ground chat answers.
+#
+#   python knowledge_base.py --ingest [folder]     # (re)build the index
+#   python knowledge_base.py --query "how often should I check my blood sugar"
+
+import os
+import json
+import mmap
+import time
+import logging
+import argparse
+import threading
+from collections import Counter
+import numpy as np
+from dotenv import load_dotenv
+from text_features import tokenize
+from vector_index import chunk_text
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+KB_SOURCE_DIR = os.getenv("KNOWLEDGE_BASE_DIR", "knowledge_base")
+KB_INDEX_DIR = os.getenv("KNOWLEDGE_BASE_INDEX_DIR", os.path.join(".cache", "knowledge_base"))
+KB_TOP_K = int(os.getenv("KNOWLEDGE_BASE_TOP_K", "3"))
+KB_CHUNK_SIZE = 600
+KB_CHUNK_OVERLAP = 80
+SUPPORTED_EXTENSIONS = (".txt", ".md", ".pdf", ".docx")
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+STOPWORDS = frozenset("""
+a an and are as at be been but by can could do does for from had has have how i if in into is it its
+me my of on or our should so that the their them then there these they this to was we what when where
+which who why will with would you your
+""".split())
+
+
+def index_terms(text):
+    return [token for token in tokenize(text) if token not in STOPWORDS and len(token) > 1]
+
+
+def read_document(path):
+    """Plain text of a guideline file"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".pdf":
+        import fitz  # PyMuPDF
+        with fitz.open(path) as pdf:
+            return "\n".join(page.get_text() for page in pdf)
+    if extension == ".docx":
+        import docx
+        return "\n".join(paragraph.text for paragraph in docx.Document(path).paragraphs)
+    with open(path, encoding="utf-8", errors="ignore") as f:
+        return f.read()
+
+
+def _write_replace(path, write):
+    """Write a file beside path with write(tmp_path), then move it into place.
+
+    Readers keep the old file (including memory maps of it) until they reload, and
+    never see a half-written one.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _write_json(value):
+    def write(path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(value, f)
+    return write
+
+
+def _write_jsonl(rows):
+    def write(path):
+        with open(path, "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
+    return write
+
+
+def build_index(source_dir=KB_SOURCE_DIR, index_dir=KB_INDEX_DIR):
+    """Chunk every guideline document and write the inverted index.
+
+    Layout of index_dir:
+        terms.json      term -> [postings offset, document frequency]
+        postings.u32    passage ids, grouped by term
+        tf.u16          term frequency for each posting
+        lengths.u32     number of terms in each passage
+        passages.jsonl  passage text and source file, one per line
+        info.json       passage count, average length, source manifest
+    """
+    sources = []
+    for root, _, files in os.walk(source_dir):
+        for name in sorted(files):
+            if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                sources.append(os.path.join(root, name))
+
+    passages = []
+    postings = {}
+    lengths = []
+    for path in sorted(sources):
+        try:
+            text = read_document(path)
+        except Exception as e:
+            logger.error(f"Error reading guideline {path}: {e}")
+            continue
+        for chunk in chunk_text(text, KB_CHUNK_SIZE, KB_CHUNK_OVERLAP):
+            terms = index_terms(chunk)
+            if not terms:
+                continue
+            passage_id = len(passages)
+            passages.append({"source": os.path.relpath(path, source_dir), "text": chunk})
+            lengths.append(len(terms))
+            for term, count in Counter(terms).items():
+                postings.setdefault(term, []).append((passage_id, count))
+
+    os.makedirs(index_dir, exist_ok=True)
+    terms = {}
+    doc_ids, tfs = [], []
+    for term in sorted(postings):
+        terms[term] = [len(doc_ids), len(postings[term])]
+        for passage_id, count in postings[term]:
+            doc_ids.append(passage_id)
+            tfs.append(min(count, 65535))
+
+    # Other processes may have the current files memory-mapped, so each one is replaced, never rewritten
+    _write_replace(os.path.join(index_dir, "postings.u32"), np.array(doc_ids, dtype=np.uint32).tofile)
+    _write_replace(os.path.join(index_dir, "tf.u16"), np.array(tfs, dtype=np.uint16).tofile)
+    _write_replace(os.path.join(index_dir, "lengths.u32"), np.array(lengths, dtype=np.uint32).tofile)
+    _write_replace(os.path.join(index_dir, "passages.jsonl"), _write_jsonl(passages))
+    _write_replace(os.path.join(index_dir, "terms.json"), _write_json(terms))
+    # info.json is replaced last; readers reload when it changes
+    info = {
+        "passages": len(passages),
+        "avg_length": float(np.mean(lengths)) if lengths else 0.0,
+        "sources": {os.path.relpath(p, source_dir): os.path.getmtime(p) for p in sources},
+        "built_at": time.time(),
+    }
+    _write_replace(os.path.join(index_dir, "info.json"), _write_json(info))
+    logger.info(f"Knowledge base built: {len(sources)} documents, {len(passages)} passages, {len(terms)} terms")
+    return info
+
+
+class IndexSnapshot:
+    """One build of the index, loaded as a whole and never changed afterwards.
+
+    The postings and passages are memory-mapped from the files of that build, so a
+    rebuild replacing the files doesn't affect searches still using this snapshot.
+    """
+
+    def __init__(self, index_dir):
+        def path(name):
+            return os.path.join(index_dir, name)
+
+        with open(path("info.json"), encoding="utf-8") as f:
+            info = json.load(f)
+        with open(path("terms.json"), encoding="utf-8") as f:
+            self.terms = json.load(f)
+        self.passage_count = info["passages"]
+        self.avg_length = info["avg_length"] or 1.0
+        if not self.passage_count:
+            return
+        self.postings = np.memmap(path("postings.u32"), dtype=np.uint32, mode="r")
+        self.tf = np.memmap(path("tf.u16"), dtype=np.uint16, mode="r")
+        lengths = np.fromfile(path("lengths.u32"), dtype=np.uint32).astype(np.float32)
+        # Per-passage BM25 length normalisation, computed once
+        self.norm = K1 * (1 - B + B * lengths / self.avg_length)
+        with open(path("passages.jsonl"), "rb") as f:
+            self.passages = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # Byte offsets of each line so a passage can be read without parsing the whole file
+        self.offsets = [0]
+        position = self.passages.find(b"\n")
+        while position != -1:
+            self.offsets.append(position + 1)
+            position = self.passages.find(b"\n", position + 1)
+        self.offsets.pop()
+        # Files from two different builds (a rebuild landing mid-load) don't line up
+        if not (len(lengths) == len(self.offsets) == self.passage_count and len(self.postings) == len(self.tf)):
+            raise ValueError("Knowledge base files are from different builds")
+
+    def passage(self, passage_id):
+        start = self.offsets[passage_id]
+        return json.loads(self.passages[start:self.passages.find(b"\n", start)])
+
+
+class KnowledgeBase:
+    """Read side of the BM25 index; searches use whichever snapshot was current when they started"""
+
+    def __init__(self, index_dir=KB_INDEX_DIR):
+        self.index_dir = index_dir
+        # The loaded snapshot and the modification time of the info.json it came from
+        self._snapshot = None
+        self._loaded_mtime = None
+        self._lock = threading.Lock()
+
+    def _current(self):
+        """The snapshot of the latest build, loading it if info.json changed; None without an index"""
+        info_path = os.path.join(self.index_dir, "info.json")
+        if not os.path.exists(info_path):
+            return None
+        with self._lock:
+            # Taken before loading, so a rebuild that lands mid-load is picked up on the next search
+            mtime = os.stat(info_path).st_mtime_ns
+            if mtime != self._loaded_mtime:
+                self._snapshot = IndexSnapshot(self.index_dir)
+                self._loaded_mtime = mtime
+            return self._snapshot
+
+    def search(self, question, top_k=KB_TOP_K):
+        """Top passages for the question by BM25, as dicts with source, text and score"""
+        index = self._current()
+        if index is None or not index.passage_count:
+            return []
+        scores = np.zeros(index.passage_count, dtype=np.float32)
+        for term in set(index_terms(question)):
+            entry = index.terms.get(term)
+            if entry is None:
+                continue
+            offset, df = entry
+            ids = index.postings[offset:offset + df]
+            tf = index.tf[offset:offset + df].astype(np.float32)
+            idf = np.log(1 + (index.passage_count - df + 0.5) / (df + 0.5))
+            scores[ids] += idf * tf * (K1 + 1) / (tf + index.norm[ids])
+
+        candidates = np.flatnonzero(scores)
+        if not len(candidates):
+            return []
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(scores[candidates], -top_k)[-top_k:]]
+        ranked = candidates[np.argsort(scores[candidates])[::-1]]
+        return [dict(index.passage(int(i)), score=float(scores[i])) for i in ranked]
+
+    def context_for(self, question, top_k=KB_TOP_K):
+        """Guideline passages formatted for the prompt"""
+        try:
+            hits = self.search(question, top_k)
+        except Exception as e:
+            logger.error(f"Error searching the knowledge base: {e}")
+            return "None available"
+        if not hits:
+            return "None available"
+        return "\n\n".join(f"From '{hit['source']}':\n{hit['text']}" for hit in hits)
+
+
+knowledge_base = KnowledgeBase()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and query the guideline knowledge base")
+    parser.add_argument("--ingest", nargs="?", const=KB_SOURCE_DIR, metavar="FOLDER",
+                        help=f"build the index from a folder (default {KB_SOURCE_DIR})")
+    parser.add_argument("--query", help="print the top passages for a question")
+    parser.add_argument("--top-k", type=int, default=KB_TOP_K)
+    args = parser.parse_args()
+
+    if args.ingest:
+        info = build_index(args.ingest)
+        print(f"Indexed {len(info['sources'])} documents into {info['passages']} passages")
+    if args.query:
+        knowledge_base.search(args.query, args.top_k)  # load the index outside the timing
+        started = time.perf_counter()
+        hits = knowledge_base.search(args.query, args.top_k)
+        elapsed = (time.perf_counter() - started) * 1000
+        for hit in hits:
+            print(f"[{hit['score']:.2f}] {hit['source']}: {hit['text'][:200]}")
+        print(f"{len(hits)} passages in {elapsed:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
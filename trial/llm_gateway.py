@@ -0,0 +1,222 @@
+# llm_gateway.py
+
+import os
+import time
+import threading
+import logging
+from collections import deque, OrderedDict
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, lower value is served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_DIARY = 1
+PRIORITY_BACKGROUND = 2
+# Work nobody is waiting for (follow-up speculation): only started while nothing else is running
+PRIORITY_SPECULATIVE = 3
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_DIARY: "diary",
+    PRIORITY_BACKGROUND: "background",
+    PRIORITY_SPECULATIVE: "speculative",
+}
+
+# Concurrency limits per backend; Ollama on one host degrades badly past a couple of parallel generations
+BACKEND_CONCURRENCY = {
+    "ollama": int(os.getenv("OLLAMA_GATEWAY_CONCURRENCY", "2")),
+    "openai": int(os.getenv("OPENAI_GATEWAY_CONCURRENCY", "4")),
+}
+
+
+class GatewayTicket:
+    """A queued request waiting for a slot in the gateway"""
+
+    def __init__(self, user_id, priority):
+        self.user_id = str(user_id)
+        self.priority = priority
+        self.enqueued_at = time.monotonic()
+        self.granted = threading.Event()
+
+
+class LLMGateway:
+    """Bounded-concurrency admission control for LLM calls.
+
+    Requests are served strictly by priority class. Inside a class, users are
+    served round-robin so one user with many queued requests cannot starve others.
+    Speculative requests also wait while any other request is running. The call
+    itself runs on the caller's thread once a slot is granted.
+    """
+
+    def __init__(self, name, max_concurrency):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self._lock = threading.Lock()
+        # priority -> OrderedDict(user_id -> deque of tickets); dict order is the round-robin order
+        self._queues = {p: OrderedDict() for p in PRIORITY_NAMES}
+        self._active = 0
+        self._active_by_priority = {p: 0 for p in PRIORITY_NAMES}
+        self._avg_service_time = 5.0
+        self._completed = {p: 0 for p in PRIORITY_NAMES}
+
+    def _enqueue(self, ticket):
+        with self._lock:
+            self._queues[ticket.priority].setdefault(ticket.user_id, deque()).append(ticket)
+            self._dispatch_locked()
+
+    def _dispatch_locked(self):
+        while self._active < self.max_concurrency:
+            ticket = self._next_ticket_locked()
+            if ticket is None:
+                return
+            self._active += 1
+            self._active_by_priority[ticket.priority] += 1
+            ticket.granted.set()
+
+    def _next_ticket_locked(self):
+        for priority in sorted(self._queues):
+            users = self._queues[priority]
+            if not users:
+                continue
+            if priority == PRIORITY_SPECULATIVE and self._active > self._active_by_priority[PRIORITY_SPECULATIVE]:
+                return None
+            user_id, tickets = next(iter(users.items()))
+            ticket = tickets.popleft()
+            # Rotate the user to the back so the next request in this class goes to someone else
+            del users[user_id]
+            if tickets:
+                users[user_id] = tickets
+            return ticket
+        return None
+
+    def _abandon(self, ticket):
+        """Drop a ticket whose caller gave up while waiting"""
+        with self._lock:
+            if ticket.granted.is_set():
+                self._active -= 1
+                self._active_by_priority[ticket.priority] -= 1
+                self._dispatch_locked()
+                return
+            tickets = self._queues[ticket.priority].get(ticket.user_id)
+            if tickets and ticket in tickets:
+                tickets.remove(ticket)
+                if not tickets:
+                    del self._queues[ticket.priority][ticket.user_id]
+
+    def _release(self, ticket, service_time):
+        with self._lock:
+            self._active -= 1
+            self._active_by_priority[ticket.priority] -= 1
+            self._completed[ticket.priority] += 1
+            # Exponential moving average keeps the ETA responsive to current model speed
+            self._avg_service_time = 0.8 * self._avg_service_time + 0.2 * service_time
+            self._dispatch_locked()
+
+    def queue_position(self, ticket):
+        """Return (requests ahead of this ticket, estimated seconds until it starts)"""
+        with self._lock:
+            if ticket.granted.is_set():
+                return 0, 0.0
+            ahead = 0
+            for priority in sorted(self._queues):
+                users = self._queues[priority]
+                if priority < ticket.priority:
+                    ahead += sum(len(t) for t in users.values())
+                    continue
+                if priority > ticket.priority:
+                    break
+                own = users.get(ticket.user_id)
+                if own is None or ticket not in own:
+                    break
+                rounds = own.index(ticket)
+                passed_own_turn = False
+                for user_id, tickets in users.items():
+                    if user_id == ticket.user_id:
+                        passed_own_turn = True
+                        ahead += rounds
+                    elif passed_own_turn:
+                        ahead += min(len(tickets), rounds)
+                    else:
+                        ahead += min(len(tickets), rounds + 1)
+            eta = (ahead // self.max_concurrency + 1) * self._avg_service_time
+            return ahead, eta
+
+    def run(self, fn, user_id, priority=PRIORITY_INTERACTIVE, on_wait=None, handle=None):
+        """Run fn() once a slot is available, calling on_wait(ahead, eta) while queued.
+
+        A cancelled handle gives up the place in the queue without ever running fn.
+        """
+        ticket = GatewayTicket(user_id, priority)
+        self._enqueue(ticket)
+        try:
+            while not ticket.granted.wait(0.5):
+                if handle:
+                    handle.check()
+                if on_wait:
+                    on_wait(*self.queue_position(ticket))
+            if handle:
+                handle.check()
+        except BaseException:
+            # The caller was interrupted (e.g. Streamlit stopped the script) before being served
+            self._abandon(ticket)
+            raise
+
+        waited = time.monotonic() - ticket.enqueued_at
+        started = time.monotonic()
+        try:
+            return fn()
+        finally:
+            service_time = time.monotonic() - started
+            self._release(ticket, service_time)
+            logger.debug(f"{self.name} gateway: {PRIORITY_NAMES[priority]} request for user {ticket.user_id} "
+                         f"waited {waited:.2f}s, ran {service_time:.2f}s")
+
+    def has_non_speculative_load(self):
+        """True while any request other than speculation is running or queued"""
+        with self._lock:
+            return any(self._active_by_priority[p] or self._queues[p]
+                       for p in PRIORITY_NAMES if p != PRIORITY_SPECULATIVE)
+
+    def invoke(self, chain, inputs, user_id, priority=PRIORITY_INTERACTIVE, on_wait=None):
+        """Invoke a LangChain runnable through the gateway"""
+        return self.run(lambda: chain.invoke(inputs), user_id, priority, on_wait)
+
+    def stats(self):
+        """Snapshot of active and queued requests for monitoring"""
+        with self._lock:
+            return {
+                "active": self._active,
+                "max_concurrency": self.max_concurrency,
+                "active_by_priority": {PRIORITY_NAMES[p]: n for p, n in self._active_by_priority.items()},
+                "queued": {PRIORITY_NAMES[p]: sum(len(t) for t in users.values())
+                           for p, users in self._queues.items()},
+                "completed": {PRIORITY_NAMES[p]: n for p, n in self._completed.items()},
+                "avg_service_time": round(self._avg_service_time, 2),
+            }
+
+
+_gateways = {}
+_gateways_lock = threading.Lock()
+
+
+def get_gateway(backend="ollama"):
+    """Return the process-wide gateway for an LLM backend"""
+    with _gateways_lock:
+        if backend not in _gateways:
+            _gateways[backend] = LLMGateway(backend, BACKEND_CONCURRENCY.get(backend, 2))
+        return _gateways[backend]
+
+
+def queue_status_reporter(placeholder):
+    """Build an on_wait callback that shows the queue position in a Streamlit placeholder"""
+    def report(ahead, eta):
+        if ahead:
+            placeholder.info(f"The assistant is busy. You are number {ahead + 1} in line "
+                             f"(about {int(eta) + 1} seconds).")
+        else:
+            placeholder.info("You're next, starting shortly...")
+    return report
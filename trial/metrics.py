@@ -0,0 +1,53 @@
+# metrics.py
+
+import os
+import json
+import time
+import threading
+import logging
+from collections import Counter
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+LOG_DIR = os.getenv("METRICS_LOG_DIR", "logs")
+
+_counters = Counter()
+_counters_lock = threading.Lock()
+_file_lock = threading.Lock()
+
+
+def increment(name, amount=1):
+    """Increment an in-process counter"""
+    with _counters_lock:
+        _counters[name] += amount
+
+
+def get_counters(prefix=""):
+    """Return a copy of the counters whose names start with prefix"""
+    with _counters_lock:
+        return {k: v for k, v in _counters.items() if k.startswith(prefix)}
+
+
+def record_event(stream, **fields):
+    """Append one JSON line to logs/<stream>.jsonl for offline analysis"""
+    fields.setdefault("ts", time.time())
+    try:
+        os.makedirs(LOG_DIR, exist_ok=True)
+        with _file_lock:
+            with open(os.path.join(LOG_DIR, f"{stream}.jsonl"), "a", encoding="utf-8") as f:
+                f.write(json.dumps(fields, default=str) + "\n")
+    except Exception as e:
+        logger.error(f"Error recording {stream} event: {e}")
+
+
+def read_events(stream):
+    """Read back all events recorded for a stream"""
+    path = os.path.join(LOG_DIR, f"{stream}.jsonl")
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
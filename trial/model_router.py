@@ -0,0 +1,163 @@
+# model_router.py
+
+import os
+import re
+import time
+import logging
+import threading
+from collections import defaultdict
+from dotenv import load_dotenv
+from metrics import record_event, read_events
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+# How long Ollama keeps a model resident after each request
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
+# Configured model pool: a fast small model and a slower, stronger large model
+MODEL_POOL = {
+    "small": os.getenv("OLLAMA_SMALL_MODEL", "tinyllama"),
+    "large": os.getenv("OLLAMA_LARGE_MODEL", "mistral"),
+}
+
+LONG_QUESTION_WORDS = int(os.getenv("ROUTER_LONG_QUESTION_WORDS", "30"))
+LONG_DIARY_WORDS = int(os.getenv("ROUTER_LONG_DIARY_WORDS", "40"))
+
+# Terms that signal the answer must reason about the user's conditions or medication
+MEDICAL_TERMS = [
+    "diabetes", "diabetic", "hypertension", "blood pressure", "asthma", "inhaler", "heart",
+    "medicine", "medication", "tablet", "dose", "dosage", "insulin", "side effect", "interaction",
+    "prescription", "sugar", "cholesterol", "diet", "exercise", "pregnan", "symptom", "pain",
+]
+
+DISTRESS_TERMS = [
+    "hopeless", "worthless", "panic", "can't cope", "cannot cope", "suicid", "self harm",
+    "self-harm", "alone", "grief", "abuse", "overwhelm", "depress",
+]
+
+_llm_cache = {}
+_llm_cache_lock = threading.Lock()
+
+
+def get_llm(model_name, temperature=0.5):
+    """Return a shared Ollama client for a model in the pool"""
+    key = (model_name, temperature)
+    with _llm_cache_lock:
+        if key not in _llm_cache:
+            # Imported on first use; the warm-up and keep-alive schedules call Ollama directly
+            from langchain_community.llms import Ollama
+            _llm_cache[key] = Ollama(model=model_name, temperature=temperature,
+                                     base_url=OLLAMA_BASE_URL, keep_alive=OLLAMA_KEEP_ALIVE)
+        return _llm_cache[key]
+
+
+class RoutingDecision:
+    """The tier and model chosen for one request, plus the reasons for the choice"""
+
+    def __init__(self, task, tier, reasons, features):
+        self.task = task
+        self.tier = tier
+        self.model = MODEL_POOL[tier]
+        self.reasons = reasons
+        self.features = features
+
+    def run(self, fn):
+        """Call fn() and log the decision with its latency"""
+        started = time.monotonic()
+        ok = False
+        try:
+            result = fn()
+            ok = True
+            return result
+        finally:
+            self.log(time.monotonic() - started, ok)
+
+    def invoke(self, chain, inputs):
+        """Invoke the chain and log the decision with its latency"""
+        return self.run(lambda: chain.invoke(inputs))
+
+    def fallback(self):
+        """Decision for hedging this request on the small model, or None if it already uses it"""
+        if self.tier == "small" or MODEL_POOL["small"] == self.model:
+            return None
+        return RoutingDecision(self.task, "small", self.reasons + ["hedge"], self.features)
+
+    def log(self, latency, ok=True):
+        logger.info(f"Routed {self.task} to {self.model} ({', '.join(self.reasons)}) in {latency:.2f}s")
+        record_event("model_router", task=self.task, tier=self.tier, model=self.model,
+                     reasons=self.reasons, latency=round(latency, 3), ok=ok, **self.features)
+
+
+def _mentions(text, terms):
+    return [term for term in terms if term in text]
+
+
+def _count_parts(text):
+    """Count distinct sub-questions: question marks and numbered or bulleted lines"""
+    questions = text.count("?")
+    listed = len(re.findall(r"^\s*(?:\d+[.)]|[-*•])\s+", text, flags=re.MULTILINE))
+    return max(questions, listed, 1)
+
+
+def classify_request(task, text, medical_conditions=None):
+    """Choose a model tier for a request.
+
+    task is one of "chat", "diary", "emotion_label", "summary" or "followups".
+    """
+    lowered = (text or "").lower()
+    words = len(lowered.split())
+    parts = _count_parts(text or "")
+    features = {"words": words, "parts": parts}
+    reasons = []
+
+    if task in ("emotion_label", "summary", "followups"):
+        return RoutingDecision(task, "small", [f"{task}_task"], features)
+
+    if task == "diary":
+        if words > LONG_DIARY_WORDS:
+            reasons.append("long_entry")
+        if _mentions(lowered, DISTRESS_TERMS):
+            reasons.append("distress")
+        return RoutingDecision(task, "large" if reasons else "small", reasons or ["short_entry"], features)
+
+    # Chat questions
+    has_conditions = bool(medical_conditions) and medical_conditions != "None specified"
+    medical_hits = _mentions(lowered, MEDICAL_TERMS)
+    features["medical_terms"] = len(medical_hits)
+    if words > LONG_QUESTION_WORDS:
+        reasons.append("long_question")
+    if parts > 1:
+        reasons.append("multi_part")
+    if has_conditions and medical_hits:
+        reasons.append("condition_specific")
+    return RoutingDecision(task, "large" if reasons else "small", reasons or ["short_factual"], features)
+
+
+def summarize_router_log():
+    """Aggregate logged decisions into per task/tier latency stats for tuning thresholds"""
+    groups = defaultdict(list)
+    for event in read_events("model_router"):
+        groups[(event["task"], event["model"], ",".join(event["reasons"]))].append(event["latency"])
+
+    rows = []
+    for (task, model, reasons), latencies in sorted(groups.items()):
+        latencies.sort()
+        rows.append({
+            "task": task,
+            "model": model,
+            "reasons": reasons,
+            "count": len(latencies),
+            "p50": latencies[len(latencies) // 2],
+            "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        })
+    return rows
+
+
+if __name__ == "__main__":
+    for row in summarize_router_log():
+        print(f"{row['task']:<14} {row['model']:<12} n={row['count']:<5} p50={row['p50']:6.2f}s "
+              f"p95={row['p95']:6.2f}s  {row['reasons']}")
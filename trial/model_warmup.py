@@ -0,0 +1,162 @@
+# model_warmup.py
+#
+# Preloads the configured Ollama models and keeps them resident during business hours.
+#
+#   python model_warmup.py            # warm up every configured model
+#   python model_warmup.py --check    # readiness check, exits non-zero if a model is not resident
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+import urllib.request
+from datetime import datetime
+from dotenv import load_dotenv
+from llm_gateway import get_gateway, PRIORITY_BACKGROUND
+from model_router import MODEL_POOL, OLLAMA_BASE_URL, OLLAMA_KEEP_ALIVE
+from vector_index import EMBED_MODEL
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+KEEPALIVE_INTERVAL_MINUTES = float(os.getenv("KEEPALIVE_INTERVAL_MINUTES", "10"))
+# Business hours as "start-end" in local 24h time, and days as "first-last" with Monday = 0
+KEEPALIVE_HOURS = os.getenv("KEEPALIVE_HOURS", "8-20")
+KEEPALIVE_DAYS = os.getenv("KEEPALIVE_DAYS", "0-4")
+
+
+def configured_models():
+    """Return (model name, kind) for every model the app uses"""
+    models = [(name, "generate") for name in dict.fromkeys(MODEL_POOL.values())]
+    models.append((EMBED_MODEL, "embed"))
+    return models
+
+
+def _post(path, payload, timeout=300):
+    request = urllib.request.Request(
+        f"{OLLAMA_BASE_URL}{path}",
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read() or b"{}")
+
+
+def _get(path, timeout=10):
+    with urllib.request.urlopen(f"{OLLAMA_BASE_URL}{path}", timeout=timeout) as response:
+        return json.loads(response.read() or b"{}")
+
+
+def load_model(name, kind="generate"):
+    """Load a model into memory (or refresh its keep-alive) without generating anything"""
+    started = time.monotonic()
+    if kind == "embed":
+        _post("/api/embeddings", {"model": name, "prompt": "warm up", "keep_alive": OLLAMA_KEEP_ALIVE})
+    else:
+        # An empty prompt makes Ollama load the model and return immediately
+        _post("/api/generate", {"model": name, "prompt": "", "keep_alive": OLLAMA_KEEP_ALIVE, "stream": False})
+    return time.monotonic() - started
+
+
+def get_model_readiness():
+    """Report which configured models are resident in Ollama right now"""
+    try:
+        running = {m["name"]: m for m in _get("/api/ps").get("models", [])}
+    except Exception as e:
+        logger.error(f"Error reaching Ollama for readiness check: {e}")
+        running = {}
+
+    readiness = {}
+    for name, kind in configured_models():
+        # Ollama reports "mistral:latest" for a model requested as "mistral"
+        match = running.get(name) or running.get(f"{name}:latest")
+        readiness[name] = {
+            "kind": kind,
+            "resident": match is not None,
+            "expires_at": match.get("expires_at") if match else None,
+            "size_vram": match.get("size_vram") if match else None,
+        }
+    return readiness
+
+
+def warm_up_models():
+    """Load every configured model, returning the load time per model (None on failure)"""
+    timings = {}
+    for name, kind in configured_models():
+        try:
+            timings[name] = get_gateway().run(lambda: load_model(name, kind), "system", PRIORITY_BACKGROUND)
+            logger.info(f"Warmed up {name} in {timings[name]:.1f}s")
+        except Exception as e:
+            logger.error(f"Error warming up {name}: {e}")
+            timings[name] = None
+    return timings
+
+
+def _parse_range(value):
+    start, end = value.split("-")
+    return int(start), int(end)
+
+
+def in_business_hours(now=None):
+    """True when keep-alive pings should run"""
+    now = now or datetime.now()
+    start_hour, end_hour = _parse_range(KEEPALIVE_HOURS)
+    first_day, last_day = _parse_range(KEEPALIVE_DAYS)
+    return first_day <= now.weekday() <= last_day and start_hour <= now.hour < end_hour
+
+
+class KeepAliveScheduler:
+    """Background thread that pings configured models on a schedule during business hours"""
+
+    def __init__(self, interval_minutes=KEEPALIVE_INTERVAL_MINUTES):
+        self.interval = interval_minutes * 60
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="ollama-keepalive", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            if not in_business_hours():
+                continue
+            for name, kind in configured_models():
+                try:
+                    get_gateway().run(lambda: load_model(name, kind), "system", PRIORITY_BACKGROUND)
+                except Exception as e:
+                    logger.error(f"Keep-alive ping for {name} failed: {e}")
+
+
+def start_model_manager():
+    """Warm up models in the background and start the keep-alive schedule"""
+    threading.Thread(target=warm_up_models, name="ollama-warmup", daemon=True).start()
+    return KeepAliveScheduler().start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Warm up and check Ollama models")
+    parser.add_argument("--check", action="store_true", help="only report which models are resident")
+    args = parser.parse_args()
+
+    if not args.check:
+        for name, seconds in warm_up_models().items():
+            print(f"{name:<20} {'failed' if seconds is None else f'loaded in {seconds:.1f}s'}")
+
+    readiness = get_model_readiness()
+    for name, status in readiness.items():
+        state = "resident" if status["resident"] else "NOT LOADED"
+        print(f"{name:<20} {state:<12} expires {status['expires_at'] or '-'}")
+    sys.exit(0 if all(s["resident"] for s in readiness.values()) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,11 +4,17 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import calendar
 from database import SupabaseClient
+from emotion_classifier import MOOD_VALUES, parse_json_data
 import json
 
+# The dashboard summary only looks at the last two weeks
+DASHBOARD_WINDOW_DAYS = 14
+# Upper bound on the rows loaded for that window; past it, the oldest entries are left out
+DASHBOARD_ENTRY_LIMIT = 500
+
 
 def prepare_mood_data(diary_entries):
     """Convert diary entries to DataFrame for visualization"""
@@ -20,13 +26,7 @@ def prepare_mood_data(diary_entries):
     moods = []
     timestamps = []
     
-    # Common moods and their numeric values (for sentiment scale)
-    mood_values = {
-        "happy": 5, "excited": 5, "joyful": 5, "content": 4, "peaceful": 4, "grateful": 4,
-        "calm": 3, "neutral": 3, "reflective": 3,
-        "confused": 2, "worried": 2, "anxious": 2, "sad": 1, "angry": 1, "frustrated": 1,
-        "tired": 2, "lonely": 1, "overwhelmed": 1, "stressed": 1, "disappointed": 1
-    }
+    mood_scores = []
     
     # Process each entry
     for entry in diary_entries:
@@ -48,9 +48,11 @@ def prepare_mood_data(diary_entries):
             timestamp = datetime.strptime(f"{date_str} {time_str}", "%Y-%m-%d %H:%M:%S")
             timestamps.append(timestamp)
             
-            # Get mood
+            # Get mood; entries scored by the classifier carry a continuous valence
             mood = entry.get('mood', 'neutral').lower()
+            valence = parse_json_data(entry.get('json_data')).get('valence')
             moods.append(mood)
+            mood_scores.append(3 + 2 * valence if valence is not None else MOOD_VALUES.get(mood, 3))
         except:
             continue
     
@@ -59,7 +61,7 @@ def prepare_mood_data(diary_entries):
         'date': dates,
         'timestamp': timestamps,
         'mood': moods,
-        'mood_value': [mood_values.get(m.lower(), 3) for m in moods]  # Default to neutral (3) if not found
+        'mood_value': mood_scores
     })
     
     return df
@@ -96,7 +98,7 @@ def create_mood_timeline(diary_entries):
             mode='markers',
             marker=dict(
                 size=10,
-                color=[mood_colors.get(val, "#FFC107") for val in df['mood_value']],
+                color=[mood_colors.get(int(round(val)), "#FFC107") for val in df['mood_value']],
                 line=dict(width=2, color='DarkSlateGrey')
             ),
             text=df['mood'],
@@ -291,10 +293,23 @@ def get_recent_mood_trend(diary_entries, days=7):
     return dominant_mood, trend
 
 
+def dashboard_diary_entries(user_id):
+    """Diary entries of the last DASHBOARD_WINDOW_DAYS days shown in the dashboard summary, oldest first"""
+    # Whole days, so the query (and its shared cache key) is the same for every run today
+    since = (datetime.now(timezone.utc) - timedelta(days=DASHBOARD_WINDOW_DAYS)).date().isoformat()
+    return SupabaseClient().get_emotional_diary_since(user_id, since, limit=DASHBOARD_ENTRY_LIMIT, newest=True)
+
+
+def prefetch_dashboard(user_id):
+    """Background prefetch for the dashboard: warms the shared cache with the mood summary's entries"""
+    dashboard_diary_entries(user_id)
+    return {}
+
+
+@st.fragment
 def create_dashboard_mood_summary(user_id):
-    """Create a summary of mood data for the dashboard"""
-    db = SupabaseClient()
-    diary_entries = db.get_emotional_diary_history(user_id)
+    """Create a summary of mood data for the dashboard from the last 14 days of entries"""
+    diary_entries = dashboard_diary_entries(user_id)
     
     if not diary_entries:
         st.warning("No mood data available. Start using the Emotional Diary to track your moods.")
@@ -348,7 +363,7 @@ def create_dashboard_mood_summary(user_id):
     df = prepare_mood_data(diary_entries)
     if df is not None and not df.empty:
         # Filter to last 14 days - ensure timezone-naive comparison
-        recent_date = datetime.now() - timedelta(days=14)
+        recent_date = datetime.now() - timedelta(days=DASHBOARD_WINDOW_DAYS)
         recent_df = df[df['date'] >= recent_date]
         
         if not recent_df.empty:
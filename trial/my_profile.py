@@ -3,6 +3,15 @@
 import streamlit as st
 from database import SupabaseClient
 from auth import hash_password, verify_password
+from router import nav_button
+
+
+def prefetch_profile(user_id):
+    """Background prefetch for the profile page: warms the shared cache with the user and their conditions"""
+    db = SupabaseClient()
+    db.get_user_by_id(user_id)
+    db.get_user_medical_info(user_id)
+    return {}
 
 
 def display_profile_update():
@@ -137,6 +146,4 @@ def display_profile_update():
     col1, col2 = st.columns(2)
     
     with col1:
-        if st.button("Back to Dashboard", use_container_width=True):
-            st.session_state['current_page'] = 'dashboard'
-            st.rerun()
\ No newline at end of file
+        nav_button("Back to Dashboard", 'dashboard')
\ No newline at end of file
@@ -0,0 +1,82 @@
+# ollama_client.py
+
+import json
+import logging
+import urllib.request
+from model_router import OLLAMA_BASE_URL, OLLAMA_KEEP_ALIVE
+from cancellation import GenerationCancelled
+
+logger = logging.getLogger(__name__)
+
+
+class GenerationResult:
+    """Text produced by one /api/generate call plus the model state Ollama returned"""
+
+    def __init__(self, text, context, stats):
+        self.text = text
+        self.context = context
+        self.stats = stats
+
+
+def generate(model, prompt, system=None, context=None, temperature=0.5, on_token=None, handle=None,
+             timeout=600):
+    """Stream a completion from Ollama's /api/generate endpoint.
+
+    Passing the context returned by a previous call lets Ollama continue from its
+    cached conversation state instead of re-evaluating the whole prompt. Cancelling
+    the handle closes the stream, which stops the generation on the Ollama side.
+    """
+    payload = {
+        "model": model,
+        "prompt": prompt,
+        "stream": True,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+        "options": {"temperature": temperature},
+    }
+    if system:
+        payload["system"] = system
+    if context:
+        payload["context"] = context
+
+    request = urllib.request.Request(
+        f"{OLLAMA_BASE_URL}/api/generate",
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+
+    parts = []
+    final = {}
+    if handle:
+        handle.check()
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        if handle:
+            handle.attach(response)
+        try:
+            for line in response:
+                if handle and handle.cancelled:
+                    break
+                if not line.strip():
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    raise RuntimeError(f"Ollama error: {chunk['error']}")
+                token = chunk.get("response", "")
+                if token:
+                    parts.append(token)
+                    if on_token:
+                        on_token(token)
+                if chunk.get("done"):
+                    final = chunk
+                    break
+        except (OSError, ValueError, AttributeError):
+            # Reading a stream that cancel() closed from another thread fails in various ways
+            if not (handle and handle.cancelled):
+                raise
+        finally:
+            if handle:
+                handle.detach()
+    if handle and handle.cancelled:
+        raise GenerationCancelled()
+
+    stats = {k: final.get(k) for k in ("prompt_eval_count", "prompt_eval_duration", "eval_count", "eval_duration")}
+    return GenerationResult("".join(parts), final.get("context"), stats)
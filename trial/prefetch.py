@@ -0,0 +1,230 @@
+# prefetch.py
+#
+# Predictive prefetch of page data. Every page change is recorded as a transition; when
+# a session lands on a page, the pages it is likely to open next (by the transition
+# counts from our own usage) have their data fetched in the background. Reads warm the
+# shared cache, and the session buffers a page's loaders would build (chat and diary
+# messages) are kept ready for the session to claim when it navigates there. Prefetches
+# for pages the session doesn't open are cancelled.
+#
+#   python prefetch.py        # transition probabilities from logs/navigation.jsonl
+
+import os
+import time
+import logging
+import argparse
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from dotenv import load_dotenv
+from metrics import increment, record_event, read_events
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "true").lower() == "true"
+PREFETCH_MAX_CONCURRENT = int(os.getenv("PREFETCH_MAX_CONCURRENT", "4"))
+PREFETCH_MAX_PAGES = int(os.getenv("PREFETCH_MAX_PAGES", "2"))
+PREFETCH_MIN_PROBABILITY = float(os.getenv("PREFETCH_MIN_PROBABILITY", "0.2"))
+# Prefetched data older than this is treated as stale and fetched again
+PREFETCH_TTL_SECONDS = int(os.getenv("PREFETCH_TTL_SECONDS", "120"))
+# How long a navigation waits for a prefetch of its page that is still running
+PREFETCH_CLAIM_WAIT_SECONDS = 1.0
+NAVIGATION_STREAM = "navigation"
+NAVIGATION_HISTORY_EVENTS = 50000
+
+# Pseudo-counts used until our own usage says otherwise: from the dashboard, the next
+# click is nearly always the chatbot or the diary
+PRIOR_TRANSITIONS = {
+    "dashboard": {"chatbot": 2, "emotional_diary": 2},
+}
+
+
+class TransitionStats:
+    """Counts of page -> next page transitions, loaded from the navigation log and kept up to date"""
+
+    def __init__(self, priors=PRIOR_TRANSITIONS):
+        self.counts = defaultdict(Counter)
+        for page, targets in priors.items():
+            self.counts[page].update(targets)
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            events = read_events(NAVIGATION_STREAM)[-NAVIGATION_HISTORY_EVENTS:]
+        except Exception as e:
+            logger.error(f"Error reading navigation history: {e}")
+            events = []
+        for event in events:
+            if event.get("from") and event.get("to"):
+                self.counts[event["from"]][event["to"]] += 1
+
+    def record(self, from_page, to_page):
+        """Count one navigation and append it to the log"""
+        with self._lock:
+            self._load()
+            self.counts[from_page][to_page] += 1
+        record_event(NAVIGATION_STREAM, **{"from": from_page, "to": to_page})
+
+    def likely_next(self, page, max_pages=PREFETCH_MAX_PAGES, min_probability=PREFETCH_MIN_PROBABILITY):
+        """The pages most often opened after this one, as (page, probability), most likely first"""
+        with self._lock:
+            self._load()
+            counts = Counter(self.counts.get(page, {}))
+        counts.pop(page, None)
+        total = sum(counts.values())
+        if not total:
+            return []
+        return [(target, count / total) for target, count in counts.most_common(max_pages)
+                if count / total >= min_probability]
+
+
+class PrefetchTask:
+    """One page's data being fetched for one session"""
+
+    def __init__(self, page, user_id, future):
+        self.page = page
+        self.user_id = user_id
+        self.future = future
+        self.created = time.monotonic()
+
+
+class PagePrefetcher:
+    """Runs page data fetches in the background, at most max_concurrent at a time.
+
+    fetch(user_id) must not touch session state; it returns the session state values
+    the page's loaders would set (possibly none, when it only warms the shared cache).
+    A session holds at most one prefetch per page. Navigating claims the prefetch of the
+    page opened, and cancels the others: queued fetches never run, and running ones
+    have their results dropped.
+    """
+
+    def __init__(self, max_concurrent=PREFETCH_MAX_CONCURRENT, ttl=PREFETCH_TTL_SECONDS):
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="prefetch")
+        # Taken when a prefetch is scheduled and given back when it ends, so none wait in a queue
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._tasks = {}
+        self._lock = threading.Lock()
+
+    def _session_id(self):
+        ctx = get_script_run_ctx()
+        return ctx.session_id if ctx is not None else None
+
+    def _run(self, fetch, user_id):
+        try:
+            return fetch(user_id)
+        finally:
+            self._slots.release()
+
+    def _cancel(self, task):
+        if task.future.cancel():
+            # Never started, so _run won't give its slot back
+            self._slots.release()
+        increment("prefetch.cancelled")
+
+    def schedule(self, page, user_id, fetch):
+        """Fetch a page's data for the running session in the background, unless it is already being fetched"""
+        session_id = self._session_id()
+        if session_id is None:
+            return None
+        self.sweep()
+        with self._lock:
+            tasks = self._tasks.setdefault(session_id, {})
+            task = tasks.get(page)
+            if task is not None and task.user_id == user_id and time.monotonic() - task.created < self.ttl:
+                return task
+            if not self._slots.acquire(blocking=False):
+                increment("prefetch.skipped")
+                return None
+            future = self._executor.submit(self._run, fetch, user_id)
+            future.add_done_callback(_log_failure)
+            task = tasks[page] = PrefetchTask(page, user_id, future)
+        increment("prefetch.scheduled")
+        return task
+
+    def claim(self, page, user_id):
+        """Session state values prefetched for the page the session just opened; cancels the others"""
+        session_id = self._session_id()
+        with self._lock:
+            tasks = self._tasks.pop(session_id, {})
+        task = tasks.pop(page, None)
+        for unused in tasks.values():
+            self._cancel(unused)
+        if task is None or task.user_id != user_id or time.monotonic() - task.created > self.ttl:
+            if task is not None:
+                self._cancel(task)
+            increment("prefetch.misses")
+            return {}
+        try:
+            values = task.future.result(timeout=PREFETCH_CLAIM_WAIT_SECONDS) or {}
+        except TimeoutError:
+            self._cancel(task)
+            increment("prefetch.misses")
+            return {}
+        except Exception:
+            increment("prefetch.misses")
+            return {}
+        increment("prefetch.hits")
+        return values
+
+    def discard(self):
+        """Cancel every prefetch of the running session (logout)"""
+        with self._lock:
+            tasks = self._tasks.pop(self._session_id(), {})
+        for task in tasks.values():
+            self._cancel(task)
+
+    def sweep(self):
+        """Drop prefetches older than the TTL, for sessions that never navigated again"""
+        now = time.monotonic()
+        with self._lock:
+            stale = [(session_id, page) for session_id, tasks in self._tasks.items()
+                     for page, task in tasks.items() if now - task.created > self.ttl]
+            tasks = [self._tasks[session_id].pop(page) for session_id, page in stale]
+            for session_id in {session_id for session_id, _ in stale}:
+                if not self._tasks[session_id]:
+                    del self._tasks[session_id]
+        for task in tasks:
+            self._cancel(task)
+        return len(tasks)
+
+
+def _log_failure(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error(f"Prefetch failed: {future.exception()}")
+
+
+transition_stats = TransitionStats()
+page_prefetcher = PagePrefetcher()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show page transition probabilities used for prefetching")
+    parser.add_argument("--page", help="only transitions from this page")
+    args = parser.parse_args()
+
+    stats = TransitionStats(priors={})
+    stats._load()
+    if not stats.counts:
+        print(f"No navigation recorded in {NAVIGATION_STREAM}.jsonl")
+        return
+    for page in sorted(stats.counts):
+        if args.page and page != args.page:
+            continue
+        total = sum(stats.counts[page].values())
+        print(f"{page} ({total} navigations)")
+        for target, probability in stats.likely_next(page, max_pages=None, min_probability=0.0):
+            marker = " *" if probability >= PREFETCH_MIN_PROBABILITY else ""
+            print(f"  -> {target:<20} {probability:6.1%}{marker}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+# rerun_profiler.py
+#
+# Opt-in profiler for admin sessions: open the app with ?admin=<ADMIN_TOKEN>&profile=1
+# and every script run is profiled with cProfile. Wall time is split into categories
+# (data layer, LLM calls, dataframe prep, rendering, app code), shown in a collapsible
+# panel under the page and appended to logs/profiles.jsonl; the raw stats go to
+# logs/profiles/*.prof for snakeviz or pstats.
+#
+#   python rerun_profiler.py                  # summarize the recorded runs
+#   python rerun_profiler.py --page chatbot
+
+import os
+import time
+import pstats
+import cProfile
+import argparse
+import statistics
+import logging
+from metrics import record_event, read_events, LOG_DIR
+
+logger = logging.getLogger(__name__)
+
+PROFILE_STREAM = "profiles"
+PROFILE_STATS_DIR = os.path.join(LOG_DIR, "profiles")
+TOP_FUNCTIONS = 15
+FLAME_DEPTH = 8
+FLAME_MIN_SHARE = 0.02
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__)).replace(os.sep, "/")
+
+CATEGORIES = ("db", "llm", "dataframe", "render", "import", "app", "other")
+CATEGORY_LABELS = {
+    "db": "Data layer (Supabase)",
+    "llm": "LLM calls and waits",
+    "dataframe": "Dataframe prep",
+    "render": "Widget rendering",
+    "import": "Module imports",
+    "app": "App code",
+    "other": "Other",
+}
+
+# Path fragments that decide a function's own category, checked in order. Functions that
+# match none (stdlib, builtins, httpx, threading waits) take their callers' category.
+CATEGORY_MARKERS = (
+    ("db", ("/trial/database.py", "/supabase", "/postgrest", "/gotrue", "/storage3", "/realtime/")),
+    ("llm", ("/trial/ollama_client.py", "/trial/llm_gateway.py", "/trial/single_flight.py",
+             "/trial/hedged_generation.py", "/trial/cancellation.py", "/trial/model_router.py",
+             "/langchain", "/openai/")),
+    ("dataframe", ("/trial/mood_visualizations.py", "/pandas/", "/numpy/")),
+    ("render", ("/streamlit/", "/plotly/", "/altair/")),
+)
+
+
+def profiling_requested():
+    """Whether this run should be profiled: an admin session with ?profile in the URL"""
+    import streamlit as st
+    from admin import is_admin
+    return "profile" in st.query_params and is_admin()
+
+
+def _category(func):
+    # Module bodies and the import machinery, so a page's first-use imports don't count as its own work
+    if func[2] == "<module>" or func[0].startswith("<frozen importlib"):
+        return "import"
+    filename = func[0].replace(os.sep, "/")
+    # Markers name files relative to the app directory as /trial/...
+    if filename.startswith(APP_DIR):
+        filename = "/trial" + filename[len(APP_DIR):]
+    for category, markers in CATEGORY_MARKERS:
+        if any(marker in filename for marker in markers):
+            return category
+    if filename.startswith("/trial/"):
+        return "app"
+    return None
+
+
+def categorize(stats):
+    """Seconds of the profiled thread's time per category.
+
+    Each function's own time goes to its category; uncategorized functions (builtins,
+    stdlib, HTTP clients, lock waits) split theirs between their callers' categories in
+    proportion to the time spent under each caller.
+    """
+    raw = stats.stats
+    shares = {}
+
+    def share_of(func, visiting):
+        if func in shares:
+            return shares[func]
+        category = _category(func)
+        if category:
+            result = {category: 1.0}
+        else:
+            callers = raw[func][4] if func in raw else {}
+            # Callers already on the path are skipped, which breaks recursion cycles
+            weights = {caller: entry[3] for caller, entry in callers.items() if caller not in visiting}
+            total = sum(weights.values())
+            if not total:
+                result = {"other": 1.0}
+            else:
+                result = {}
+                for caller, weight in weights.items():
+                    for name, fraction in share_of(caller, visiting | {func}).items():
+                        result[name] = result.get(name, 0.0) + fraction * weight / total
+        shares[func] = result
+        return result
+
+    totals = dict.fromkeys(CATEGORIES, 0.0)
+    for func, (_, _, self_time, _, _) in raw.items():
+        for name, fraction in share_of(func, frozenset()).items():
+            totals[name] += self_time * fraction
+    return totals
+
+
+def _label(func):
+    filename, line, name = func
+    if filename == "~":
+        return name
+    return f"{os.path.basename(filename)}:{line}({name})"
+
+
+def top_functions(stats, limit=TOP_FUNCTIONS):
+    """The functions with the most cumulative time"""
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+    return [{"function": _label(func), "calls": calls, "self": round(self_time, 4), "cumulative": round(cumulative, 4)}
+            for func, (_, calls, self_time, cumulative, _) in rows]
+
+
+def flame(stats, root_name, depth=FLAME_DEPTH, min_share=FLAME_MIN_SHARE):
+    """Call tree below the root function as (depth, function, seconds) rows, the biggest branches first.
+
+    cProfile only keeps caller -> callee totals, so a branch shows everything the callee
+    did from that caller, not along that exact path.
+    """
+    callees = {}
+    for func, (_, _, _, _, callers) in stats.stats.items():
+        for caller, entry in callers.items():
+            callees.setdefault(caller, []).append((entry[3], func))
+    roots = [func for func in stats.stats if func[2] == root_name]
+    if not roots:
+        return []
+    root = max(roots, key=lambda func: stats.stats[func][3])
+    total = stats.stats[root][3] or 1.0
+
+    rows = []
+
+    def walk(func, seconds, level, path):
+        rows.append((level, _label(func), round(seconds, 4)))
+        if level >= depth:
+            return
+        for child_seconds, child in sorted(callees.get(func, []), reverse=True):
+            if child_seconds / total >= min_share and child not in path:
+                walk(child, child_seconds, level + 1, path | {child})
+
+    walk(root, total, 0, {root})
+    return rows
+
+
+class RunProfile:
+    """Result of one profiled script run"""
+
+    def __init__(self, page, wall, stats, root_name):
+        self.page = page
+        self.wall = wall
+        self.categories = categorize(stats)
+        # Time the profiler saw outside any function call (e.g. between the run starting and main)
+        self.categories["other"] += max(0.0, wall - sum(self.categories.values()))
+        self.top = top_functions(stats)
+        self.flame = flame(stats, root_name)
+
+
+class RunProfiler:
+    """Context manager that profiles a script run; .result holds the RunProfile afterwards.
+
+    page may be a callable, evaluated when the run ends (navigation callbacks and
+    logins change the page during the run).
+    """
+
+    def __init__(self, page, root_name="main"):
+        self.page = page
+        self.root_name = root_name
+        self.result = None
+        self._profiler = cProfile.Profile()
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        try:
+            self._profiler.enable()
+            self._enabled = True
+        except ValueError:
+            # Python 3.12+ allows one profiler per process; another admin session is profiling
+            self._enabled = False
+        return self
+
+    def __exit__(self, *exc_info):
+        if not self._enabled:
+            return False
+        self._profiler.disable()
+        wall = time.perf_counter() - self._started
+        try:
+            page = self.page() if callable(self.page) else self.page
+            self.result = RunProfile(page, wall, pstats.Stats(self._profiler), self.root_name)
+            record_profile(self.result, self._profiler)
+        except Exception as e:
+            logger.error(f"Error summarizing profile: {e}")
+        return False
+
+
+def record_profile(profile, profiler=None):
+    """Append the run to logs/profiles.jsonl, dumping the raw stats alongside"""
+    stats_path = None
+    if profiler is not None:
+        os.makedirs(PROFILE_STATS_DIR, exist_ok=True)
+        stats_path = os.path.join(PROFILE_STATS_DIR, f"{profile.page}-{time.time():.3f}.prof")
+        profiler.dump_stats(stats_path)
+    record_event(PROFILE_STREAM, page=profile.page, wall=round(profile.wall, 4),
+                 categories={k: round(v, 4) for k, v in profile.categories.items()},
+                 top=profile.top, stats_path=stats_path)
+
+
+def display_profile(profile):
+    """Collapsible breakdown of the run under the page"""
+    import streamlit as st
+    with st.expander(f"⏱ Profile: {profile.page} ran in {profile.wall * 1000:.0f} ms", expanded=False):
+        lines = ["| Category | ms | share |", "|---|---:|---|"]
+        for category in CATEGORIES:
+            seconds = profile.categories.get(category, 0.0)
+            share = seconds / profile.wall if profile.wall else 0.0
+            lines.append(f"| {CATEGORY_LABELS[category]} | {seconds * 1000:.1f} | {'█' * round(share * 20)} {share:.0%} |")
+        st.markdown("\n".join(lines))
+
+        st.markdown("**Call tree**")
+        st.code("\n".join(f"{seconds * 1000:8.1f} ms  {'  ' * level}{name}" for level, name, seconds in profile.flame)
+                or "No calls recorded", language=None)
+
+        st.markdown("**Top functions by cumulative time**")
+        st.code("\n".join(f"{row['cumulative'] * 1000:8.1f} ms {row['self'] * 1000:8.1f} ms self "
+                          f"{row['calls']:>7}x  {row['function']}" for row in profile.top), language=None)
+
+
+def summarize_profiles(page=None):
+    """Median milliseconds per category for each page in the recorded runs"""
+    by_page = {}
+    for event in read_events(PROFILE_STREAM):
+        if page and event.get("page") != page:
+            continue
+        by_page.setdefault(event.get("page"), []).append(event)
+    summary = {}
+    for name, events in by_page.items():
+        summary[name] = {
+            "runs": len(events),
+            "wall_ms": round(statistics.median(e["wall"] for e in events) * 1000, 1),
+            **{f"{category}_ms": round(statistics.median(e["categories"].get(category, 0) for e in events) * 1000, 1)
+               for category in CATEGORIES},
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize profiled script runs")
+    parser.add_argument("--page", help="only runs of this page")
+    args = parser.parse_args()
+
+    summary = summarize_profiles(args.page)
+    if not summary:
+        print(f"No runs recorded in {os.path.join(LOG_DIR, PROFILE_STREAM + '.jsonl')}")
+        return
+    header = ["page", "runs", "wall_ms"] + [f"{c}_ms" for c in CATEGORIES]
+    print("  ".join(f"{h:>12}" for h in header))
+    for name, row in sorted(summary.items(), key=lambda item: str(item[0])):
+        print("  ".join(f"{str(v):>12}" for v in [name] + [row[h] for h in header[1:]]))
+
+
+if __name__ == "__main__":
+    main()
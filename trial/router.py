@@ -0,0 +1,96 @@
+# router.py
+#
+# Page registry and callback navigation. Navigation buttons pass navigate() as their
+# on_click, so current_page is already switched when the single rerun triggered by the
+# click starts, instead of rendering the old page and calling st.rerun() for a second run.
+#
+# Renderers and loaders may be given as "module:function" strings. The module is only
+# imported when the page is first shown, so pandas, plotly, PyMuPDF, python-docx, openai
+# and langchain stay out of the login page and of sessions that never open their page.
+#
+# A page may also name a prefetch function, run in the background when the session is
+# on a page it is likely to be opened from (see prefetch.py).
+
+import importlib
+from collections import namedtuple
+import streamlit as st
+from generation_session import cancel_active_generation
+from prefetch import transition_stats, page_prefetcher, PREFETCH_ENABLED
+
+DEFAULT_PAGE = "dashboard"
+
+# render() draws the page; each loader takes the user id and puts the data the page
+# needs into session state before it renders. prefetch(user_id), if given, fetches the
+# same data off the script thread and returns the session state values to set.
+Page = namedtuple("Page", ["name", "render", "loaders", "prefetch"])
+
+PAGES = {}
+
+
+def resolve(target):
+    """A callable, or a "module:function" string imported on first use"""
+    if callable(target):
+        return target
+    module_name, _, name = target.partition(":")
+    return getattr(importlib.import_module(module_name), name)
+
+
+def add_page(name, render, loaders=(), prefetch=None):
+    """Add a page to the registry"""
+    PAGES[name] = Page(name, render, tuple(loaders), prefetch)
+
+
+def navigate(page, **state):
+    """on_click callback: switch to a page, setting any extra session state it should open with"""
+    for key, value in state.items():
+        st.session_state[key] = value
+    st.session_state['current_page'] = page
+
+
+def nav_button(label, page, key=None, **state):
+    """A full-width button that navigates to a page when clicked"""
+    return st.button(label, key=key, use_container_width=True, on_click=navigate, args=(page,), kwargs=state)
+
+
+def back_to_dashboard_button():
+    """The right-aligned "Back to Dashboard" button shown at the top of inner pages"""
+    col1, col2 = st.columns([5, 1])
+    with col2:
+        nav_button("Back to Dashboard", DEFAULT_PAGE)
+
+
+def render_current_page(user_id):
+    """Load the current page's data and render it"""
+    name = st.session_state.get('current_page')
+    if name not in PAGES:
+        name = st.session_state['current_page'] = DEFAULT_PAGE
+
+    previous = st.session_state.get('rendered_page')
+    entered = previous != name
+    if entered:
+        # Leaving a page abandons whatever it was still generating
+        cancel_active_generation()
+        st.session_state['rendered_page'] = name
+        if previous is not None:
+            transition_stats.record(previous, name)
+        if PREFETCH_ENABLED:
+            # Buffers prefetched for this page save its loaders the round trip
+            for key, value in page_prefetcher.claim(name, user_id).items():
+                st.session_state.setdefault(key, value)
+
+    page = PAGES[name]
+    for load in page.loaders:
+        resolve(load)(user_id)
+    try:
+        resolve(page.render)()
+    finally:
+        if entered and PREFETCH_ENABLED:
+            prefetch_likely_next(name, user_id)
+
+
+def prefetch_likely_next(name, user_id):
+    """Start fetching the data of the pages the session will most likely open from this one"""
+    for target, _ in transition_stats.likely_next(name):
+        prefetch = PAGES[target].prefetch if target in PAGES else None
+        if prefetch is not None:
+            page_prefetcher.schedule(target, user_id, lambda uid, prefetch=prefetch: resolve(prefetch)(uid))
@@ -0,0 +1,213 @@
+# session_memory.py
+#
+# Per-session memory accounting for the in-session buffers (chat and diary messages,
+# the paged chat history). Buffers are capped in length, sessions over the byte budget
+# are compacted, and sessions idle past SESSION_IDLE_SECONDS have their buffers freed by
+# a background sweep. Compacted or evicted buffers are dropped from session state and
+# reloaded from the database the next time a page needs them.
+
+import os
+import sys
+import time
+import logging
+import threading
+from collections import OrderedDict
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from dotenv import load_dotenv
+from metrics import increment
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+SESSION_BUFFER_MAX_MESSAGES = int(os.getenv("SESSION_BUFFER_MAX_MESSAGES", "200"))
+SESSION_BUFFER_MAX_BYTES = int(os.getenv("SESSION_BUFFER_MAX_BYTES", str(2 * 1024 * 1024)))
+SESSION_IDLE_SECONDS = int(os.getenv("SESSION_IDLE_SECONDS", "1800"))
+SESSION_SWEEP_SECONDS = int(os.getenv("SESSION_SWEEP_SECONDS", "60"))
+# Records of sessions idle this long are forgotten altogether (their buffers are already freed)
+SESSION_FORGET_SECONDS = int(os.getenv("SESSION_FORGET_SECONDS", str(24 * 3600)))
+EVICTED_SESSIONS_REMEMBERED = 10000
+
+# Session state keys holding buffers that can be rebuilt from the database
+BUFFER_KEYS = ("chat_messages", "diary_messages", "chat_history_view")
+
+
+def deep_size(obj, seen=None):
+    """Approximate bytes held by obj and the lists, dicts and strings inside it"""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in list(obj.items()))
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, seen) for item in list(obj))
+    return size
+
+
+class SessionRecord:
+    """What the governor knows about one browser session"""
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.user_id = None
+        self.last_active = time.time()
+        self.buffers = {}
+        self.size = 0
+
+
+class SessionMemoryGovernor:
+    """Tracks the buffers of every session and frees them when idle or over budget.
+
+    The sweep thread never touches another session's session_state: it clears the
+    tracked lists and dicts in place and marks the session evicted. The session drops
+    the emptied keys itself on its next run, and the page loaders reload them.
+    """
+
+    def __init__(self, idle_seconds=SESSION_IDLE_SECONDS, max_bytes=SESSION_BUFFER_MAX_BYTES):
+        self.idle_seconds = idle_seconds
+        self.max_bytes = max_bytes
+        self._sessions = {}
+        self._evicted = OrderedDict()
+        self._lock = threading.Lock()
+
+    def touch(self):
+        """Record activity for the running session; call at the start of runs and fragment runs"""
+        ctx = get_script_run_ctx()
+        if ctx is None:
+            return
+        with self._lock:
+            evicted = self._evicted.pop(ctx.session_id, None) is not None
+            record = self._sessions.get(ctx.session_id)
+            if record is None:
+                record = self._sessions[ctx.session_id] = SessionRecord(ctx.session_id)
+        if evicted:
+            drop_buffers()
+        record.user_id = st.session_state.get('user_id')
+        record.last_active = time.time()
+        record.buffers = {key: st.session_state[key] for key in BUFFER_KEYS if key in st.session_state}
+        record.size = sum(deep_size(buffer) for buffer in record.buffers.values())
+        if record.size > self.max_bytes:
+            # Reloading keeps just the latest page of each buffer
+            logger.info(f"Compacting session {ctx.session_id}: {record.size} bytes of buffers")
+            increment("session_memory.compacted")
+            drop_buffers()
+            record.buffers = {}
+            record.size = 0
+
+    def forget(self):
+        """Stop tracking the running session (logout)"""
+        ctx = get_script_run_ctx()
+        if ctx is not None:
+            with self._lock:
+                self._sessions.pop(ctx.session_id, None)
+
+    def sweep(self, now=None):
+        """Free the buffers of idle sessions; returns how many were evicted"""
+        now = now or time.time()
+        with self._lock:
+            idle = [r for r in self._sessions.values() if now - r.last_active > self.idle_seconds and r.buffers]
+            for record in [r for r in self._sessions.values() if now - r.last_active > SESSION_FORGET_SECONDS]:
+                del self._sessions[record.session_id]
+        for record in idle:
+            for buffer in record.buffers.values():
+                buffer.clear()
+            record.buffers = {}
+            record.size = 0
+            with self._lock:
+                self._evicted[record.session_id] = now
+                while len(self._evicted) > EVICTED_SESSIONS_REMEMBERED:
+                    self._evicted.popitem(last=False)
+        if idle:
+            increment("session_memory.evicted", len(idle))
+            logger.info(f"Evicted buffers of {len(idle)} idle sessions")
+        return len(idle)
+
+    def report(self, top_n=10):
+        """Total and largest session footprints"""
+        with self._lock:
+            records = list(self._sessions.values())
+            evicted = len(self._evicted)
+        now = time.time()
+        records.sort(key=lambda r: r.size, reverse=True)
+        try:
+            import resource
+            max_rss_mb = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+        except ImportError:  # Windows
+            max_rss_mb = None
+        return {
+            "sessions": len(records),
+            "total_bytes": sum(r.size for r in records),
+            "evicted_sessions": evicted,
+            "max_rss_mb": max_rss_mb,
+            "top": [{"session_id": r.session_id, "user_id": r.user_id, "bytes": r.size,
+                     "idle_seconds": round(now - r.last_active), "buffers": sorted(r.buffers)}
+                    for r in records[:top_n]],
+        }
+
+
+def drop_buffers():
+    """Remove the running session's buffers so the page loaders rebuild them from the database"""
+    for key in BUFFER_KEYS:
+        st.session_state.pop(key, None)
+    st.session_state.pop('chat_has_older', None)
+    st.session_state.pop('chat_window', None)
+
+
+def cap_buffer(messages, max_messages=SESSION_BUFFER_MAX_MESSAGES):
+    """Drop the oldest messages past the cap, keeping whole user/assistant turns; returns how many went"""
+    overflow = len(messages) - max_messages
+    if overflow <= 0:
+        return 0
+    overflow += overflow % 2
+    del messages[:overflow]
+    return overflow
+
+
+session_memory = SessionMemoryGovernor()
+
+
+class SessionMemorySweeper:
+    """Background thread that evicts idle sessions' buffers"""
+
+    def __init__(self, governor=session_memory, interval=SESSION_SWEEP_SECONDS):
+        self.governor = governor
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="session-memory-sweep", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.governor.sweep()
+            except Exception as e:
+                logger.error(f"Session memory sweep failed: {e}")
+
+
+def start_session_sweeper():
+    """Start the idle session sweep once per server process"""
+    return SessionMemorySweeper().start()
+
+
+def display_session_memory(top_n=10):
+    """Admin view of session buffer footprints"""
+    report = session_memory.report(top_n)
+    with st.sidebar.expander("Session memory"):
+        st.markdown(f"**{report['sessions']}** sessions holding **{report['total_bytes'] / 1024:.0f} KB** "
+                    f"of buffers; {report['evicted_sessions']} idle sessions currently evicted. "
+                    f"Process max RSS {report['max_rss_mb']} MB.")
+        lines = ["| Session | User | KB | Idle | Buffers |", "|---|---|---:|---:|---|"]
+        for row in report["top"]:
+            lines.append(f"| {row['session_id'][:8]} | {str(row['user_id'] or '-')[:8]} | {row['bytes'] / 1024:.0f} "
+                         f"| {row['idle_seconds']}s | {', '.join(row['buffers']) or '-'} |")
+        st.markdown("\n".join(lines))
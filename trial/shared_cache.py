@@ -0,0 +1,226 @@
+# shared_cache.py
+#
+# Cache tier shared by every app process on the host, backed by one SQLite file in WAL
+# mode. Keys live in namespaces (e.g. one per user); a write bumps the namespace version,
+# which invalidates its entries for all processes at once.
+#
+#   python shared_cache.py --stats
+#   python shared_cache.py --invalidate user:<id>
+#   python shared_cache.py --clear
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import argparse
+import threading
+from dotenv import load_dotenv
+from metrics import increment, get_counters
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+SHARED_CACHE_ENABLED = os.getenv("SHARED_CACHE_ENABLED", "true").lower() == "true"
+SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH", os.path.join(".cache", "shared_cache.sqlite3"))
+SHARED_CACHE_TTL_SECONDS = int(os.getenv("SHARED_CACHE_TTL_SECONDS", "600"))
+SHARED_CACHE_MAX_ENTRIES = int(os.getenv("SHARED_CACHE_MAX_ENTRIES", "50000"))
+SHARED_CACHE_MAX_VALUE_BYTES = int(os.getenv("SHARED_CACHE_MAX_VALUE_BYTES", str(1024 * 1024)))
+PRUNE_EVERY_PUTS = 500
+
+# Bump when the shape of cached values changes; old entries are then ignored
+CACHE_FORMAT_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS idx_entries_expires_at ON entries(expires_at);
+CREATE TABLE IF NOT EXISTS versions (
+    namespace TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+"""
+
+_MISSING = object()
+
+
+def user_namespace(user_id):
+    """Namespace of everything cached for one user"""
+    return f"user:{user_id}"
+
+
+class SharedCache:
+    """SQLite-backed cache with versioned namespaces, safe to use from many processes and threads.
+
+    get_or_load() reads the namespace version before loading, and stores the value under
+    that version. A write that invalidates the namespace while the load is in flight
+    therefore leaves the stale value unreachable instead of caching it.
+    """
+
+    def __init__(self, path=SHARED_CACHE_PATH, enabled=SHARED_CACHE_ENABLED):
+        self.path = path
+        self.enabled = enabled
+        self._local = threading.local()
+        self._puts = 0
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=2.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def _namespace(self, namespace):
+        return f"{CACHE_FORMAT_VERSION}:{namespace}"
+
+    def version(self, namespace):
+        """Current version of a namespace"""
+        row = self._connection().execute("SELECT version FROM versions WHERE namespace = ?",
+                                         (self._namespace(namespace),)).fetchone()
+        return row[0] if row else 0
+
+    def get(self, namespace, key, default=None):
+        """The cached value, or default if missing, expired or invalidated"""
+        if not self.enabled:
+            return default
+        try:
+            row = self._connection().execute(
+                "SELECT e.value FROM entries e LEFT JOIN versions v ON v.namespace = e.namespace "
+                "WHERE e.namespace = ? AND e.key = ? AND e.version = COALESCE(v.version, 0) AND e.expires_at > ?",
+                (self._namespace(namespace), key, time.time())).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Shared cache read failed: {e}")
+            return default
+        if row is None:
+            increment("shared_cache.misses")
+            return default
+        increment("shared_cache.hits")
+        return json.loads(row[0])
+
+    def put(self, namespace, key, value, ttl=SHARED_CACHE_TTL_SECONDS, version=None):
+        """Store a JSON-serializable value; version defaults to the namespace's current one"""
+        if not self.enabled:
+            return
+        try:
+            data = json.dumps(value, default=str)
+            if len(data) > SHARED_CACHE_MAX_VALUE_BYTES:
+                return
+            conn = self._connection()
+            if version is None:
+                version = self.version(namespace)
+            conn.execute("INSERT OR REPLACE INTO entries (namespace, key, version, value, expires_at) "
+                         "VALUES (?, ?, ?, ?, ?)",
+                         (self._namespace(namespace), key, version, data, time.time() + ttl))
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.error(f"Shared cache write failed: {e}")
+            return
+        with self._lock:
+            self._puts += 1
+            due = self._puts % PRUNE_EVERY_PUTS == 0
+        if due:
+            self.prune()
+
+    def get_or_load(self, namespace, key, loader, ttl=SHARED_CACHE_TTL_SECONDS, cache_if=None):
+        """Cached value, calling loader() and caching its result on a miss.
+
+        cache_if(value) can veto caching a result (e.g. an empty result from a failed query).
+        """
+        if not self.enabled:
+            return loader()
+        try:
+            version = self.version(namespace)
+        except sqlite3.Error as e:
+            logger.error(f"Shared cache read failed: {e}")
+            return loader()
+        value = self.get(namespace, key, _MISSING)
+        if value is not _MISSING:
+            return value
+        value = loader()
+        if cache_if is None or cache_if(value):
+            self.put(namespace, key, value, ttl, version=version)
+        return value
+
+    def invalidate(self, namespace):
+        """Make every entry in the namespace stale, for all processes"""
+        if not self.enabled:
+            return
+        try:
+            self._connection().execute(
+                "INSERT INTO versions (namespace, version) VALUES (?, 1) "
+                "ON CONFLICT(namespace) DO UPDATE SET version = version + 1",
+                (self._namespace(namespace),))
+            increment("shared_cache.invalidations")
+        except sqlite3.Error as e:
+            logger.error(f"Shared cache invalidation of {namespace} failed: {e}")
+
+    def prune(self, max_entries=SHARED_CACHE_MAX_ENTRIES):
+        """Delete expired and superseded entries, then the soonest to expire past max_entries"""
+        try:
+            conn = self._connection()
+            conn.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),))
+            conn.execute("DELETE FROM entries WHERE version < COALESCE("
+                         "(SELECT version FROM versions v WHERE v.namespace = entries.namespace), 0)")
+            conn.execute("DELETE FROM entries WHERE rowid IN (SELECT rowid FROM entries "
+                         "ORDER BY expires_at DESC LIMIT -1 OFFSET ?)", (max_entries,))
+        except sqlite3.Error as e:
+            logger.error(f"Shared cache prune failed: {e}")
+
+    def clear(self):
+        conn = self._connection()
+        conn.execute("DELETE FROM entries")
+        conn.execute("DELETE FROM versions")
+
+    def stats(self):
+        """Entry counts per namespace kind and this process's hit rate"""
+        conn = self._connection()
+        kinds = {}
+        for namespace, count, size in conn.execute(
+                "SELECT namespace, COUNT(*), SUM(LENGTH(value)) FROM entries GROUP BY namespace"):
+            kind = namespace.split(":")[1] if ":" in namespace else namespace
+            entry = kinds.setdefault(kind, {"entries": 0, "bytes": 0})
+            entry["entries"] += count
+            entry["bytes"] += size or 0
+        counters = get_counters("shared_cache.")
+        lookups = counters.get("shared_cache.hits", 0) + counters.get("shared_cache.misses", 0)
+        return {
+            "path": self.path,
+            "namespaces": kinds,
+            "process_hit_rate": round(counters.get("shared_cache.hits", 0) / lookups, 3) if lookups else None,
+        }
+
+
+shared_cache = SharedCache()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect the shared cache")
+    parser.add_argument("--stats", action="store_true", help="print entry counts per namespace kind")
+    parser.add_argument("--invalidate", metavar="NAMESPACE", help="invalidate a namespace, e.g. user:<id>")
+    parser.add_argument("--clear", action="store_true", help="delete every entry")
+    args = parser.parse_args()
+
+    if args.invalidate:
+        shared_cache.invalidate(args.invalidate)
+        print(f"Invalidated {args.invalidate}")
+    if args.clear:
+        shared_cache.clear()
+        print("Cleared the shared cache")
+    if args.stats or not (args.invalidate or args.clear):
+        print(json.dumps(shared_cache.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+# single_flight.py
+
+import os
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from cancellation import GenerationCancelled
+from metrics import increment
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# A repeat of a completed submission within this window returns the stored result instead of running again
+IDEMPOTENCY_WINDOW_SECONDS = int(os.getenv("IDEMPOTENCY_WINDOW_SECONDS", "120"))
+
+# Background submissions run here, so the caller only follows them and wakes up regularly to be stopped
+_flight_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="flight")
+
+
+def submission_key(user_id, kind, payload):
+    """Idempotency key for one user's submission of the given payload"""
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    digest = hashlib.sha256(payload).hexdigest()
+    return f"{kind}:{user_id}:{digest}"
+
+
+def new_submission_key(user_id, kind):
+    """Idempotency key for one submission, minted when the user submits it; asking again gets a new one"""
+    return submission_key(user_id, kind, uuid.uuid4().hex)
+
+
+class Flight:
+    """One in-progress call whose tokens and result are shared by every caller with the same key"""
+
+    def __init__(self, key):
+        self.key = key
+        self.tokens = []
+        self.wait = None
+        self.done = False
+        self.result = None
+        self.error = None
+        self._cond = threading.Condition()
+
+    def emit_token(self, token):
+        with self._cond:
+            self.tokens.append(token)
+            self._cond.notify_all()
+
+    def emit_wait(self, ahead, eta):
+        with self._cond:
+            self.wait = (ahead, eta)
+            self._cond.notify_all()
+
+    def finish(self, result=None, error=None):
+        with self._cond:
+            self.result = result
+            self.error = error
+            self.done = True
+            self._cond.notify_all()
+
+    def follow(self, handle=None, on_token=None, on_wait=None, on_idle=None, poll_interval=0.5):
+        """Replay the flight's tokens as they arrive and return its result.
+
+        The caller stops following when its own handle is cancelled or it is
+        interrupted. Like run_interruptible, an interruption (including Streamlit's
+        stop/rerun signals) cancels the handle, which aborts the flight when this
+        caller leads it; other followers then take over.
+        """
+        try:
+            return self._follow(handle, on_token, on_wait, on_idle, poll_interval)
+        except BaseException as e:
+            # The flight's own error is for every caller; anything else is this caller being interrupted
+            if handle and e is not self.error:
+                handle.cancel()
+            raise
+
+    def _follow(self, handle, on_token, on_wait, on_idle, poll_interval):
+        seen = 0
+        last_wait = None
+        while True:
+            with self._cond:
+                if seen == len(self.tokens) and not self.done and self.wait == last_wait:
+                    self._cond.wait(poll_interval)
+                tokens = self.tokens[seen:]
+                wait = self.wait
+                done = self.done
+            seen += len(tokens)
+
+            if handle:
+                handle.check()
+            for token in tokens:
+                if on_token:
+                    on_token(token)
+            if wait != last_wait:
+                last_wait = wait
+                if on_wait and not seen:
+                    on_wait(*wait)
+            if done and seen == len(self.tokens):
+                if self.error is not None:
+                    raise self.error
+                return self.result
+            if not tokens and on_idle:
+                on_idle()
+
+
+class SingleFlight:
+    """Collapse concurrent calls with the same key into one execution.
+
+    The first caller for a key leads: its fn(emit_token, emit_wait) runs once and
+    every other caller with that key follows it, receiving the same streamed tokens
+    and the same result. If the leader is cancelled, a follower that still wants the
+    result takes over. Successful results are remembered for remember_seconds so a
+    repeated submission does not run again.
+    """
+
+    def __init__(self, name, remember_seconds=0):
+        self.name = name
+        self.remember_seconds = remember_seconds
+        self._flights = {}
+        self._recent = {}
+        self._lock = threading.Lock()
+
+    def _join_or_lead(self, key):
+        with self._lock:
+            now = time.monotonic()
+            for stale in [k for k, (at, _) in self._recent.items() if now - at > self.remember_seconds]:
+                del self._recent[stale]
+            if key in self._recent:
+                return self._recent[key][1], "recent"
+            if key in self._flights:
+                return self._flights[key], "follow"
+            flight = Flight(key)
+            self._flights[key] = flight
+            return flight, "lead"
+
+    def _execute(self, flight, fn, on_token=None, on_wait=None):
+        def emit_token(token):
+            flight.emit_token(token)
+            if on_token:
+                on_token(token)
+
+        def emit_wait(ahead, eta):
+            flight.emit_wait(ahead, eta)
+            if on_wait:
+                on_wait(ahead, eta)
+
+        try:
+            result = fn(emit_token, emit_wait)
+        except BaseException as e:
+            with self._lock:
+                self._flights.pop(flight.key, None)
+            flight.finish(error=e)
+            raise
+        with self._lock:
+            self._flights.pop(flight.key, None)
+            if self.remember_seconds:
+                self._recent[flight.key] = (time.monotonic(), flight)
+        flight.finish(result=result)
+        return result
+
+    def run(self, key, fn, handle=None, on_token=None, on_wait=None, on_idle=None, background=False):
+        """Return (result, shared) for fn(emit_token, emit_wait), running it at most once per key.
+
+        With background=True the leader's call runs on a worker thread and the caller
+        follows it like everyone else, so the caller's thread stays responsive to
+        Streamlit's stop/rerun signals; interrupting it still cancels its handle.
+        Otherwise the leader runs fn inline.
+        """
+        while True:
+            flight, role = self._join_or_lead(key)
+            if role == "recent":
+                increment(f"single_flight.{self.name}.replayed")
+                return flight.result, True
+
+            if role == "lead" and not background:
+                return self._execute(flight, fn, on_token, on_wait), False
+            if role == "lead":
+                _flight_executor.submit(self._execute, flight, fn).add_done_callback(lambda f: f.exception())
+            else:
+                increment(f"single_flight.{self.name}.joined")
+                logger.info(f"{self.name}: joining in-flight request {key}")
+
+            try:
+                return flight.follow(handle, on_token, on_wait, on_idle), role == "follow"
+            except GenerationCancelled:
+                if (handle and handle.cancelled) or role == "lead":
+                    raise
+                # The leader gave up but this caller still wants the result: run it again
+                continue
@@ -0,0 +1,117 @@
+# startup_benchmark.py
+#
+# Cold start benchmark for the Streamlit app. Each run is a fresh interpreter started
+# with -X importtime that renders the login page once through streamlit's AppTest.
+#
+#   python startup_benchmark.py --runs 5
+#   python startup_benchmark.py --logged-in --top 30    # dashboard instead of the login page
+#   python startup_benchmark.py --importtime-out importtime.txt
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+# Modules that should only be imported by the pages that use them
+HEAVY_MODULES = ("pandas", "plotly", "fitz", "docx", "openai", "langchain_openai", "langchain_core",
+                 "langchain_community", "supabase")
+
+
+def child(logged_in):
+    """Render one page in this process and print the measurements as JSON"""
+    import resource
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=120)
+    if logged_in:
+        at.session_state["logged_in"] = True
+        at.session_state["user_id"] = os.getenv("BENCHMARK_USER_ID", "00000000-0000-0000-0000-000000000000")
+        at.session_state["user_name"] = "Benchmark"
+        at.session_state["user_email"] = "benchmark@example.com"
+    started = time.perf_counter()
+    at.run()
+    elapsed = time.perf_counter() - started
+    print(json.dumps({
+        "run_seconds": round(elapsed, 4),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "exception": [e.value for e in at.exception],
+        "heavy_modules": [name for name in HEAVY_MODULES if name in sys.modules],
+    }))
+
+
+def parse_importtime(stderr):
+    """(module, self us, cumulative us, depth) for each line of an -X importtime report"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|")
+            rows.append((name.strip(), int(self_us), int(cumulative_us), (len(name) - len(name.lstrip())) // 2))
+        except ValueError:
+            continue  # header line
+    return rows
+
+
+def run_once(logged_in):
+    command = [sys.executable, "-X", "importtime", os.path.abspath(__file__), "--child"]
+    if logged_in:
+        command.append("--logged-in")
+    started = time.perf_counter()
+    proc = subprocess.run(command, capture_output=True, text=True, cwd=os.path.dirname(APP_PATH))
+    wall = time.perf_counter() - started
+    result_line = next((line for line in reversed(proc.stdout.splitlines()) if line.startswith("{")), None)
+    if proc.returncode != 0 or result_line is None:
+        raise RuntimeError(f"benchmark run failed:\n{proc.stderr[-2000:]}")
+    result = json.loads(result_line)
+    result["process_seconds"] = round(wall, 4)
+    return result, proc.stderr
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold start time, imports and RSS of the app")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=20, help="number of imports to list by cumulative time")
+    parser.add_argument("--logged-in", action="store_true", help="render the dashboard instead of the login page")
+    parser.add_argument("--importtime-out", help="write the raw -X importtime report of the first run here")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.logged_in)
+        return
+
+    results = []
+    report = None
+    for _ in range(args.runs):
+        result, stderr = run_once(args.logged_in)
+        results.append(result)
+        report = report or stderr
+
+    if args.importtime_out:
+        with open(args.importtime_out, "w", encoding="utf-8") as f:
+            f.write(report)
+
+    page = "dashboard" if args.logged_in else "login page"
+    rows = parse_importtime(report)
+    top_level = sum(cumulative for _, _, cumulative, depth in rows if depth == 0)
+    print(f"{page}, {args.runs} cold runs")
+    print(f"  script run    median {statistics.median(r['run_seconds'] for r in results) * 1000:.0f} ms")
+    print(f"  process       median {statistics.median(r['process_seconds'] for r in results) * 1000:.0f} ms")
+    print(f"  max RSS       median {statistics.median(r['max_rss_mb'] for r in results):.1f} MB")
+    print(f"  imports       {top_level / 1000:.0f} ms total")
+    print(f"  heavy modules loaded: {', '.join(results[0]['heavy_modules']) or 'none'}")
+    if results[0]["exception"]:
+        print(f"  script raised: {results[0]['exception']}")
+    print(f"\nTop {args.top} imports by cumulative time (first run):")
+    for name, self_us, cumulative_us, depth in sorted(rows, key=lambda r: r[2], reverse=True)[:args.top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {self_us / 1000:7.1f} ms self  {'  ' * depth}{name}")
+
+
+if __name__ == "__main__":
+    main()
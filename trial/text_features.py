@@ -0,0 +1,57 @@
+# text_features.py
+
+import re
+import zlib
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+DEFAULT_DIM = 2 ** 16
+
+
+def tokenize(text):
+    """Lowercase word tokens"""
+    return TOKEN_PATTERN.findall((text or "").lower())
+
+
+def hash_token(token, dim=DEFAULT_DIM):
+    """Stable feature index for a token (Python's hash() changes between processes)"""
+    return zlib.crc32(token.encode("utf-8")) % dim
+
+
+def ngrams(tokens, max_n=2):
+    """Unigrams plus joined n-grams up to max_n"""
+    grams = list(tokens)
+    for n in range(2, max_n + 1):
+        grams.extend(" ".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+    return grams
+
+
+def hashed_features(text, dim=DEFAULT_DIM, max_n=2):
+    """Sparse hashed n-gram counts for one text as (indices, counts) arrays"""
+    grams = ngrams(tokenize(text), max_n)
+    if not grams:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    indices, counts = np.unique([hash_token(g, dim) for g in grams], return_counts=True)
+    return indices.astype(np.int64), counts.astype(np.float32)
+
+
+def hashed_feature_batch(texts, dim=DEFAULT_DIM, max_n=2):
+    """Sparse features for many texts as parallel (rows, indices, counts) arrays"""
+    rows, indices, counts = [], [], []
+    for row, text in enumerate(texts):
+        idx, cnt = hashed_features(text, dim, max_n)
+        rows.append(np.full(len(idx), row, dtype=np.int64))
+        indices.append(idx)
+        counts.append(cnt)
+    if not rows:
+        return (np.zeros(0, dtype=np.int64),) * 2 + (np.zeros(0, dtype=np.float32),)
+    return np.concatenate(rows), np.concatenate(indices), np.concatenate(counts)
+
+
+def hashed_vector(text, dim=DEFAULT_DIM, max_n=2):
+    """Dense L2-normalized hashed n-gram vector, for cosine similarity between short texts"""
+    vector = np.zeros(dim, dtype=np.float32)
+    idx, cnt = hashed_features(text, dim, max_n)
+    vector[idx] = cnt
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
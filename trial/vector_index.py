@@ -0,0 +1,334 @@
+# vector_index.py
+
+import os
+import json
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from dotenv import load_dotenv
+from llm_gateway import get_gateway, PRIORITY_BACKGROUND
+from model_router import OLLAMA_BASE_URL
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process lock applies
+    fcntl = None
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", os.path.join(".cache", "vector_index"))
+EMBED_MODEL = os.getenv("OLLAMA_EMBED_MODEL", "nomic-embed-text")
+CHUNK_SIZE = 800
+CHUNK_OVERLAP = 100
+MIN_SCORE = 0.35
+
+# Index writes happen off the interactive path, one at a time per process; the file lock
+# in UserVectorIndex.locked() orders them between processes (Streamlit and API workers)
+_index_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vector-index")
+_user_locks = {}
+_user_locks_guard = threading.Lock()
+_backfills_queued = set()
+_embeddings = None
+
+
+def get_embeddings():
+    """Initialize the Ollama embedding model once per process"""
+    global _embeddings
+    if _embeddings is None:
+        from langchain_community.embeddings import OllamaEmbeddings
+        _embeddings = OllamaEmbeddings(model=EMBED_MODEL, base_url=OLLAMA_BASE_URL)
+    return _embeddings
+
+
+def _user_lock(user_id):
+    with _user_locks_guard:
+        # Reentrant: indexing holds it while UserVectorIndex.add takes it again with the file lock
+        return _user_locks.setdefault(str(user_id), threading.RLock())
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def chunk_text(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    """Split document text into overlapping chunks on whitespace boundaries"""
+    text = " ".join((text or "").split())
+    if not text:
+        return []
+
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        if end < len(text):
+            # Avoid cutting a word in half
+            space = text.rfind(" ", start + chunk_size // 2, end)
+            if space != -1:
+                end = space
+        chunks.append(text[start:end].strip())
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return [c for c in chunks if c]
+
+
+class UserVectorIndex:
+    """Append-only vector index for one user, stored as a memory-mapped float32 matrix.
+
+    Layout of the user's directory:
+      vectors.f32  - row-major float32 matrix of unit-length embeddings
+      meta.jsonl   - one JSON line per row: source, row_id and the indexed text
+      info.json    - embedding dimension and whether the DB backfill has run
+      .lock        - taken by writers, in every process, while they change the files
+
+    Row i of vectors.f32 belongs to line i of meta.jsonl. Writers trim whatever a crash
+    left past the last complete pair before appending, so the two never drift apart.
+    """
+
+    def __init__(self, user_id, base_dir=INDEX_DIR):
+        self.user_id = str(user_id)
+        self.path = os.path.join(base_dir, self.user_id)
+        self.vectors_path = os.path.join(self.path, "vectors.f32")
+        self.meta_path = os.path.join(self.path, "meta.jsonl")
+        self.info_path = os.path.join(self.path, "info.json")
+        self.lock_path = os.path.join(self.path, ".lock")
+
+    @contextmanager
+    def locked(self):
+        """Hold this user's index lock, shared by every thread and process writing to it"""
+        with _user_lock(self.user_id):
+            os.makedirs(self.path, exist_ok=True)
+            with open(self.lock_path, "a") as lock_file:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def load_info(self):
+        if not os.path.exists(self.info_path):
+            return {"dim": None, "backfilled": False, "deleted": []}
+        with open(self.info_path, "r", encoding="utf-8") as f:
+            info = json.load(f)
+        info.setdefault("deleted", [])
+        return info
+
+    def save_info(self, info):
+        os.makedirs(self.path, exist_ok=True)
+        tmp_path = self.info_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(info, f)
+        os.replace(tmp_path, self.info_path)
+
+    def load_meta(self):
+        if not os.path.exists(self.meta_path):
+            return []
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            # A line without its newline is a write that hasn't finished (or never will)
+            return [json.loads(line) for line in f if line.endswith("\n") and line.strip()]
+
+    def indexed_keys(self):
+        """Return the (source, row_id) pairs already present in the index"""
+        return {(m["source"], m["row_id"]) for m in self.load_meta()}
+
+    def _trim(self, dim):
+        """Cut both files back to the last complete vector/metadata pair; returns the row count"""
+        size = 0
+        rows = 0
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    size += len(line)
+                    rows += line.strip() != b""
+            if size != os.path.getsize(self.meta_path):
+                os.truncate(self.meta_path, size)
+        vectors_size = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+        if vectors_size < rows * dim * 4:
+            raise ValueError(f"Vector index for user {self.user_id} has fewer vectors than metadata rows")
+        if vectors_size > rows * dim * 4:
+            os.truncate(self.vectors_path, rows * dim * 4)
+        return rows
+
+    def add(self, vectors, metas):
+        """Append normalized vectors and their metadata to the on-disk index"""
+        if not metas:
+            return
+        vectors = _normalize(vectors)
+        with self.locked():
+            info = self.load_info()
+            if info["dim"] is None:
+                info["dim"] = int(vectors.shape[1])
+                self.save_info(info)
+            elif info["dim"] != vectors.shape[1]:
+                raise ValueError(f"Embedding dimension changed from {info['dim']} to {vectors.shape[1]}")
+
+            # Drop rows left over by a crash between the two writes, then vectors first, metadata second
+            self._trim(info["dim"])
+            with open(self.vectors_path, "ab") as f:
+                f.write(vectors.tobytes())
+            with open(self.meta_path, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(meta) + "\n" for meta in metas))
+
+    def search(self, query_vector, top_k=4, min_score=MIN_SCORE):
+        """Return the top_k metadata rows by cosine similarity to the query"""
+        info = self.load_info()
+        if not info["dim"] or not os.path.exists(self.vectors_path):
+            return []
+
+        metas = self.load_meta()
+        row_count = min(len(metas), os.path.getsize(self.vectors_path) // (4 * info["dim"]))
+        if row_count == 0:
+            return []
+
+        matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(row_count, info["dim"]))
+        query = _normalize([query_vector])[0]
+        scores = np.array(matrix @ query)
+
+        # Rows of deleted documents stay in the file but never match
+        deleted = {tuple(key) for key in info["deleted"]}
+        if deleted:
+            for i, meta in enumerate(metas[:row_count]):
+                if (meta["source"], meta["row_id"]) in deleted:
+                    scores[i] = -1.0
+
+        k = min(top_k, row_count)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [dict(metas[i], score=float(scores[i])) for i in top if scores[i] >= min_score]
+
+
+def _embed_and_add(index, items):
+    """Embed (meta, text) items and append them to the index"""
+    items = [(meta, text) for meta, text in items if text.strip()]
+    if not items:
+        return
+    texts = [text for _, text in items]
+    vectors = get_gateway().run(lambda: get_embeddings().embed_documents(texts), index.user_id, PRIORITY_BACKGROUND)
+    index.add(vectors, [dict(meta, text=text) for meta, text in items])
+
+
+def _chat_items(row):
+    text = f"User: {row['question']}\nAssistant: {row['answer']}"
+    return [({"source": "chat", "row_id": row.get("id"), "created_at": row.get("created_at")}, text)]
+
+
+def _document_items(row):
+    items = []
+    for i, chunk in enumerate(chunk_text(row.get("extracted_text", ""))):
+        meta = {"source": "document", "row_id": row.get("id"), "chunk": i,
+                "file_name": row.get("file_name"), "created_at": row.get("created_at")}
+        items.append((meta, chunk))
+    return items
+
+
+def backfill_user_index(user_id, db):
+    """Index any chat turns and documents saved before the index existed"""
+    index = UserVectorIndex(user_id)
+    with _user_lock(user_id):
+        info = index.load_info()
+        if info["backfilled"]:
+            return
+        known = index.indexed_keys()
+        items = []
+        for row in db.get_chat_history(user_id):
+            if ("chat", row.get("id")) not in known:
+                items.extend(_chat_items(row))
+        for row in db.get_user_documents(user_id):
+            if ("document", row.get("id")) not in known:
+                items.extend(_document_items(row))
+        _embed_and_add(index, items)
+        with index.locked():
+            info = index.load_info()
+            info["backfilled"] = True
+            index.save_info(info)
+
+
+def _index_rows(user_id, items):
+    index = UserVectorIndex(user_id)
+    try:
+        with _user_lock(user_id):
+            known = index.indexed_keys()
+            _embed_and_add(index, [(m, t) for m, t in items if (m["source"], m["row_id"]) not in known])
+    except Exception as e:
+        logger.error(f"Error indexing rows for user {user_id}: {e}")
+
+
+def index_chat_turn(user_id, row):
+    """Queue a saved chat_history row for indexing"""
+    if isinstance(row, dict):
+        _index_executor.submit(_index_rows, user_id, _chat_items(row))
+
+
+def index_document(user_id, row):
+    """Queue a saved user_documents row for chunking and indexing"""
+    if isinstance(row, dict):
+        _index_executor.submit(_index_rows, user_id, _document_items(row))
+
+
+def ensure_backfilled(user_id, db):
+    """Queue a one-off backfill for users whose index predates their saved rows"""
+    with _user_locks_guard:
+        if str(user_id) in _backfills_queued:
+            return
+        _backfills_queued.add(str(user_id))
+    if not UserVectorIndex(user_id).load_info()["backfilled"]:
+        _index_executor.submit(_safe_backfill, user_id, db)
+
+
+def _safe_backfill(user_id, db):
+    try:
+        backfill_user_index(user_id, db)
+    except Exception as e:
+        logger.error(f"Error backfilling index for user {user_id}: {e}")
+        with _user_locks_guard:
+            _backfills_queued.discard(str(user_id))
+
+
+def remove_document(user_id, document_id):
+    """Exclude a deleted document's chunks from future searches"""
+    index = UserVectorIndex(user_id)
+    try:
+        with index.locked():
+            info = index.load_info()
+            if info["dim"] is None:
+                return
+            info["deleted"].append(["document", document_id])
+            index.save_info(info)
+    except Exception as e:
+        logger.error(f"Error removing document {document_id} from index: {e}")
+
+
+def retrieve_context(user_id, question, db, top_k=4):
+    """Return the most relevant past turns and document passages formatted for the prompt"""
+    try:
+        ensure_backfilled(user_id, db)
+        query_vector = get_embeddings().embed_query(question)
+        hits = UserVectorIndex(user_id).search(query_vector, top_k=top_k)
+    except Exception as e:
+        logger.error(f"Error retrieving context for user {user_id}: {e}")
+        return "None found"
+
+    if not hits:
+        return "None found"
+
+    passages = []
+    for hit in hits:
+        date = (hit.get("created_at") or "").split("T")[0]
+        if hit["source"] == "document":
+            label = f"From document '{hit.get('file_name')}' ({date})"
+        else:
+            label = f"Earlier conversation ({date})"
+        passages.append(f"{label}:\n{hit['text']}")
+    return "\n\n".join(passages)
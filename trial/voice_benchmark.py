@@ -0,0 +1,169 @@
+# voice_benchmark.py
+#
+# Benchmark of the offline voice input on recorded WAV fixtures (16-bit PCM, any rate).
+# Each file is streamed frame by frame through the VAD and recognizer with endpointing,
+# as live microphone input is, and the first utterance is sent to the model the chat
+# would route it to.
+# Reported per file: the recognizer's real-time factor, and the latency from the end of
+# speech to the first LLM token, split into the trailing silence the endpointer waits
+# for, the final decode and the model's time to first token. A <name>.txt next to a
+# fixture holds its reference transcript, for the word error rate.
+#
+#   python voice_benchmark.py fixtures/voice/*.wav
+#   python voice_benchmark.py fixtures/voice/*.wav --realtime    # feed audio at speaking pace
+#   python voice_benchmark.py fixtures/voice/*.wav --no-llm --end-silence-ms 500
+
+import os
+import json
+import time
+import argparse
+import statistics
+from voice_input import (FRAME_MS, VOICE_END_SILENCE_MS, VOSK_MODEL_PATH, SAMPLE_RATE, StreamingTranscriber,
+                         wav_chunks)
+
+
+def word_error_rate(reference, hypothesis):
+    """Word-level edit distance over the reference length"""
+    ref, hyp = reference.lower().split(), hypothesis.lower().split()
+    if not ref:
+        return None
+    row = list(range(len(hyp) + 1))
+    for i, word in enumerate(ref, 1):
+        previous, row[0] = row[0], i
+        for j, guess in enumerate(hyp, 1):
+            previous, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, previous + (word != guess))
+    return row[-1] / len(ref)
+
+
+def transcribe_file(path, model, end_silence_ms, realtime):
+    """Stream one file through a transcriber; returns the Transcript and the wall clock time speech ended.
+
+    With realtime, each frame is fed when it would have finished arriving from a
+    microphone, so the end of speech is a point in wall clock time and decoding that
+    falls behind shows up as latency.
+    """
+    transcriber = StreamingTranscriber(model, end_silence_ms=end_silence_ms)
+    started = time.perf_counter()
+    for frame in wav_chunks(path):
+        if realtime:
+            arrives = started + transcriber.transcript.audio_seconds + len(frame) / 2 / SAMPLE_RATE
+            time.sleep(max(0.0, arrives - time.perf_counter()))
+        if transcriber.feed(frame) is not None and transcriber.done:
+            break
+    transcript = transcriber.transcript
+    transcriber.finish()
+    speech_ended = started + transcript.speech_ended_at if transcript.speech_ended_at is not None else None
+    return transcript, speech_ended
+
+
+def first_token_seconds(text):
+    """Time to the first token of the model the chat routes this question to; the generation is then cancelled"""
+    from cancellation import GenerationCancelled, GenerationHandle
+    from llm_gateway import PRIORITY_INTERACTIVE, get_gateway
+    from model_router import classify_request
+    from ollama_client import generate
+
+    decision = classify_request("chat", text)
+    handle = GenerationHandle()
+    first = []
+
+    def on_token(_):
+        if not first:
+            first.append(time.perf_counter())
+            handle.cancel()
+
+    started = time.perf_counter()
+    try:
+        get_gateway().run(lambda: generate(decision.model, text, on_token=on_token, handle=handle),
+                          "voice-benchmark", PRIORITY_INTERACTIVE, handle=handle)
+    except GenerationCancelled:
+        pass
+    return decision.model, (first[0] - started if first else None), first[0] if first else None
+
+
+def run_file(path, model, args):
+    transcript, speech_ended = transcribe_file(path, model, args.end_silence_ms, args.realtime)
+    result = {
+        "file": os.path.basename(path),
+        "text": transcript.text,
+        "audio_seconds": round(transcript.audio_seconds, 2),
+        "decode_seconds": round(transcript.decode_seconds, 3),
+        "real_time_factor": round(transcript.real_time_factor or 0, 4),
+        "partials": transcript.partials,
+        "final_decode_ms": round(transcript.final_seconds * 1000, 1),
+        "wer": None,
+    }
+    # Audio time from the last voiced frame to the endpoint; None when the file ends first
+    if transcript.endpoint_at is not None and transcript.speech_ended_at is not None:
+        result["endpoint_delay_ms"] = round((transcript.endpoint_at - transcript.speech_ended_at) * 1000)
+    else:
+        result["endpoint_delay_ms"] = None
+    reference_path = os.path.splitext(path)[0] + ".txt"
+    if os.path.exists(reference_path):
+        with open(reference_path, encoding="utf-8") as f:
+            result["wer"] = word_error_rate(f.read(), transcript.text)
+
+    if args.no_llm or not transcript.text:
+        return result
+    llm_model, ttft, first_token_at = first_token_seconds(transcript.text)
+    result["llm_model"] = llm_model
+    result["ttft_ms"] = round(ttft * 1000) if ttft is not None else None
+    if ttft is None:
+        result["eos_to_first_token_ms"] = None
+    elif args.realtime and speech_ended is not None:
+        result["eos_to_first_token_ms"] = round((first_token_at - speech_ended) * 1000)
+    else:
+        # Offline feeding: the endpoint wait is audio time, the rest is measured
+        result["eos_to_first_token_ms"] = round((result["endpoint_delay_ms"] or 0)
+                                                + result["final_decode_ms"] + ttft * 1000)
+    return result
+
+
+def _median(results, field):
+    values = [r[field] for r in results if r.get(field) is not None]
+    return statistics.median(values) if values else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure offline voice input RTF and end-of-speech latency")
+    parser.add_argument("files", nargs="+", help="16-bit PCM WAV fixtures, one utterance each")
+    parser.add_argument("--model", default=VOSK_MODEL_PATH, help="Vosk model directory")
+    parser.add_argument("--end-silence-ms", type=int, default=VOICE_END_SILENCE_MS,
+                        help="trailing silence that ends an utterance")
+    parser.add_argument("--realtime", action="store_true", help="feed frames at speaking pace and measure wall clock")
+    parser.add_argument("--no-llm", action="store_true", help="skip the LLM call")
+    parser.add_argument("--json", action="store_true", help="print per-file results as JSON lines")
+    args = parser.parse_args()
+
+    import vosk
+    vosk.SetLogLevel(-1)
+    model = vosk.Model(args.model)
+
+    results = []
+    for path in args.files:
+        result = run_file(path, model, args)
+        results.append(result)
+        if args.json:
+            print(json.dumps(result))
+        else:
+            print(f"{result['file']}: {result['audio_seconds']:.1f}s audio, RTF {result['real_time_factor']:.3f}, "
+                  f"{result['partials']} partials, eos->first token {result.get('eos_to_first_token_ms')} ms"
+                  f"\n  \"{result['text']}\"")
+    if args.json:
+        return
+
+    mode = "realtime" if args.realtime else "offline"
+    print(f"\n{len(results)} files, {mode} feeding, {FRAME_MS} ms frames, {args.end_silence_ms} ms end silence")
+    for label, field, fmt in (("real-time factor", "real_time_factor", "{:.3f}"),
+                              ("endpoint delay", "endpoint_delay_ms", "{:.0f} ms"),
+                              ("final decode", "final_decode_ms", "{:.1f} ms"),
+                              ("LLM first token", "ttft_ms", "{:.0f} ms"),
+                              ("eos -> first token", "eos_to_first_token_ms", "{:.0f} ms"),
+                              ("word error rate", "wer", "{:.1%}")):
+        median = _median(results, field)
+        if median is not None:
+            print(f"  {label:<20} median {fmt.format(median)}")
+
+
+if __name__ == "__main__":
+    main()
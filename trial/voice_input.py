@@ -0,0 +1,305 @@
+# voice_input.py
+#
+# Offline voice input for the chat and diary panes. Audio is cut into short frames, an
+# energy-based voice activity detector finds where speech starts, and from there the
+# audio (plus a short pre-roll) is streamed into a Vosk recognizer on the CPU.
+#
+# Audio comes from the browser (st.audio_input, the default) or, for kiosk-style
+# deployments where the app runs on the user's machine, straight from the server's
+# microphone through PyAudio (VOICE_INPUT_SOURCE=microphone). A browser recording is
+# only uploaded once the user stops it, so the whole clip is transcribed, pauses and
+# all. The microphone is transcribed live: partial transcripts are shown while the
+# user speaks, and the transcript is returned as soon as VOICE_END_SILENCE_MS of
+# trailing silence marks the end of speech, so the LLM call starts right away.
+#
+# Needs `pip install vosk` and a model unpacked at VOSK_MODEL_PATH, e.g.
+# https://alphacephei.com/vosk/models/vosk-model-small-en-us-0.15.zip
+#
+# voice_benchmark.py measures the real-time factor and end-of-speech latency.
+
+import io
+import os
+import json
+import time
+import wave
+import hashlib
+import importlib.util
+import logging
+import threading
+import numpy as np
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+VOICE_INPUT_ENABLED = os.getenv("VOICE_INPUT_ENABLED", "true").lower() == "true"
+VOICE_INPUT_SOURCE = os.getenv("VOICE_INPUT_SOURCE", "browser")
+VOSK_MODEL_PATH = os.getenv("VOSK_MODEL_PATH", os.path.join("models", "vosk-model-small-en-us-0.15"))
+
+SAMPLE_RATE = 16000
+FRAME_MS = 30
+# Trailing silence that ends an utterance, and speech needed before one starts
+VOICE_END_SILENCE_MS = int(os.getenv("VOICE_END_SILENCE_MS", "700"))
+VOICE_SPEECH_START_MS = 90
+# Audio kept from before the detected start, so the first syllable isn't clipped
+VOICE_PREROLL_MS = 300
+VOICE_MAX_SECONDS = int(os.getenv("VOICE_MAX_SECONDS", "30"))
+# A frame is speech when it is this much louder than the tracked noise floor
+VAD_MARGIN_DB = 12.0
+VAD_MIN_SPEECH_DBFS = -50.0
+VAD_NOISE_FLOOR_DBFS = -60.0
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def voice_input_available():
+    """Whether voice input can be offered: enabled, vosk installed and a model on disk"""
+    return (VOICE_INPUT_ENABLED and os.path.isdir(VOSK_MODEL_PATH)
+            and importlib.util.find_spec("vosk") is not None)
+
+
+def get_model():
+    """The Vosk model, loaded once per process"""
+    global _model
+    with _model_lock:
+        if _model is None:
+            import vosk
+            vosk.SetLogLevel(-1)
+            _model = vosk.Model(VOSK_MODEL_PATH)
+        return _model
+
+
+def frame_bytes(frame_ms=FRAME_MS):
+    return SAMPLE_RATE * frame_ms // 1000 * 2
+
+
+def to_pcm16(samples, rate, channels):
+    """16 kHz mono 16-bit PCM from interleaved int16 samples at any rate and channel count"""
+    audio = np.frombuffer(samples, dtype=np.int16).astype(np.float32)
+    if channels > 1:
+        audio = audio.reshape(-1, channels).mean(axis=1)
+    if rate != SAMPLE_RATE and len(audio):
+        positions = np.arange(0, len(audio), rate / SAMPLE_RATE)
+        audio = np.interp(positions, np.arange(len(audio)), audio)
+    return np.clip(audio, -32768, 32767).astype(np.int16).tobytes()
+
+
+def wav_chunks(source, frame_ms=FRAME_MS):
+    """Frames of 16 kHz mono PCM from a WAV file path or file-like object"""
+    with wave.open(source, "rb") as wav:
+        if wav.getsampwidth() != 2:
+            raise ValueError("Only 16-bit PCM WAV audio is supported")
+        pcm = to_pcm16(wav.readframes(wav.getnframes()), wav.getframerate(), wav.getnchannels())
+    size = frame_bytes(frame_ms)
+    for start in range(0, len(pcm), size):
+        yield pcm[start:start + size]
+
+
+def microphone_chunks(frame_ms=FRAME_MS, max_seconds=VOICE_MAX_SECONDS):
+    """Frames of 16 kHz mono PCM from the default input device, for up to max_seconds"""
+    import pyaudio
+    frames_per_buffer = SAMPLE_RATE * frame_ms // 1000
+    audio = pyaudio.PyAudio()
+    stream = audio.open(format=pyaudio.paInt16, channels=1, rate=SAMPLE_RATE, input=True,
+                        frames_per_buffer=frames_per_buffer)
+    try:
+        for _ in range(max_seconds * 1000 // frame_ms):
+            yield stream.read(frames_per_buffer, exception_on_overflow=False)
+    finally:
+        stream.stop_stream()
+        stream.close()
+        audio.terminate()
+
+
+class EnergyVAD:
+    """Speech/non-speech decision per frame from its loudness against a tracked noise floor"""
+
+    def __init__(self, margin_db=VAD_MARGIN_DB, min_speech_dbfs=VAD_MIN_SPEECH_DBFS):
+        self.margin_db = margin_db
+        self.min_speech_dbfs = min_speech_dbfs
+        self.noise_floor = None
+
+    def is_speech(self, frame):
+        samples = np.frombuffer(frame, dtype=np.int16).astype(np.float32)
+        if not len(samples):
+            return False
+        rms = np.sqrt(np.mean(samples ** 2))
+        level = 20 * np.log10(max(rms, 1.0) / 32768)
+        if self.noise_floor is None:
+            self.noise_floor = max(level, VAD_NOISE_FLOOR_DBFS)
+        speech = level > self.min_speech_dbfs and level > self.noise_floor + self.margin_db
+        if not speech:
+            # Follow the background level down quickly and up slowly
+            rate = 0.5 if level < self.noise_floor else 0.05
+            self.noise_floor = max(VAD_NOISE_FLOOR_DBFS, self.noise_floor + rate * (level - self.noise_floor))
+        return speech
+
+
+class Transcript:
+    """Result of transcribing one utterance; times are seconds of audio unless noted"""
+
+    def __init__(self):
+        self.text = ""
+        self.partials = 0
+        self.audio_seconds = 0.0
+        self.speech_started_at = None
+        self.speech_ended_at = None
+        self.endpoint_at = None
+        # Wall clock spent in the recognizer, and in producing the final result alone
+        self.decode_seconds = 0.0
+        self.final_seconds = 0.0
+
+    @property
+    def real_time_factor(self):
+        return self.decode_seconds / self.audio_seconds if self.audio_seconds else None
+
+
+class StreamingTranscriber:
+    """Feeds frames through the VAD into the recognizer and reports partial and final text.
+
+    feed() returns ("partial", text) when the running hypothesis changes and
+    ("final", text) once end_silence_ms of silence follows the speech; frames after
+    that are ignored. With end_silence_ms=None there is no endpointing, for a complete
+    recording whose pauses are part of the utterance; call finish() after the last
+    frame. Silence before the speech never reaches the recognizer.
+    """
+
+    def __init__(self, model=None, frame_ms=FRAME_MS, end_silence_ms=VOICE_END_SILENCE_MS):
+        import vosk
+        self.recognizer = vosk.KaldiRecognizer(model or get_model(), SAMPLE_RATE)
+        self.frame_ms = frame_ms
+        self.end_frames = max(1, end_silence_ms // frame_ms) if end_silence_ms is not None else None
+        self.start_frames = max(1, VOICE_SPEECH_START_MS // frame_ms)
+        self.vad = EnergyVAD()
+        self.transcript = Transcript()
+        self.done = False
+        self._preroll = []
+        self._voiced_run = 0
+        self._silent_run = 0
+        self._in_speech = False
+        self._segments = []
+        self._partial = ""
+
+    def _accept(self, pcm):
+        started = time.perf_counter()
+        if self.recognizer.AcceptWaveform(pcm):
+            # The recognizer closed a segment at a pause of its own; the utterance goes on
+            self._segments.append(json.loads(self.recognizer.Result()).get("text", ""))
+            current = ""
+        else:
+            current = json.loads(self.recognizer.PartialResult()).get("partial", "")
+        self.transcript.decode_seconds += time.perf_counter() - started
+        partial = " ".join(part for part in self._segments + [current] if part)
+        if partial and partial != self._partial:
+            self._partial = partial
+            self.transcript.partials += 1
+            return "partial", partial
+        return None
+
+    def feed(self, frame):
+        if self.done:
+            return None
+        transcript = self.transcript
+        now = transcript.audio_seconds = transcript.audio_seconds + len(frame) / 2 / SAMPLE_RATE
+        speech = self.vad.is_speech(frame)
+
+        if not self._in_speech:
+            self._preroll.append(frame)
+            del self._preroll[:-max(1, VOICE_PREROLL_MS // self.frame_ms)]
+            self._voiced_run = self._voiced_run + 1 if speech else 0
+            if self._voiced_run < self.start_frames:
+                return None
+            self._in_speech = True
+            transcript.speech_started_at = now - self._voiced_run * self.frame_ms / 1000
+            transcript.speech_ended_at = now
+            pcm, self._preroll = b"".join(self._preroll), []
+            return self._accept(pcm)
+
+        if speech:
+            self._silent_run = 0
+            transcript.speech_ended_at = now
+        else:
+            self._silent_run += 1
+        event = self._accept(frame)
+        if self.end_frames is not None and self._silent_run >= self.end_frames:
+            transcript.endpoint_at = now
+            return "final", self.finish()
+        return event
+
+    def finish(self):
+        """Final text for the utterance so far (also when the audio ran out before the silence)"""
+        if not self.done:
+            self.done = True
+            if self._in_speech:
+                started = time.perf_counter()
+                self._segments.append(json.loads(self.recognizer.FinalResult()).get("text", ""))
+                self.transcript.text = " ".join(part for part in self._segments if part).strip()
+                self.transcript.final_seconds = time.perf_counter() - started
+                self.transcript.decode_seconds += self.transcript.final_seconds
+        return self.transcript.text
+
+
+def transcribe(chunks, on_partial=None, model=None, endpointing=True):
+    """Transcribe speech from a stream of frames; returns the Transcript.
+
+    With endpointing, only the first utterance is transcribed and the stream is closed
+    as soon as it ends (live audio). Without, every frame is transcribed (a complete recording).
+    """
+    transcriber = StreamingTranscriber(model, end_silence_ms=VOICE_END_SILENCE_MS if endpointing else None)
+    try:
+        for frame in chunks:
+            event = transcriber.feed(frame)
+            if event is None:
+                continue
+            kind, text = event
+            if kind == "final":
+                break
+            if on_partial:
+                on_partial(text)
+    finally:
+        # Closing the generator releases the microphone
+        if hasattr(chunks, "close"):
+            chunks.close()
+    transcript = transcriber.transcript
+    transcriber.finish()
+    logger.info(f"Transcribed {transcript.audio_seconds:.1f}s of audio at real-time factor "
+                f"{transcript.real_time_factor or 0:.3f}: {len(transcript.text)} characters")
+    return transcript
+
+
+def voice_prompt(key, label="🎤 Speak"):
+    """Voice input widget for a chat pane; returns the transcript of a finished recording or utterance, otherwise None"""
+    import streamlit as st
+    if not voice_input_available():
+        return None
+    status = st.empty()
+
+    def show_partial(text):
+        status.caption(f"🎤 {text} ▌")
+
+    if VOICE_INPUT_SOURCE == "microphone":
+        if not st.button(label, key=f"{key}_mic"):
+            return None
+        status.caption("🎤 Listening...")
+        transcript = transcribe(microphone_chunks(), show_partial)
+    else:
+        audio = st.audio_input(label, key=f"{key}_audio")
+        if audio is None:
+            return None
+        # The recording stays in the widget across reruns; each one is submitted once
+        digest = hashlib.sha256(audio.getvalue()).hexdigest()
+        if st.session_state.get(f"{key}_submitted") == digest:
+            return None
+        st.session_state[f"{key}_submitted"] = digest
+        # The recording is complete, so pauses in it don't end the entry and there is nothing live to show
+        status.caption("🎤 Transcribing...")
+        transcript = transcribe(wav_chunks(io.BytesIO(audio.getvalue())), endpointing=False)
+
+    status.empty()
+    if not transcript.text:
+        st.caption("🎤 No speech was recognized. Please try again.")
+        return None
+    return transcript.text